@@ -0,0 +1,67 @@
+ckan.module("pipeline-events", function ($, _) {
+  return {
+    options: {
+      url: "",
+    },
+
+    initialize: function () {
+      $.proxyAll(this, /_on/);
+      this.source = new EventSource(this.options.url);
+      this.source.addEventListener("log", this._onLog);
+      this.source.addEventListener("state", this._onState);
+      this.source.addEventListener("timeout", this._onTimeout);
+    },
+
+    teardown: function () {
+      this.source.close();
+    },
+
+    _onLog: function (event) {
+      const entry = JSON.parse(event.data);
+      const end = $("#pipeline-log-end");
+      if (!end.length) {
+        // First entries of a run: render the whole log
+        this.source.close();
+        window.location.reload();
+        return;
+      }
+
+      const item = $('<li class="item no-avatar"></li>');
+      item.append(
+        '<span class="fa-stack fa-lg">' +
+          '<i class="fa fa-circle fa-stack-2x icon text-info"></i>' +
+          '<i class="fa fa-info-circle fa-stack-1x fa-inverse"></i>' +
+          "</span>"
+      );
+      entry.message
+        .trim()
+        .split("\n")
+        .forEach(function (line) {
+          item.append(document.createTextNode(line), "<br />");
+        });
+      $('<span class="date"></span>')
+        .attr("title", entry.datetime)
+        .text(entry.datetime)
+        .appendTo(item);
+      item.insertBefore(end);
+    },
+
+    _onState: function (event) {
+      const status = JSON.parse(event.data);
+      if (status.terminal) {
+        // Final state: show the complete page, with the run summary
+        this.source.close();
+        window.location.reload();
+        return;
+      }
+      const state = status.state.charAt(0).toUpperCase() + status.state.slice(1);
+      $("#pipeline-state").text(state);
+    },
+
+    _onTimeout: function () {
+      // Do not reconnect: the reloaded page only follows runs in progress
+      this.source.close();
+      window.location.reload();
+    },
+  };
+});
@@ -1,19 +1,289 @@
+// Scripts and stylesheets loaded on demand, shared by all the modules
+const preflowAssets = {};
 
+function loadPreflowAssets(urls) {
+  return Promise.all(
+    (urls || []).map(function (url) {
+      if (!preflowAssets[url]) {
+        preflowAssets[url] = new Promise(function (resolve, reject) {
+          const css = /\.css(\?|$)/.test(url);
+          const element = document.createElement(css ? "link" : "script");
+          if (css) {
+            element.rel = "stylesheet";
+            element.href = url;
+          } else {
+            element.src = url;
+            element.async = false;
+          }
+          element.onload = resolve;
+          element.onerror = function () {
+            delete preflowAssets[url];
+            reject(new Error("Failed to load " + url));
+          };
+          document.head.appendChild(element);
+        });
+      }
+      return preflowAssets[url];
+    })
+  );
+}
 
 ckan.module("validation-report", function ($, _) {
   return {
     options: {
       report: {},
+      url: "",
+      assets: [],
+      lazy: false,
     },
 
     initialize: function () {
-      const element = this.el[0]
-      const reportJson = this.options.report
-      frictionlessComponents.render(
-        frictionlessComponents.Report,
-        { report: reportJson },
-        element
+      $.proxyAll(this, /_on/);
+      if (this.options.lazy) {
+        this.el.find("button").on("click", this._onShow);
+        return;
+      }
+      this._show();
+    },
+
+    _onShow: function (event) {
+      $(event.currentTarget)
+        .prop("disabled", true)
+        .prepend('<i class="fa fa-spinner fa-spin"></i> ');
+      this._show();
+    },
+
+    // Load the report component, then the report, then render it
+    _show: async function () {
+      const element = this.el[0];
+      try {
+        await loadPreflowAssets(this.options.assets);
+        const report = this.options.url ? await this._load() : this.options.report;
+        $(element).empty();
+        frictionlessComponents.render(
+          frictionlessComponents.Report,
+          { report: report },
+          element
+        );
+      } catch (error) {
+        $(element).html(
+          $('<div class="alert alert-warning"></div>').text(
+            this._("The validation report could not be loaded.")
+          )
+        );
+      }
+    },
+
+    _get: function (params) {
+      const url = new URL(this.options.url, window.location.origin);
+      Object.keys(params).forEach(function (key) {
+        url.searchParams.set(key, params[key]);
+      });
+      return fetch(url).then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.statusText);
+        }
+        return response.json();
+      });
+    },
+
+    // Fetch the report header, then the error pages of each task
+    _load: async function () {
+      const report = await this._get({});
+      for (let task = 0; task < report.tasks.length; task++) {
+        report.tasks[task].errors = [];
+        for (let page = 0; page < report.pages[task]; page++) {
+          const part = await this._get({ task: task, page: page });
+          report.tasks[task].errors.push(...part.errors);
+        }
+      }
+      delete report.pages;
+      return report;
+    },
+  };
+});
+
+ckan.module("validation-errors", function ($, _) {
+  return {
+    options: {
+      url: "",
+      tasks: [],
+      types: [],
+      rowHeight: 32,
+      pageSize: 200,
+    },
+
+    initialize: function () {
+      $.proxyAll(this, /_on/);
+      this.errors = [];
+      this.next = null;
+      this.loading = false;
+      this.filters = {};
+      this.last = { start: -1, end: -1 };
+
+      this._buildFilters();
+      this.viewport = $('<div class="validation-errors-viewport"></div>')
+        .css({ height: "600px", overflowY: "auto", position: "relative" })
+        .appendTo(this.el);
+      this.spacer = $("<div></div>")
+        .css({ position: "relative" })
+        .appendTo(this.viewport);
+      this.viewport.on("scroll", this._onScroll);
+
+      this._reset();
+    },
+
+    _buildFilters: function () {
+      const form = $('<form class="row g-2 mb-3"></form>');
+      const task = $('<select class="form-select" name="task"></select>').append(
+        $('<option value=""></option>').text(this._("All tables"))
+      );
+      this.options.tasks.forEach(function (name, index) {
+        task.append($("<option></option>").val(index).text(name || index + 1));
+      });
+      const type = $('<select class="form-select" name="type"></select>').append(
+        $('<option value=""></option>').text(this._("All error types"))
       );
+      this.options.types.forEach(function (name) {
+        type.append($("<option></option>").val(name).text(name));
+      });
+      const rowFrom = $(
+        '<input class="form-control" type="number" min="1" name="row_from">'
+      ).attr("placeholder", this._("From row"));
+      const rowTo = $(
+        '<input class="form-control" type="number" min="1" name="row_to">'
+      ).attr("placeholder", this._("To row"));
+      const submit = $('<button class="btn btn-secondary" type="submit"></button>').text(
+        this._("Filter")
+      );
+
+      [task, type, rowFrom, rowTo, submit].forEach(function (input) {
+        $('<div class="col-auto"></div>').append(input).appendTo(form);
+      });
+      form.on("submit", this._onFilter);
+      this.el.append(form);
+    },
+
+    _onFilter: function (event) {
+      event.preventDefault();
+      const filters = {};
+      $(event.target)
+        .serializeArray()
+        .forEach(function (field) {
+          if (field.value !== "") {
+            filters[field.name] = field.value;
+          }
+        });
+      this.filters = filters;
+      this._reset();
+    },
+
+    _reset: function () {
+      this.errors = [];
+      this.next = null;
+      this.done = false;
+      this.last = { start: -1, end: -1 };
+      this.viewport.scrollTop(0);
+      this.spacer.empty();
+      this._fetch();
+    },
+
+    _fetch: function () {
+      if (this.loading || this.done) {
+        return;
+      }
+      this.loading = true;
+      const url = new URL(this.options.url, window.location.origin);
+      const params = Object.assign({ limit: this.options.pageSize }, this.filters);
+      if (this.next) {
+        params.cursor = this.next;
+      }
+      Object.keys(params).forEach(function (key) {
+        url.searchParams.set(key, params[key]);
+      });
+      const filters = this.filters;
+      fetch(url)
+        .then(function (response) {
+          return response.json();
+        })
+        .then(
+          function (data) {
+            if (filters !== this.filters) {
+              return;
+            }
+            this.errors.push(...(data.errors || []));
+            this.next = data.next;
+            this.done = !data.next;
+            this.last = { start: -1, end: -1 };
+            this._render();
+          }.bind(this)
+        )
+        .finally(
+          function () {
+            this.loading = false;
+            // The filters changed while the page was loading
+            if (filters !== this.filters) {
+              this._fetch();
+            }
+          }.bind(this)
+        );
+    },
+
+    _onScroll: function () {
+      this._render();
+    },
+
+    // Only the rows in view, plus a margin, are in the DOM
+    _render: function () {
+      const height = this.options.rowHeight;
+      const top = this.viewport.scrollTop();
+      const visible = Math.ceil(this.viewport.height() / height);
+      const start = Math.max(0, Math.floor(top / height) - visible);
+      const end = Math.min(this.errors.length, start + visible * 3);
+
+      this.spacer.css("height", this.errors.length * height + "px");
+      if (!this.errors.length && this.done) {
+        this.spacer.html(
+          $('<p class="text-muted p-2"></p>').text(this._("No errors found."))
+        );
+        return;
+      }
+      if (start !== this.last.start || end !== this.last.end) {
+        const rows = [];
+        for (let i = start; i < end; i++) {
+          rows.push(this._row(this.errors[i], i));
+        }
+        this.spacer.empty().append(rows);
+        this.last = { start: start, end: end };
+      }
+
+      if (end >= this.errors.length - visible) {
+        this._fetch();
+      }
+    },
+
+    _row: function (error, index) {
+      const row = error.rowNumber || error.rowPosition || error["row-number"];
+      const task = this.options.tasks[error.task] || "";
+      return $('<div class="validation-error border-bottom px-2 text-truncate"></div>')
+        .css({
+          position: "absolute",
+          top: index * this.options.rowHeight + "px",
+          height: this.options.rowHeight + "px",
+          lineHeight: this.options.rowHeight + "px",
+          left: 0,
+          right: 0,
+        })
+        .attr("title", error.message || "")
+        .append(
+          $('<span class="badge bg-danger me-2"></span>').text(
+            error.type || error.code || ""
+          ),
+          $('<span class="text-muted me-2"></span>').text(
+            [task, row ? this._("row") + " " + row : ""].filter(Boolean).join(" · ")
+          ),
+          document.createTextNode(error.message || "")
+        );
     },
   };
 });
@@ -0,0 +1,197 @@
+from typing import Any, Callable, Iterator, Optional
+
+import contextlib
+import datetime
+import math
+import subprocess
+import time
+
+from sqlalchemy import event
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+
+from ckanext.preflow import prefect
+from ckanext.preflow.benchmark.fake_prefect import FakePrefect
+
+# Settings overridden while the benchmark runs, so that every submission
+# reaches the fake Prefect API synchronously and nothing else is contacted
+BENCHMARK_CONFIG = {
+    "ckanext.preflow.async_submit": "false",
+    "ckanext.preflow.scheduler": "false",
+    "ckanext.preflow.debounce_seconds": "0",
+    "ckanext.preflow.waiting_seconds": "0",
+    "ckanext.preflow.fingerprint_probe": "false",
+    "ckanext.preflow.cache_backend": "none",
+    "ckanext.preflow.prefect_deployment_id": "benchmark-deployment",
+    "ckanext.preflow.routes": "",
+    "ckanext.preflow.heavy_deployment_id": "",
+}
+
+
+def percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(int(math.ceil(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[index]
+
+
+@contextlib.contextmanager
+def count_queries() -> Iterator[list[int]]:
+    """
+    Count the SQL statements sent to the database within the block.
+    """
+    counter = [0]
+
+    def before_cursor_execute(*args: Any) -> None:
+        counter[0] += 1
+
+    engine = model.meta.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@contextlib.contextmanager
+def fake_prefect(
+    latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0
+) -> Iterator[FakePrefect]:
+    """
+    Run a fake Prefect API and point the extension to it within the block.
+    """
+    overrides = dict(BENCHMARK_CONFIG)
+    with FakePrefect(latency, jitter, failure_rate) as fake:
+        overrides["ckanext.preflow.prefect_api_url"] = fake.api_url
+        previous = {key: tk.config.get(key) for key in overrides}
+        tk.config.update(overrides)
+        prefect._client = None
+        try:
+            yield fake
+        finally:
+            for key, value in previous.items():
+                if value is None:
+                    tk.config.pop(key, None)
+                else:
+                    tk.config[key] = value
+            prefect._client = None
+
+
+class Benchmark(object):
+    """
+    Collect the latency, SQL query and Prefect call counts of the runs of
+    each scenario.
+    """
+
+    def __init__(self, fake: FakePrefect, iterations: int):
+        self.fake = fake
+        self.iterations = iterations
+        self.results: dict[str, dict[str, Any]] = {}
+
+    def measure(
+        self,
+        name: str,
+        func: Callable[[int], Any],
+        setup: Optional[Callable[[int], Any]] = None,
+        iterations: Optional[int] = None,
+    ) -> dict[str, Any]:
+        durations, queries, calls = [], [], []
+        for i in range(iterations or self.iterations):
+            if setup:
+                setup(i)
+            model.Session.remove()
+            self.fake.reset_calls()
+            with count_queries() as counter:
+                started = time.perf_counter()
+                func(i)
+                durations.append(time.perf_counter() - started)
+            queries.append(counter[0])
+            calls.append(sum(self.fake.calls.values()))
+
+        result = {
+            "runs": len(durations),
+            "mean_ms": round(sum(durations) / len(durations) * 1000, 3),
+            "p50_ms": round(percentile(durations, 50) * 1000, 3),
+            "p90_ms": round(percentile(durations, 90) * 1000, 3),
+            "p99_ms": round(percentile(durations, 99) * 1000, 3),
+            "max_ms": round(max(durations) * 1000, 3),
+            "queries": round(sum(queries) / len(queries), 2),
+            "http_calls": round(sum(calls) / len(calls), 2),
+        }
+        self.results[name] = result
+        return result
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=__file__.rsplit("/ckanext/", 1)[0],
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run(
+    scenarios: list[str],
+    iterations: int = 20,
+    resources: int = 50,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    failure_rate: float = 0.0,
+    report_errors: int = 10000,
+) -> dict[str, Any]:
+    """
+    Run the benchmark scenarios against a fake Prefect API, on fixtures
+    created for the occasion and purged afterwards.
+    """
+    from ckanext.preflow.benchmark import scenarios as available
+
+    with fake_prefect(latency, jitter, failure_rate) as fake:
+        bench = Benchmark(fake, iterations)
+        fixture = available.Fixture.create(resources)
+        try:
+            for name in scenarios:
+                available.SCENARIOS[name](bench, fixture, report_errors=report_errors)
+        finally:
+            fixture.purge()
+
+    return {
+        "commit": commit(),
+        "created": datetime.datetime.utcnow().isoformat(),
+        "options": {
+            "iterations": iterations,
+            "resources": resources,
+            "latency": latency,
+            "jitter": jitter,
+            "failure_rate": failure_rate,
+            "report_errors": report_errors,
+        },
+        "scenarios": bench.results,
+    }
+
+
+def compare(
+    baseline: dict[str, Any], current: dict[str, Any], threshold: float = 0.2
+) -> list[tuple[str, str, float, float]]:
+    """
+    Return the ``(scenario, metric, baseline, current)`` of the p50
+    latencies, query and Prefect call counts that grew by more than
+    ``threshold``.
+    """
+    regressions = []
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        for metric in ("p50_ms", "queries", "http_calls"):
+            if result[metric] > before[metric] * (1 + threshold) and (
+                metric != "p50_ms" or result[metric] - before[metric] > 1
+            ):
+                regressions.append((name, metric, before[metric], result[metric]))
+    return regressions
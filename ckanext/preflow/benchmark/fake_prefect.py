@@ -0,0 +1,171 @@
+from typing import Any, Optional
+
+import collections
+import datetime
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_CREATE = re.compile(r"^/api/deployments/([^/]+)/create_flow_run$")
+_FLOW_RUN = re.compile(r"^/api/flow_runs/([0-9a-f-]+)$")
+_SET_STATE = re.compile(r"^/api/flow_runs/([0-9a-f-]+)/set_state$")
+
+
+class FakePrefect(object):
+    """
+    In-process stand-in for the parts of the Prefect API used by the
+    extension, with configurable latency and failure injection.
+
+    :param latency: Seconds added to every response.
+    :param jitter: Random extra seconds, up to this value, added to every
+        response.
+    :param failure_rate: Share of the requests answered with a 503.
+    """
+
+    def __init__(
+        self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.flow_runs: dict[str, dict[str, Any]] = {}
+        self.calls: collections.Counter = collections.Counter()
+        self.lock = threading.Lock()
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def api_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def start(self) -> "FakePrefect":
+        fake = self
+
+        class Handler(_Handler):
+            prefect = fake
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self) -> "FakePrefect":
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def reset_calls(self) -> None:
+        with self.lock:
+            self.calls.clear()
+
+    def set_state(self, flow_run_id: str, state_type: str, message: str = "") -> None:
+        with self.lock:
+            run = self.flow_runs[flow_run_id]
+            run["state"] = _state(state_type, message)
+            run["state_type"] = state_type
+
+    def create_flow_run(self, deployment_id: str, payload: dict[str, Any]) -> dict:
+        flow_run_id = str(uuid.uuid4())
+        run = {
+            "id": flow_run_id,
+            "name": f"benchmark-{flow_run_id[:8]}",
+            "deployment_id": deployment_id,
+            "parameters": payload.get("parameters", {}),
+            "tags": payload.get("tags", []),
+            "work_queue_name": payload.get("work_queue_name"),
+            "created": _now(),
+            "state": _state("SCHEDULED"),
+            "state_type": "SCHEDULED",
+        }
+        with self.lock:
+            self.flow_runs[flow_run_id] = run
+        return run
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _state(state_type: str, message: str = "") -> dict[str, Any]:
+    return {
+        "type": state_type,
+        "name": state_type.capitalize(),
+        "message": message,
+        "timestamp": _now(),
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    prefect: FakePrefect
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _reply(self, status: int, body: Any = None) -> None:
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _handle(self, method: str) -> None:
+        prefect = self.prefect
+        endpoint = re.sub(r"[0-9a-f]{8}-[0-9a-f-]{27}", "{id}", self.path)
+        with prefect.lock:
+            prefect.calls[f"{method} {endpoint}"] += 1
+
+        time.sleep(prefect.latency + random.uniform(0, prefect.jitter))
+        if prefect.failure_rate and random.random() < prefect.failure_rate:
+            return self._reply(503, {"detail": "Injected failure"})
+
+        match = _CREATE.match(self.path)
+        if method == "POST" and match:
+            return self._reply(201, prefect.create_flow_run(match[1], self._body()))
+
+        if method == "POST" and self.path == "/api/flow_runs/filter":
+            body = self._body()
+            ids = body.get("flow_runs", {}).get("id", {}).get("any_", [])
+            with prefect.lock:
+                runs = [prefect.flow_runs[i] for i in ids if i in prefect.flow_runs]
+            return self._reply(200, runs[: body.get("limit", 200)])
+
+        match = _SET_STATE.match(self.path)
+        if method == "POST" and match:
+            if match[1] not in prefect.flow_runs:
+                return self._reply(404, {"detail": "Flow run not found"})
+            state = self._body().get("state", {})
+            prefect.set_state(match[1], state.get("type", ""), state.get("message", ""))
+            return self._reply(201, {"status": "ACCEPT"})
+
+        match = _FLOW_RUN.match(self.path)
+        if method == "GET" and match:
+            run = prefect.flow_runs.get(match[1])
+            if run is None:
+                return self._reply(404, {"detail": "Flow run not found"})
+            return self._reply(200, run)
+
+        self._reply(404, {"detail": "Not found"})
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
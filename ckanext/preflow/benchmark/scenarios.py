@@ -0,0 +1,239 @@
+from typing import Any, Callable
+
+import uuid
+
+from flask import current_app
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+
+from ckanext.preflow import helpers
+from ckanext.preflow.benchmark import Benchmark
+from ckanext.preflow.model import (
+    PreflowLog,
+    PreflowQueue,
+    PreflowReport,
+    PreflowRun,
+)
+
+PREFIX = "preflow-benchmark"
+
+
+class Fixture(object):
+    """
+    An organization and a dataset of CSV resources created for a benchmark
+    run, with an API token of the site user.
+    """
+
+    def __init__(
+        self,
+        context: dict[str, Any],
+        organization: dict[str, Any],
+        dataset: dict[str, Any],
+        token: dict[str, Any],
+    ):
+        self.context = context
+        self.organization = organization
+        self.dataset = dataset
+        self.resources = dataset["resources"]
+        self.token = token
+
+    @classmethod
+    def create(cls, resources: int) -> "Fixture":
+        site_user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
+        context = {
+            "model": model,
+            "session": model.Session,
+            "ignore_auth": True,
+            "user": site_user["name"],
+        }
+        name = f"{PREFIX}-{uuid.uuid4().hex[:8]}"
+        organization = tk.get_action("organization_create")(
+            dict(context), {"name": name}
+        )
+        dataset = tk.get_action("package_create")(
+            dict(context),
+            {
+                "name": name,
+                "owner_org": organization["id"],
+                "resources": [
+                    {
+                        "name": f"Resource {i}",
+                        "url": f"http://example.com/{name}/data-{i}.csv",
+                        "format": "CSV",
+                    }
+                    for i in range(resources)
+                ],
+            },
+        )
+        token = tk.get_action("api_token_create")(
+            dict(context), {"user": site_user["name"], "name": name}
+        )
+        return cls(context, organization, dataset, token)
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {"Authorization": self.token["token"]}
+
+    def action(self, name: str, data_dict: dict[str, Any]) -> Any:
+        return tk.get_action(name)(dict(self.context), data_dict)
+
+    def purge(self) -> None:
+        model.Session.rollback()
+        resource_ids = [res["id"] for res in self.resources]
+        for table, column in [
+            (PreflowLog, PreflowLog.resource_id),
+            (PreflowReport, PreflowReport.resource_id),
+            (PreflowRun, PreflowRun.resource_id),
+            (PreflowQueue, PreflowQueue.resource_id),
+            (model.TaskStatus, model.TaskStatus.entity_id),
+        ]:
+            model.Session.query(table).filter(column.in_(resource_ids)).delete(
+                synchronize_session=False
+            )
+        model.Session.commit()
+        for token in model.Session.query(model.ApiToken).filter(
+            model.ApiToken.name == self.dataset["name"]
+        ):
+            model.Session.delete(token)
+        model.Session.commit()
+        self.action("dataset_purge", {"id": self.dataset["id"]})
+        self.action("organization_purge", {"id": self.organization["id"]})
+
+
+def _get(fixture: Fixture, url: str) -> None:
+    response = current_app.test_client().get(url, headers=fixture.headers)
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {url} returned {response.status_code}")
+
+
+def _complete_all(fixture: Fixture) -> Callable[[int], None]:
+    def setup(i: int) -> None:
+        fixture.action(
+            "preflow_status_update_batch",
+            {
+                "events": [
+                    {"resource_id": res["id"], "state": "completed"}
+                    for res in fixture.resources
+                ]
+            },
+        )
+
+    return setup
+
+
+def dataset_page(bench: Benchmark, fixture: Fixture, **kwargs: Any) -> None:
+    """
+    Dataset page with a pipeline badge per resource, and the badge helper
+    alone.
+    """
+    fixture.action(
+        "preflow_submit_bulk", {"package_id": fixture.dataset["id"], "force": True}
+    )
+    bench.measure(
+        "dataset_page", lambda i: _get(fixture, f"/dataset/{fixture.dataset['name']}")
+    )
+
+    def badges(i: int) -> None:
+        with current_app.test_request_context():
+            for res in fixture.resources:
+                helpers.get_preflow_badge(res["id"], fixture.dataset["id"])
+
+    bench.measure("badge_helper", badges)
+
+
+def status_updates(bench: Benchmark, fixture: Fixture, **kwargs: Any) -> None:
+    """
+    Bursts of flow callbacks with growing log messages, one by one and
+    batched.
+    """
+    resource_id = fixture.resources[0]["id"]
+    for size in (100, 10000, 100000):
+        message = "x" * size
+        bench.measure(
+            f"status_update_{size}b",
+            lambda i: fixture.action(
+                "preflow_status_update",
+                {"resource_id": resource_id, "message": f"{i} {message}"},
+            ),
+        )
+
+    bench.measure(
+        "status_update_batch_100",
+        lambda i: fixture.action(
+            "preflow_status_update_batch",
+            {
+                "events": [
+                    {"resource_id": resource_id, "message": f"{i}.{j} {'x' * 100}"}
+                    for j in range(100)
+                ]
+            },
+        ),
+    )
+
+
+def bulk_submit(bench: Benchmark, fixture: Fixture, **kwargs: Any) -> None:
+    """
+    Bulk submission of all the dataset resources.
+    """
+    bench.measure(
+        "bulk_submit",
+        lambda i: fixture.action(
+            "preflow_submit_bulk", {"package_id": fixture.dataset["id"], "force": True}
+        ),
+        setup=_complete_all(fixture),
+    )
+
+
+def validation_report(
+    bench: Benchmark, fixture: Fixture, report_errors: int = 10000, **kwargs: Any
+) -> None:
+    """
+    Storage of a large validation report, and rendering of its page and of
+    a page of its errors.
+    """
+    resource = fixture.resources[-1]
+    report = {
+        "valid": False,
+        "tasks": [
+            {
+                "name": "data.csv",
+                "valid": False,
+                "errors": [
+                    {
+                        "type": "type-error" if i % 2 else "missing-cell",
+                        "rowNumber": i + 2,
+                        "message": f"Error {i}",
+                    }
+                    for i in range(report_errors)
+                ],
+            }
+        ],
+    }
+    bench.measure(
+        "validation_report_store",
+        lambda i: fixture.action(
+            "preflow_status_update",
+            {
+                "resource_id": resource["id"],
+                "state": "completed",
+                "validation_report": report,
+            },
+        ),
+        iterations=max(bench.iterations // 4, 1),
+    )
+
+    base = f"/dataset/{fixture.dataset['name']}/{resource['id']}/validation_report"
+    bench.measure("validation_report_page", lambda i: _get(fixture, base))
+    bench.measure(
+        "validation_error_list",
+        lambda i: _get(fixture, f"{base}/errors?type=type-error&row_from=5000&limit=200"),
+    )
+
+
+SCENARIOS = {
+    "dataset_page": dataset_page,
+    "status_updates": status_updates,
+    "bulk_submit": bulk_submit,
+    "validation_report": validation_report,
+}
@@ -0,0 +1,185 @@
+from typing import Any, Optional
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import ckan.plugins.toolkit as tk
+
+log = logging.getLogger(__name__)
+
+# Prefect flow run state types that will not change anymore
+TERMINAL_STATES = ["completed", "failed", "cancelled", "crashed"]
+
+# Pipeline states of runs that are waiting to start or running
+IN_FLIGHT_STATES = ["pending", "scheduled", "running"]
+
+DEFAULT_TTL = 10
+DEFAULT_TERMINAL_TTL = 86400
+DEFAULT_SIZE = 1024
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class MemoryCache(object):
+    """
+    In-process LRU cache with optional per-entry expiration.
+    """
+
+    def __init__(self, size: int = DEFAULT_SIZE):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisCache(object):
+    """
+    Cache shared by all the CKAN processes, stored in the CKAN Redis.
+    """
+
+    prefix = "ckanext-preflow:flow_run:"
+
+    def __init__(self, connection):
+        self.redis = connection
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.redis.get(self.prefix + key)
+        return json.loads(value) if value else None
+
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        if not keys:
+            return {}
+        values = self.redis.mget([self.prefix + key for key in keys])
+        return {key: json.loads(value) for key, value in zip(keys, values) if value}
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        self.redis.set(self.prefix + key, json.dumps(value), ex=ttl or None)
+
+    def delete(self, key: str) -> None:
+        self.redis.delete(self.prefix + key)
+
+
+def _create_cache():
+    backend = tk.config.get("ckanext.preflow.cache_backend", "auto").lower()
+
+    if backend in ("auto", "redis") and tk.config.get("ckan.redis.url"):
+        from ckan.lib.redis import connect_to_redis
+
+        try:
+            connection = connect_to_redis()
+            connection.ping()
+            return RedisCache(connection)
+        except Exception as e:
+            log.warning("Redis is not available for the Preflow cache: %s", e)
+
+    size = tk.asint(tk.config.get("ckanext.preflow.cache_size", DEFAULT_SIZE))
+    return MemoryCache(size)
+
+
+def get_cache():
+    """
+    Return the flow run cache, creating it on first use.
+
+    The backend is chosen with ``ckanext.preflow.cache_backend``: ``auto``
+    (the default) uses the CKAN Redis when one is configured and the
+    in-process LRU cache otherwise, ``redis`` and ``memory`` force a backend
+    and ``none`` disables caching.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = _create_cache()
+    return _cache
+
+
+def is_enabled() -> bool:
+    return tk.config.get("ckanext.preflow.cache_backend", "auto").lower() != "none"
+
+
+def get_flow_run(flow_run_id: str) -> Optional[dict[str, Any]]:
+    if not flow_run_id or not is_enabled():
+        return None
+    try:
+        return get_cache().get(flow_run_id)
+    except Exception as e:
+        log.warning("Failed to read the Preflow cache: %s", e)
+        return None
+
+
+def get_flow_runs(flow_run_ids: list[str]) -> dict[str, dict[str, Any]]:
+    if not flow_run_ids or not is_enabled():
+        return {}
+    try:
+        return get_cache().get_many(flow_run_ids)
+    except Exception as e:
+        log.warning("Failed to read the Preflow cache: %s", e)
+        return {}
+
+
+def set_flow_run(flow_run_id: str, flow_run: dict[str, Any]) -> None:
+    """
+    Cache a Prefect flow run. Runs in a terminal state expire after
+    ``ckanext.preflow.cache_terminal_ttl`` seconds, a day by default, the
+    others after ``ckanext.preflow.cache_ttl`` seconds.
+    """
+    if not flow_run_id or not is_enabled():
+        return
+
+    state = (flow_run.get("state") or {}).get("type") or ""
+    if state.lower() in TERMINAL_STATES:
+        ttl = tk.asint(
+            tk.config.get("ckanext.preflow.cache_terminal_ttl", DEFAULT_TERMINAL_TTL)
+        )
+    else:
+        ttl = tk.asint(tk.config.get("ckanext.preflow.cache_ttl", DEFAULT_TTL))
+    if ttl <= 0:
+        return
+    try:
+        get_cache().set(flow_run_id, flow_run, ttl)
+    except Exception as e:
+        log.warning("Failed to write the Preflow cache: %s", e)
+
+
+def invalidate_flow_run(flow_run_id: str) -> None:
+    if not flow_run_id or not is_enabled():
+        return
+    try:
+        get_cache().delete(flow_run_id)
+    except Exception as e:
+        log.warning("Failed to invalidate the Preflow cache: %s", e)
@@ -0,0 +1,202 @@
+import json
+
+import click
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+
+from ckanext.preflow import jobs
+
+
+def _context():
+    site_user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
+    return {
+        "model": model,
+        "session": model.Session,
+        "ignore_auth": True,
+        "user": site_user["name"],
+        "preflow_probe": True,
+    }
+
+
+@click.group(short_help="Preflow commands")
+def preflow():
+    pass
+
+
+@preflow.command()
+@click.option("-d", "--dataset", help="ID or name of a dataset")
+@click.option("-o", "--organization", help="ID or name of an organization")
+@click.option("-q", "--query", help="Dataset search query")
+@click.option(
+    "-c",
+    "--concurrency",
+    type=int,
+    help="Maximum number of simultaneous Prefect requests",
+)
+@click.option("-b", "--batch-size", type=int, default=50, show_default=True)
+@click.option("-f", "--force", is_flag=True, help="Submit unchanged resources too")
+def submit(dataset, organization, query, concurrency, batch_size, force):
+    """Submit the resources of a dataset, organization or search to Prefect."""
+    if not any([dataset, organization, query]):
+        tk.error_shout("One of --dataset, --organization or --query is required")
+        raise click.Abort()
+
+    try:
+        report = tk.get_action("preflow_submit_bulk")(
+            _context(),
+            {
+                "package_id": dataset,
+                "owner_org": organization,
+                "q": query,
+                "concurrency": concurrency,
+                "batch_size": batch_size,
+                "force": force,
+            },
+        )
+    except (tk.ObjectNotFound, tk.ValidationError) as e:
+        tk.error_shout(e)
+        raise click.Abort()
+
+    for resource_id, error in report["errors"].items():
+        click.secho(f"{resource_id}: {error}", fg="red")
+    click.secho(
+        f"{report['submitted']} submitted, {report['skipped']} in progress, "
+        f"{report['unchanged']} unchanged, {report['failed']} failed out of {report['total']} resources "
+        f"in {report['elapsed']}s ({report['throughput']}/s)",
+        fg="red" if report["failed"] else "green",
+    )
+
+
+@preflow.command()
+@click.option(
+    "-e", "--enqueue", is_flag=True, help="Run in a background job instead"
+)
+def reconcile(enqueue):
+    """Synchronise the pipelines in progress with their Prefect flow runs."""
+    if enqueue:
+        jobs.enqueue_reconcile()
+        click.secho("Reconciliation job queued", fg="green")
+        return
+
+    try:
+        result = tk.get_action("preflow_reconcile")(_context(), {})
+    except tk.ValidationError as e:
+        tk.error_shout(e)
+        raise click.Abort()
+    click.secho(
+        f"{result['checked']} checked, {result['updated']} updated, "
+        f"{result['missing']} missing, {result['stale']} stale",
+        fg="green",
+    )
+
+
+@preflow.command()
+@click.option(
+    "-e", "--enqueue", is_flag=True, help="Run in a background job instead"
+)
+def dispatch(enqueue):
+    """Submit queued resources while the scheduler limits allow it."""
+    if enqueue:
+        jobs.enqueue_dispatch()
+        click.secho("Dispatch job queued", fg="green")
+        return
+
+    result = tk.get_action("preflow_dispatch")(_context(), {})
+    click.secho(
+        f"{result['submitted']} submitted, {result['dropped']} dropped, "
+        f"{result['queued']} still queued",
+        fg="green",
+    )
+
+
+@preflow.command()
+@click.option(
+    "-s",
+    "--scenario",
+    "scenarios",
+    multiple=True,
+    type=click.Choice(
+        ["dataset_page", "status_updates", "bulk_submit", "validation_report"]
+    ),
+    help="Scenario to run, all of them by default",
+)
+@click.option("-i", "--iterations", type=int, default=20, show_default=True)
+@click.option("-r", "--resources", type=int, default=50, show_default=True)
+@click.option(
+    "-l", "--latency", type=float, default=0.0, help="Prefect latency in seconds"
+)
+@click.option("--jitter", type=float, default=0.0, help="Extra random latency")
+@click.option(
+    "--failure-rate", type=float, default=0.0, help="Share of failed Prefect calls"
+)
+@click.option("--report-errors", type=int, default=10000, show_default=True)
+@click.option("-o", "--output", type=click.Path(), help="Write the results as JSON")
+@click.option(
+    "-c",
+    "--compare",
+    type=click.Path(exists=True),
+    help="Results of a previous run to compare with",
+)
+@click.option(
+    "-t",
+    "--threshold",
+    type=float,
+    default=20,
+    show_default=True,
+    help="Regression threshold in percent",
+)
+def benchmark(
+    scenarios,
+    iterations,
+    resources,
+    latency,
+    jitter,
+    failure_rate,
+    report_errors,
+    output,
+    compare,
+    threshold,
+):
+    """Measure the extension against a fake Prefect API.
+
+    Test datasets are created and purged, run it on a development database.
+    """
+    from ckanext.preflow import benchmark as bench
+    from ckanext.preflow.benchmark.scenarios import SCENARIOS
+
+    results = bench.run(
+        list(scenarios) or list(SCENARIOS),
+        iterations=iterations,
+        resources=resources,
+        latency=latency,
+        jitter=jitter,
+        failure_rate=failure_rate,
+        report_errors=report_errors,
+    )
+
+    click.echo(
+        f"{'scenario':<28}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"
+        f"{'queries':>10}{'http':>8}"
+    )
+    for name, result in results["scenarios"].items():
+        click.echo(
+            f"{name:<28}{result['p50_ms']:>10}{result['p90_ms']:>10}"
+            f"{result['p99_ms']:>10}{result['queries']:>10}{result['http_calls']:>8}"
+        )
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)
+        regressions = bench.compare(baseline, results, threshold / 100)
+        for name, metric, before, after in regressions:
+            click.secho(f"{name} {metric}: {before} -> {after}", fg="red")
+        if regressions:
+            raise click.exceptions.Exit(1)
+        click.secho(
+            f"No regression since {baseline.get('commit') or compare}", fg="green"
+        )
@@ -0,0 +1,117 @@
+from typing import Any
+
+import datetime
+import hashlib
+import json
+
+from flask import Response, make_response
+
+import ckan.model as model
+from ckan.common import request
+
+# Browsers and monitors revalidate every time, but may keep the body
+CACHE_CONTROL = "private, no-cache"
+
+
+class Validators(object):
+    """
+    ETag and Last-Modified of a resource pipeline, read from its task
+    status with a single query and without calling any action.
+
+    :param resource_id: The resource of the pipeline.
+    :param variant: Anything else the response depends on, like the user
+        or the query string, hashed into the ETag.
+    """
+
+    def __init__(self, resource_id: str, *variant: Any):
+        row = (
+            model.Session.query(
+                model.TaskStatus.state,
+                model.TaskStatus.last_updated,
+                model.TaskStatus.value,
+                model.Resource.metadata_modified,
+                model.Package.metadata_modified,
+            )
+            .select_from(model.Resource)
+            .join(model.Package, model.Package.id == model.Resource.package_id)
+            .outerjoin(
+                model.TaskStatus,
+                (model.TaskStatus.entity_id == model.Resource.id)
+                & (model.TaskStatus.task_type == "preflow")
+                & (model.TaskStatus.key == "pipeline"),
+            )
+            .filter(model.Resource.id == resource_id)
+            .first()
+        )
+        if row is None:
+            self.state = self.last_updated = self.value = None
+            self.etag = self.last_modified = None
+            return
+
+        (
+            self.state,
+            self.last_updated,
+            self.value,
+            resource_modified,
+            package_modified,
+        ) = row
+
+        # The task status value holds the flow run ID, so a resubmission
+        # changes the ETag even within the same second
+        parts = [
+            resource_id,
+            self.state,
+            self.last_updated,
+            self.value,
+            resource_modified,
+            package_modified,
+            *variant,
+        ]
+        digest = hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+        self.etag = digest[:32]
+        modified = [
+            when
+            for when in (self.last_updated, resource_modified, package_modified)
+            if when
+        ]
+        self.last_modified = max(modified) if modified else None
+
+    @property
+    def flow_run_id(self) -> str:
+        try:
+            return json.loads(self.value or "{}").get("flow_run_id", "")
+        except ValueError:
+            return ""
+
+    def matches(self) -> bool:
+        """
+        Whether the conditional headers of the current request match, the
+        ETag taking precedence over the date as in RFC 9110.
+        """
+        if self.etag is None:
+            return False
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(self.etag)
+        since = request.if_modified_since
+        if since is None or self.last_modified is None:
+            return False
+        # HTTP dates have no fractions of seconds and are always in UTC
+        since = since.replace(tzinfo=None)
+        return self.last_modified.replace(microsecond=0) <= since
+
+    def not_modified(self) -> Response:
+        return self.apply(Response(status=304))
+
+    def apply(self, response: Any) -> Response:
+        """
+        Add the validators to a view response.
+        """
+        response = make_response(response)
+        if self.etag is not None:
+            response.set_etag(self.etag, weak=True)
+        if self.last_modified is not None:
+            response.last_modified = self.last_modified.replace(
+                tzinfo=datetime.timezone.utc
+            )
+        response.headers["Cache-Control"] = CACHE_CONTROL
+        return response
@@ -0,0 +1,68 @@
+from typing import Any, Iterator
+
+import json
+import logging
+import time
+
+import ckan.plugins.toolkit as tk
+from ckan.lib.redis import connect_to_redis
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 300
+KEEPALIVE_SECONDS = 15
+
+
+def channel(resource_id: str) -> str:
+    return f"ckanext-preflow:events:{resource_id}"
+
+
+def publish(resource_id: str, event: dict[str, Any]) -> None:
+    """
+    Notify the live viewers of a resource pipeline of a new status or log
+    entry. Failures are logged and otherwise ignored.
+    """
+    try:
+        connect_to_redis().publish(channel(resource_id), json.dumps(event))
+    except Exception as e:
+        log.warning("Failed to publish Preflow event for %s: %s", resource_id, e)
+
+
+def format_event(event: dict[str, Any]) -> str:
+    lines = []
+    if event.get("id"):
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['event']}")
+    lines.append(f"data: {json.dumps(event)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def stream(resource_id: str, backlog: list[dict[str, Any]]) -> Iterator[str]:
+    """
+    Server-sent events stream of a resource pipeline: first the ``backlog``
+    events, then every event published until the pipeline is no longer in
+    progress or ``ckanext.preflow.events_timeout`` seconds have elapsed, which
+    is announced with a ``timeout`` event.
+    """
+    timeout = tk.asint(tk.config.get("ckanext.preflow.events_timeout", DEFAULT_TIMEOUT))
+    pubsub = connect_to_redis().pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(channel(resource_id))
+    try:
+        yield "retry: 3000\n\n"
+        for event in backlog:
+            yield format_event(event)
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=KEEPALIVE_SECONDS)
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            event = json.loads(message["data"])
+            yield format_event(event)
+            if event.get("terminal"):
+                break
+        else:
+            yield format_event({"event": "timeout"})
+    finally:
+        pubsub.close()
@@ -1,21 +1,61 @@
 import json
+import logging
 from ckan.plugins import toolkit as tk
 import ckan.model as model
+from ckan.lib import webassets_tools
 
-def get_preflow_badge(resource_id: str):
+from ckanext.preflow import metrics
+
+log = logging.getLogger(__name__)
+
+
+def _prefetched_statuses(package_id: str) -> dict:
+    """
+    Statuses of all the resources of a dataset, fetched once per request with
+    the ``preflow_status_bulk`` action and reused by every badge on the page.
+    """
+    prefetched = getattr(tk.g, "preflow_statuses", None)
+    if prefetched is None:
+        prefetched = tk.g.preflow_statuses = {}
+
+    if package_id not in prefetched:
+        context = {
+            "model": model,
+            "ignore_auth": True,
+        }
+        try:
+            prefetched[package_id] = tk.get_action("preflow_status_bulk")(
+                context, {"package_id": package_id}
+            )
+        except (tk.ObjectNotFound, tk.ValidationError):
+            prefetched[package_id] = {}
+
+    return prefetched[package_id]
+
+
+def get_preflow_badge(resource_id: str, package_id: str = None):
     """
     Helper function to get the status of a preflow for a given resource ID.
     Returns a dictionary with the status information.
+
+    When the dataset ID is given, the statuses of all the dataset resources
+    are fetched at once on the first call and reused by the next ones.
     """
     context = {
         "model": model,
         "ignore_auth": True,
     }
-    
-    try:
-        preflow_status = tk.get_action("preflow_status")(context, {"id": resource_id})
-    except (tk.ObjectNotFound, tk.ValidationError):
-        return ""
+
+    metrics.badge_calls_total.inc(source="prefetched" if package_id else "single")
+    if package_id:
+        preflow_status = _prefetched_statuses(package_id).get(resource_id)
+    else:
+        try:
+            preflow_status = tk.get_action("preflow_status")(
+                context, {"id": resource_id}
+            )
+        except (tk.ObjectNotFound, tk.ValidationError):
+            return ""
 
     if not preflow_status:
         return ""
@@ -38,4 +78,18 @@ def get_preflow_badge(resource_id: str):
         f'<span class="{badge_class} px-2 py-1">{status}</span>'
         '</span>'
         '</span>'
-    )
\ No newline at end of file
+    )
+
+
+def get_preflow_asset_urls(*names: str) -> list:
+    """
+    URLs of the files of webassets bundles, to load them on demand from the
+    browser instead of with the page.
+    """
+    urls = []
+    for name in names:
+        try:
+            urls.extend(webassets_tools.env[name].urls())
+        except Exception as e:
+            log.warning("Failed to resolve the URLs of asset %s: %s", name, e)
+    return urls
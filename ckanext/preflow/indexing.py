@@ -0,0 +1,122 @@
+from typing import Any
+
+import json
+import logging
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+from ckan.lib import search
+
+from ckanext.preflow import jobs
+
+log = logging.getLogger(__name__)
+
+
+def is_enabled() -> bool:
+    return tk.asbool(tk.config.get("ckanext.preflow.index_state", True))
+
+
+def _resource_ids(pkg_dict: dict[str, Any]) -> list[str]:
+    """
+    IDs of the resources of a dataset being indexed, in order. CKAN removes
+    ``resources`` from the dict before ``before_dataset_index``, they are
+    read from ``validated_data_dict`` or from the database instead.
+    """
+    if pkg_dict.get("resources"):
+        return [res["id"] for res in pkg_dict["resources"]]
+    try:
+        validated = json.loads(pkg_dict.get("validated_data_dict") or "{}")
+    except ValueError:
+        validated = {}
+    if validated.get("resources"):
+        return [res["id"] for res in validated["resources"]]
+    return [
+        resource_id
+        for (resource_id,) in model.Session.query(model.Resource.id)
+        .filter(model.Resource.package_id == pkg_dict.get("id"))
+        .filter(model.Resource.state == "active")
+        .order_by(model.Resource.position)
+    ]
+
+
+def index_fields(pkg_dict: dict[str, Any]) -> dict[str, Any]:
+    """
+    Search index fields describing the pipelines of the resources of a
+    dataset, loaded with a single query:
+
+    - ``vocab_preflow_state``: the states of the resource pipelines
+    - ``vocab_preflow_valid``: ``true`` and/or ``false``, the validity of
+      the last validation reports
+    - ``vocab_preflow_failed``: the IDs of the resources whose pipeline
+      failed
+    - ``preflow_last_run_date``: the last pipeline update
+    - ``res_extras_preflow_state``: the state of each resource pipeline, in
+      the order of the other ``res_*`` fields
+    """
+    resource_ids = _resource_ids(pkg_dict)
+    if not resource_ids:
+        return {}
+
+    rows = (
+        model.Session.query(
+            model.TaskStatus.entity_id,
+            model.TaskStatus.state,
+            model.TaskStatus.last_updated,
+            model.TaskStatus.value,
+        )
+        .filter(model.TaskStatus.entity_id.in_(resource_ids))
+        .filter(model.TaskStatus.task_type == "preflow")
+        .filter(model.TaskStatus.key == "pipeline")
+    )
+
+    states, valid, failed, last_run = {}, set(), [], None
+    for resource_id, state, last_updated, value in rows:
+        state = (state or "").lower()
+        states[resource_id] = state
+        if state == "failed":
+            failed.append(resource_id)
+        if last_updated and (last_run is None or last_updated > last_run):
+            last_run = last_updated
+        try:
+            validation = json.loads(value or "{}").get("validation") or {}
+        except ValueError:
+            validation = {}
+        if "valid" in validation:
+            valid.add(str(bool(validation["valid"])).lower())
+
+    if not states:
+        return {}
+
+    fields = {
+        "vocab_preflow_state": sorted(set(states.values())),
+        "vocab_preflow_valid": sorted(valid),
+        "vocab_preflow_failed": failed,
+        "res_extras_preflow_state": [states.get(res_id, "") for res_id in resource_ids],
+    }
+    if last_run:
+        fields["preflow_last_run_date"] = last_run.isoformat() + "Z"
+    return fields
+
+
+def reindex(resource_ids: list[str]) -> None:
+    """
+    Update the search index of the datasets of the resources, once per
+    dataset, in a background job when submissions are asynchronous.
+    """
+    if not is_enabled() or not resource_ids:
+        return
+
+    package_ids = {
+        package_id
+        for (package_id,) in model.Session.query(model.Resource.package_id).filter(
+            model.Resource.id.in_(resource_ids)
+        )
+    }
+    for package_id in package_ids:
+        if jobs.is_async():
+            jobs.enqueue_reindex(package_id)
+            continue
+        try:
+            search.rebuild(package_id)
+        except search.SearchIndexError as e:
+            log.error("Failed to reindex dataset %s: %s", package_id, e)
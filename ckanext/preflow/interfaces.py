@@ -0,0 +1,31 @@
+from ckan.types import Any, Context
+
+import ckan.plugins as p
+
+
+class IPreflowHook(p.Interface):
+    """
+    Subscribe to the pipeline state transitions of resources.
+
+    The hook runs when the state stored by ``preflow_status_update`` changes
+    into one of the states returned by ``preflow_hook_states``. Updates that
+    only add log entries, or that keep the same state, do not trigger it.
+    """
+
+    def preflow_hook_states(self) -> list[str]:
+        """
+        Return the lowercase pipeline states (e.g. ``"completed"``,
+        ``"failed"``) this plugin wants to be notified about.
+        """
+        return []
+
+    def after_preflow_state_change(
+        self, context: Context, data_dict: dict[str, Any]
+    ) -> None:
+        """
+        Called after the pipeline state of a resource changed.
+
+        :param data_dict: ``resource_id``, ``flow_run_id``, the new ``state``
+            and the ``previous_state``, all states in lowercase.
+        """
+        pass
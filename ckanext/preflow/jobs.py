@@ -0,0 +1,139 @@
+import logging
+import random
+import time
+
+import ckan.plugins.toolkit as tk
+import ckan.model as model
+
+log = logging.getLogger(__name__)
+
+DEFAULT_QUEUE = "preflow"
+
+
+def is_async() -> bool:
+    return tk.asbool(tk.config.get("ckanext.preflow.async_submit", False))
+
+
+def queue_name() -> str:
+    return tk.config.get("ckanext.preflow.queue", DEFAULT_QUEUE)
+
+
+def enqueue_submit(resource_id: str) -> None:
+    """
+    Enqueue the Prefect submission of a resource on the Preflow job queue, to
+    be processed by ``ckan jobs worker preflow``.
+    """
+    tk.enqueue_job(
+        submit_job,
+        [resource_id],
+        title=f"Preflow submission of resource {resource_id}",
+        queue=queue_name(),
+    )
+
+
+def submit_job(resource_id: str) -> None:
+    """
+    Worker side handler of the Preflow submission jobs.
+
+    Submissions that fail to reach Prefect are retried
+    ``ckanext.preflow.submit_retries`` times, waiting an exponentially
+    growing and jittered delay between attempts.
+    """
+    retries = tk.asint(tk.config.get("ckanext.preflow.submit_retries", 3))
+    delay = tk.asint(tk.config.get("ckanext.preflow.submit_retry_delay", 5))
+
+    site_user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
+
+    for attempt in range(retries + 1):
+        context = {
+            "model": model,
+            "session": model.Session,
+            "ignore_auth": True,
+            "user": site_user["name"],
+            "preflow_probe": True,
+        }
+        try:
+            resource_dict = tk.get_action("resource_show")(
+                context, {"id": resource_id}
+            )
+            if tk.get_action("preflow_submit")(context, resource_dict):
+                return
+        except tk.ObjectNotFound:
+            log.warning("Resource %s no longer exists, not submitting", resource_id)
+            return
+        except tk.ValidationError as e:
+            log.info("Not submitting resource %s: %s", resource_id, e.error_dict)
+            return
+
+        if attempt < retries:
+            wait = delay * 2**attempt * random.uniform(0.5, 1.5)
+            log.info(
+                "Submission of resource %s failed, retrying in %.1f seconds",
+                resource_id,
+                wait,
+            )
+            model.Session.remove()
+            time.sleep(wait)
+
+    log.error(
+        "Giving up submitting resource %s after %s attempts", resource_id, retries + 1
+    )
+
+
+def enqueue_reconcile() -> None:
+    tk.enqueue_job(
+        reconcile_job, title="Preflow reconciliation with Prefect", queue=queue_name()
+    )
+
+
+def reconcile_job() -> None:
+    """
+    Worker side handler of the Preflow reconciliation jobs.
+    """
+    site_user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
+    context = {
+        "model": model,
+        "session": model.Session,
+        "ignore_auth": True,
+        "user": site_user["name"],
+    }
+    tk.get_action("preflow_reconcile")(context, {})
+
+
+def enqueue_dispatch() -> None:
+    tk.enqueue_job(
+        dispatch_job, title="Preflow submission queue dispatch", queue=queue_name()
+    )
+
+
+def dispatch_job() -> None:
+    """
+    Worker side handler of the Preflow scheduler dispatch jobs.
+    """
+    site_user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
+    context = {
+        "model": model,
+        "session": model.Session,
+        "ignore_auth": True,
+        "user": site_user["name"],
+        "preflow_probe": True,
+    }
+    tk.get_action("preflow_dispatch")(context, {})
+
+
+def enqueue_reindex(package_id: str) -> None:
+    tk.enqueue_job(
+        reindex_job,
+        [package_id],
+        title=f"Preflow reindex of dataset {package_id}",
+        queue=queue_name(),
+    )
+
+
+def reindex_job(package_id: str) -> None:
+    """
+    Worker side handler of the search index updates of pipeline states.
+    """
+    from ckan.lib import search
+
+    search.rebuild(package_id)
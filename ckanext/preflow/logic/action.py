@@ -1,33 +1,98 @@
 # encoding: utf-8
-from ckan.types import Context
+from ckan.types import Any, Context
+from typing import Optional
 
 import logging
 import json
 import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+import sqlalchemy as sa
 
 import ckan.plugins as p
 import ckan.plugins.toolkit as tk
+import ckan.model as model
+from ckan.lib.dictization import model_dictize
+
+from ckanext.preflow import (
+    cache,
+    events,
+    indexing,
+    jobs,
+    metrics,
+    reports,
+    routing,
+    runs,
+    scheduler,
+    utils,
+    webhooks,
+)
+from ckanext.preflow.prefect import get_client
+from ckanext.preflow.model import PreflowLog, PreflowRun
+from ckanext.preflow.interfaces import IPreflowHook
 
 log = logging.getLogger(__name__)
 
 
-def preflow_submit(context: Context, data_dict: dict[str, str]) -> dict[str, str]:
+def _int_param(
+    data_dict: dict[str, Any],
+    key: str,
+    default: Optional[int] = None,
+    minimum: Optional[int] = None,
+    maximum: Optional[int] = None,
+) -> Optional[int]:
     """
-    Submits a Prefect flow run for data ingestion and processing.
+    Integer parameter of an action, ``default`` when missing, capped at
+    ``maximum``.
 
-    :param context: The context dictionary, usually containing user and authorization information.
-    :type context: dict
-    :param data_dict: Resource dictionary with parameters for the flow run.
-    :returns: A dictionary with Prefect flow run metadata and status.
-    :rtype: dict
+    :raises ValidationError: If the value is not an integer or is lower than
+        ``minimum``.
     """
-    log.debug("Submitting Prefect flow with parameters: %s", data_dict)
-    tk.check_access("preflow_submit", context, data_dict)
+    value = data_dict.get(key)
+    if value in (None, ""):
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise tk.ValidationError({key: [tk._("Invalid integer")]})
+    if minimum is not None and value < minimum:
+        raise tk.ValidationError(
+            {key: [tk._("Must be at least {0}").format(minimum)]}
+        )
+    if maximum is not None:
+        value = min(value, maximum)
+    return value
 
-    # Waiting: prevent resubmission within 2 minutes of a Pending status
-    waiting_seconds = tk.config.get("ckanext.preflow.waiting_seconds", 120)
-    resource_id = data_dict.get("id", "")
+
+def _flow_run_id(task_status: dict[str, Any]) -> str:
+    try:
+        return json.loads(task_status.get("value") or "{}").get("flow_run_id", "")
+    except Exception:
+        log.warning(
+            f"Task status for resource {task_status.get('entity_id')} is invalid."
+        )
+        return ""
+
+
+def _apply_flow_run(
+    task_status: dict[str, Any], flow_run_id: str, flow_run: dict[str, Any]
+) -> dict[str, Any]:
+    state = flow_run.get("state", {}).get("type") or task_status.get("state")
+
+    task_status["state"] = state.lower()
+    task_status["flow_run_id"] = flow_run_id
+    task_status["flow_run_details"] = flow_run
+    return task_status
+
+
+def _check_resubmission(context: Context, resource_id: str) -> None:
+    """
+    Prevent resubmission within ``ckanext.preflow.waiting_seconds`` of a
+    Pending status.
+    """
+    waiting_seconds = tk.asint(tk.config.get("ckanext.preflow.waiting_seconds", 120))
     try:
         existing_status = p.toolkit.get_action("task_status_show")(
             context,
@@ -54,6 +119,14 @@ def preflow_submit(context: Context, data_dict: dict[str, str]) -> dict[str, str
     except tk.ObjectNotFound:
         pass
 
+
+def _compact_payload() -> bool:
+    return tk.asbool(tk.config.get("ckanext.preflow.compact_payload", False))
+
+
+def _flow_payload(
+    context: Context, data_dict: dict[str, Any], fingerprint: str = ""
+) -> dict[str, Any]:
     if data_dict.get("url_type") == "datastore" or "_datastore_only_resource" in (
         data_dict.get("url") or ""
     ):
@@ -68,11 +141,22 @@ def preflow_submit(context: Context, data_dict: dict[str, str]) -> dict[str, str
             },
         )
 
-    data_dict["schema"] = data_dict.get("schemas", {})
+    if _compact_payload():
+        # The flow fetches the rest with preflow_resource_context
+        resource_dict = {
+            "id": data_dict.get("id", ""),
+            "url": data_dict.get("url", ""),
+            "format": data_dict.get("format", ""),
+            "fingerprint": fingerprint,
+            "compact": True,
+        }
+    else:
+        data_dict["schema"] = data_dict.get("schemas", {})
+        resource_dict = data_dict
 
-    flow_payload = {
+    return {
         "parameters": {
-            "resource_dict": data_dict,
+            "resource_dict": resource_dict,
             "ckan_config": {
                 "ckan_url": tk.config.get("ckan.site_url"),
                 "api_key": tk.config.get("ckanext.preflow.api_key", ""),
@@ -86,49 +170,406 @@ def preflow_submit(context: Context, data_dict: dict[str, str]) -> dict[str, str
         },
     }
 
-    deployment_id = tk.config.get("ckanext.preflow.prefect_deployment_id")
 
-    prefect_api_url = tk.config.get("ckanext.preflow.prefect_api_url")
-    prefect_api_key = tk.config.get("ckanext.preflow.prefect_api_key")
+def _routed_payload(
+    context: Context, data_dict: dict[str, Any], fingerprint: str = ""
+) -> tuple[str, dict[str, Any]]:
+    """
+    Return the deployment ID the resource is routed to and the flow run
+    payload, with the work queue and route tag of the route.
+    """
+    target = routing.route(data_dict)
+    flow_payload = _flow_payload(context, data_dict, fingerprint)
+    if target.get("work_queue_name"):
+        flow_payload["work_queue_name"] = target["work_queue_name"]
+    if target.get("name"):
+        flow_payload["tags"].append(f"route:{target['name']}")
+    return target["deployment_id"], flow_payload
+
+
+def _already_processed(state: str, value: dict[str, Any], fingerprint: str) -> bool:
+    return (
+        bool(fingerprint)
+        and state.lower() == "completed"
+        and value.get("processed_fingerprint") == fingerprint
+    )
+
+
+def _record_submission(
+    context: Context,
+    resource_id: str,
+    flow_run_data: dict[str, Any],
+    fingerprint: str = "",
+) -> None:
+    runs.record(
+        resource_id,
+        flow_run_data.get("id"),
+        flow_run_data.get("deployment_id"),
+        fingerprint,
+    )
+    tk.get_action("preflow_status_update")(
+        context,
+        {
+            "resource_id": resource_id,
+            "state": "Pending",
+            "flow_run_id": flow_run_data.get("id"),
+            "fingerprint": fingerprint,
+            "message": f"Data processing is scheduled with Prefect flow run ID: {flow_run_data.get('id')}",
+            "clear": True,
+        },
+    )
 
-    headers = {"Content-Type": "application/json"}
-    if prefect_api_key:
-        headers["Authorization"] = f"Bearer {prefect_api_key}"
 
+def _record_submission_error(
+    context: Context, resource_id: str, error: Exception
+) -> None:
+    tk.get_action("preflow_status_update")(
+        context,
+        {
+            "resource_id": resource_id,
+            "state": "Failed",
+            "type": "error",
+            "message": f"Failed to create Prefect flow run: {str(error)}",
+            "clear": True,
+        },
+    )
+
+
+def _debounce_seconds() -> int:
+    return tk.asint(tk.config.get("ckanext.preflow.debounce_seconds", 0))
+
+
+def _supersede(context: Context, resource_id: str, flow_run_id: str) -> bool:
+    """
+    Make way for a new submission of a resource whose previous run is not
+    over. Runs that did not start yet are cancelled. Started runs are
+    cancelled too, unless ``ckanext.preflow.supersede`` is ``queue``: the
+    resource is then resubmitted when the run finishes, and False is
+    returned.
+    """
+    client = get_client()
     try:
-        flow_run = requests.post(
-            f"{prefect_api_url}/deployments/{deployment_id}/create_flow_run",
-            headers=headers,
-            json=flow_payload,
-        )
-        flow_run.raise_for_status()
-        flow_run_data = flow_run.json()
-        log.info("Flow run created successfully: %s", flow_run_data)
+        flow_run = client.get_flow_run(flow_run_id)
+        prefect_state = (flow_run.get("state") or {}).get("type", "").lower()
+    except requests.RequestException as e:
+        log.warning("Failed to fetch Prefect flow run %s: %s", flow_run_id, e)
+        prefect_state = ""
+    if prefect_state in cache.TERMINAL_STATES:
+        return True
 
+    policy = tk.config.get("ckanext.preflow.supersede", "cancel")
+    if prefect_state != "scheduled" and policy == "queue":
         tk.get_action("preflow_status_update")(
             context,
             {
-                "resource_id": data_dict.get("id", ""),
-                "state": "Pending",
-                "flow_run_id": flow_run_data.get("id"),
-                "message": f"Data processing is scheduled with Prefect flow run ID: {flow_run_data.get('id')}",
-                "clear": True,
+                "resource_id": resource_id,
+                "resubmit": True,
+                "message": f"A newer version of the resource will be processed "
+                f"after flow run {flow_run_id}",
             },
         )
+        return False
+
+    try:
+        client.set_flow_run_state(
+            flow_run_id,
+            "CANCELLED" if prefect_state == "scheduled" else "CANCELLING",
+            "Superseded by a newer submission of the resource",
+        )
+    except requests.RequestException as e:
+        log.warning("Failed to cancel Prefect flow run %s: %s", flow_run_id, e)
+    runs.update(flow_run_id, "cancelled", datetime.datetime.utcnow())
+    cache.invalidate_flow_run(flow_run_id)
+    metrics.submissions_total.inc(result="superseded")
+    log.info("Flow run %s of resource %s was superseded", flow_run_id, resource_id)
+    return True
+
+
+def preflow_submit(context: Context, data_dict: dict[str, str]) -> dict[str, str]:
+    """
+    Submits a Prefect flow run for data ingestion and processing.
+
+    :param context: The context dictionary, usually containing user and authorization information.
+    :type context: dict
+    :param data_dict: Resource dictionary with parameters for the flow run.
+        Resources whose data did not change since their last completed run
+        are skipped, unless ``force`` is set. Remote URLs are only probed
+        for changes in the background jobs and commands, which set
+        ``preflow_probe`` in the context.
+    :returns: A dictionary with Prefect flow run metadata and status, or with
+        ``skipped`` set to True.
+    :rtype: dict
+    """
+    log.debug("Submitting Prefect flow with parameters: %s", data_dict)
+    tk.check_access("preflow_submit", context, data_dict)
+
+    resource_id = data_dict.get("id", "")
+    force = tk.asbool(data_dict.pop("force", False))
+    # Never hold the resource_create/update request on a HEAD request
+    fingerprint = utils.resource_fingerprint(
+        data_dict, probe=bool(context.get("preflow_probe"))
+    )
+    state, value = _stored_status(context, resource_id, "pipeline")
+    if not force and _already_processed(state, value, fingerprint):
+        log.info("Resource %s is unchanged since its last run", resource_id)
+        metrics.submissions_total.inc(result="unchanged")
+        return {"skipped": True, "fingerprint": fingerprint}
+
+    debounce = _debounce_seconds()
+    if not debounce:
+        _check_resubmission(context, resource_id)
+    elif state in cache.IN_FLIGHT_STATES and value.get("flow_run_id"):
+        if not _supersede(context, resource_id, value["flow_run_id"]):
+            metrics.submissions_total.inc(result="coalesced")
+            return {"queued": True, "flow_run_id": value["flow_run_id"]}
+
+    deployment_id, flow_payload = _routed_payload(context, data_dict, fingerprint)
+    if debounce:
+        # Give later submissions of the resource a chance to replace this one
+        scheduled_time = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=debounce
+        )
+        flow_payload["state"]["state_details"] = {
+            "scheduled_time": scheduled_time.isoformat() + "+00:00"
+        }
+
+    try:
+        flow_run_data = get_client().create_flow_run(deployment_id, flow_payload)
+        log.info("Flow run created successfully: %s", flow_run_data)
+        _record_submission(context, resource_id, flow_run_data, fingerprint)
+        metrics.submissions_total.inc(result="submitted")
         return flow_run_data
     except requests.RequestException as e:
         log.error("Failed to create Prefect flow run: %s", e)
-        tk.get_action("preflow_status_update")(
-            context,
-            {
-                "resource_id": data_dict.get("id", ""),
-                "state": "Failed",
-                "type": "error",
-                "message": f"Failed to create Prefect flow run: {str(e)}",
-                "clear": True,
-            },
+        metrics.submissions_total.inc(result="failed")
+        if context.get("preflow_raise_errors"):
+            # The scheduler keeps the resource queued until Prefect is back
+            raise
+        _record_submission_error(context, resource_id, e)
+
+
+def preflow_enqueue(context: Context, data_dict: dict[str, Any]) -> dict[str, Any]:
+    """
+    Queue a resource for submission by the scheduler and dispatch the queue.
+    Queuing an already queued resource raises its priority if needed.
+
+    :param resource_id: ID of the resource.
+    :type resource_id: str
+    :param priority: Higher priorities are submitted first (optional,
+        default: 0, manual runs use 10).
+    :type priority: int
+    :param force: Submit the resource even if its data did not change
+        (optional, default: False).
+    :type force: bool
+
+    :returns: The result of the dispatch, see ``preflow_dispatch``.
+    :rtype: dict
+    """
+    resource_id = tk.get_or_bust(data_dict, "resource_id")
+
+    tk.check_access("preflow_submit", context, {"resource_id": resource_id})
+
+    metrics.submissions_total.inc(result="queued")
+    scheduler.enqueue(
+        resource_id,
+        tk.asint(data_dict.get("priority", scheduler.PRIORITY_AUTO)),
+        tk.asbool(data_dict.get("force", False)),
+    )
+    model.repo.commit()
+
+    return _dispatch(context)
+
+
+def preflow_dispatch(context: Context, data_dict: dict[str, Any]) -> dict[str, Any]:
+    """
+    Submit queued resources while the in-flight limits allow it, see
+    ``scheduler.dispatch``.
+
+    :returns: The number of ``submitted``, ``dropped`` and still ``queued``
+        resources.
+    :rtype: dict
+    """
+    tk.check_access("preflow_dispatch", context, data_dict)
+
+    return scheduler.dispatch(dict(context, ignore_auth=True))
+
+
+def _dispatch(context: Context) -> dict[str, Any]:
+    """
+    Dispatch the queue in a background job when submissions are
+    asynchronous, right away otherwise.
+    """
+    if jobs.is_async():
+        jobs.enqueue_dispatch()
+        return {"queued": True}
+    return tk.get_action("preflow_dispatch")(dict(context, ignore_auth=True), {})
+
+
+def _bulk_resources(context: Context, data_dict: dict[str, Any]) -> list[dict]:
+    if data_dict.get("package_id"):
+        datasets = [
+            tk.get_action("package_show")(context, {"id": data_dict["package_id"]})
+        ]
+    else:
+        search = {
+            "q": data_dict.get("q") or "*:*",
+            "fq": "",
+            "rows": 1000,
+            "include_private": True,
+        }
+        if data_dict.get("owner_org"):
+            org = tk.get_action("organization_show")(
+                context, {"id": data_dict["owner_org"], "include_datasets": False}
+            )
+            search["fq"] = f'owner_org:"{org["id"]}"'
+
+        datasets, start = [], 0
+        while True:
+            result = tk.get_action("package_search")(
+                context, dict(search, start=start)
+            )
+            datasets.extend(result["results"])
+            start += search["rows"]
+            if start >= result["count"] or not result["results"]:
+                break
+
+    return [
+        resource
+        for dataset in datasets
+        for resource in dataset.get("resources", [])
+        if utils.is_supported(resource)
+    ]
+
+
+def preflow_submit_bulk(context: Context, data_dict: dict[str, Any]) -> dict[str, Any]:
+    """
+    Submit all the supported resources of a dataset, an organization or a
+    dataset search to the pipeline.
+
+    Resources whose pipeline is in progress are skipped, and so are the ones
+    whose data did not change since their last completed run unless
+    ``force`` is set. Flow runs are created in batches, with at most ``concurrency`` requests to Prefect in
+    flight at any time.
+
+    :param package_id: ID or name of a dataset.
+    :type package_id: str
+    :param owner_org: ID or name of an organization.
+    :type owner_org: str
+    :param q: Dataset search query.
+    :type q: str
+    :param concurrency: Maximum number of simultaneous Prefect requests
+        (optional, default: ``ckanext.preflow.bulk_concurrency`` or 4).
+    :type concurrency: int
+    :param batch_size: Number of resources per batch (optional, default: 50).
+    :type batch_size: int
+    :param force: Submit unchanged resources too (optional, default: False).
+    :type force: bool
+
+    :returns: The number of submitted, skipped, unchanged and failed
+        resources, the
+        errors by resource ID, the elapsed seconds and the throughput in
+        submissions per second.
+    :rtype: dict
+    """
+    if not any(data_dict.get(key) for key in ("package_id", "owner_org", "q")):
+        raise tk.ValidationError(
+            {"package_id": ["One of package_id, owner_org or q is required"]}
         )
 
+    tk.check_access("preflow_submit_bulk", context, data_dict)
+
+    concurrency = tk.asint(
+        data_dict.get("concurrency")
+        or tk.config.get("ckanext.preflow.bulk_concurrency", 4)
+    )
+    batch_size = tk.asint(data_dict.get("batch_size") or 50)
+    started = time.monotonic()
+
+    resources = _bulk_resources(context, data_dict)
+
+    force = tk.asbool(data_dict.get("force", False))
+    stored = {}
+    if resources:
+        rows = (
+            model.Session.query(model.TaskStatus)
+            .filter(model.TaskStatus.entity_id.in_([res["id"] for res in resources]))
+            .filter(model.TaskStatus.task_type == "preflow")
+            .filter(model.TaskStatus.key == "pipeline")
+        )
+        stored = {
+            row.entity_id: (
+                (row.state or "").lower(),
+                json.loads(row.value) if row.value else {},
+            )
+            for row in rows
+        }
+
+    report = {
+        "total": len(resources),
+        "submitted": 0,
+        "skipped": 0,
+        "unchanged": 0,
+        "failed": 0,
+        "errors": {},
+    }
+
+    executor = ThreadPoolExecutor(max_workers=max(concurrency, 1))
+    fingerprints = list(executor.map(utils.resource_fingerprint, resources))
+
+    todo = []
+    for resource, fingerprint in zip(resources, fingerprints):
+        state, value = stored.get(resource["id"], ("", {}))
+        if state in cache.IN_FLIGHT_STATES:
+            report["skipped"] += 1
+            metrics.submissions_total.inc(result="in_progress")
+        elif not force and _already_processed(state, value, fingerprint):
+            report["unchanged"] += 1
+            metrics.submissions_total.inc(result="unchanged")
+        else:
+            todo.append((resource, fingerprint))
+
+    client = get_client()
+
+    # The datasets are reindexed once, after all their resources
+    record_context = dict(context, preflow_defer_index=True)
+    with executor:
+        for i in range(0, len(todo), batch_size):
+            batch = todo[i : i + batch_size]
+            futures = [
+                executor.submit(
+                    client.create_flow_run,
+                    *_routed_payload(context, resource, fingerprint),
+                )
+                for resource, fingerprint in batch
+            ]
+            for (resource, fingerprint), future in zip(batch, futures):
+                try:
+                    _record_submission(
+                        record_context, resource["id"], future.result(), fingerprint
+                    )
+                    report["submitted"] += 1
+                    metrics.submissions_total.inc(result="submitted")
+                except requests.RequestException as e:
+                    _record_submission_error(record_context, resource["id"], e)
+                    report["failed"] += 1
+                    metrics.submissions_total.inc(result="failed")
+                    report["errors"][resource["id"]] = str(e)
+
+    indexing.reindex([resource["id"] for resource, _ in todo])
+
+    report["elapsed"] = round(time.monotonic() - started, 3)
+    report["throughput"] = (
+        round(report["submitted"] / report["elapsed"], 3) if report["elapsed"] else 0
+    )
+    log.info(
+        "Bulk submission: %s submitted, %s skipped, %s failed in %ss",
+        report["submitted"],
+        report["skipped"],
+        report["failed"],
+        report["elapsed"],
+    )
+    return report
+
 
 @tk.side_effect_free
 def preflow_status(context: Context, data_dict: dict[str, str]) -> dict[str, str]:
@@ -141,6 +582,9 @@ def preflow_status(context: Context, data_dict: dict[str, str]) -> dict[str, str
         Must include:
             - resource_id (str): ID of the CKAN resource to check the flow status for preflow RUN.
             - flow_run_id (str, optional): Specific Prefect flow run ID to retrieve status for.
+            - live (bool, optional): Fetch the flow run from Prefect and add it
+              as ``flow_run_details``. By default only the state stored in
+              CKAN is returned, without contacting Prefect.
     :type data_dict: dict
 
     :returns: A dictionary containing the Prefect flow run status and related metadata.
@@ -158,86 +602,256 @@ def preflow_status(context: Context, data_dict: dict[str, str]) -> dict[str, str
 
     res_id = tk.get_or_bust(data_dict, "resource_id")
 
-    task_status = p.toolkit.get_action("task_status_show")(
-        context, {"entity_id": res_id, "task_type": "preflow", "key": "pipeline"}
-    )
+    with metrics.db_seconds.time(operation="task_status_read"):
+        task_status = p.toolkit.get_action("task_status_show")(
+            context, {"entity_id": res_id, "task_type": "preflow", "key": "pipeline"}
+        )
 
-    prefect_api_url = tk.config.get(
-        "ckanext.preflow.prefect_api_url", "http://127.0.0.1:4200/api"
-    )
-    prefect_api_key = tk.config.get("ckanext.preflow.prefect_api_key")
+    flow_run_id = data_dict.get("flow_run_id") or _flow_run_id(task_status)
+    task_status["state"] = (task_status.get("state") or "").lower()
+    task_status["flow_run_id"] = flow_run_id
 
-    try:
-        flow_run_id = json.loads(task_status.get("value", "{}")).get("flow_run_id", "")
-    except Exception:
-        log.warning(f"Task status for resource {res_id} not found or invalid.")
-        flow_run_id = ""
+    if not tk.asbool(data_dict.get("live", False)):
+        return task_status
 
-    flow_run_id = data_dict.get("flow_run_id") or flow_run_id
+    flow_run = cache.get_flow_run(flow_run_id)
+    if flow_run is None and flow_run_id:
+        try:
+            flow_run = get_client().get_flow_run(flow_run_id)
+            cache.set_flow_run(flow_run_id, flow_run)
+        except requests.RequestException as e:
+            log.error(f"Failed to fetch Prefect flow run status: {e}")
 
-    headers = {"Authorization": f"Bearer {prefect_api_key}"} if prefect_api_key else {}
-    try:
-        response = requests.get(
-            f"{prefect_api_url}/flow_runs/{flow_run_id}", headers=headers
+    if flow_run is not None:
+        _apply_flow_run(task_status, flow_run_id, flow_run)
+
+    return task_status
+
+
+@tk.side_effect_free
+def preflow_resource_context(
+    context: Context, data_dict: dict[str, Any]
+) -> dict[str, Any]:
+    """
+    Return what a flow needs to process a resource submitted with a compact
+    payload: the resource, its schema and the main fields of its dataset.
+
+    :param resource_id: ID of the resource.
+    :type resource_id: str
+    :param fields: Only return these resource fields (optional, default:
+        all of them).
+    :type fields: list of strings
+
+    :returns: The ``resource``, its ``schema``, its ``dataset`` and the
+        ``fingerprint`` of its data recorded at its last submission.
+    :rtype: dict
+    """
+    res_id = tk.get_or_bust(data_dict, "resource_id")
+
+    tk.check_access("preflow_resource_context", context, data_dict)
+
+    resource = tk.get_action("resource_show")(context, {"id": res_id})
+    package = model.Package.get(resource["package_id"])
+    schema = resource.get("schemas") or resource.get("schema") or {}
+    # Never probe the data here: anonymous users can call this action
+    _, value = _stored_status(context, res_id, "pipeline")
+
+    fields = tk.aslist(data_dict.get("fields") or [])
+    if fields:
+        resource = {key: resource.get(key) for key in ["id"] + fields}
+
+    return {
+        "resource": resource,
+        "schema": schema,
+        "dataset": {
+            "id": package.id,
+            "name": package.name,
+            "title": package.title,
+            "owner_org": package.owner_org,
+            "private": package.private,
+        },
+        "fingerprint": value.get("fingerprint", ""),
+    }
+
+
+@tk.side_effect_free
+def preflow_status_bulk(
+    context: Context, data_dict: dict[str, Any]
+) -> dict[str, dict[str, Any]]:
+    """
+    Retrieve the Preflow status of all the resources of a dataset at once.
+
+    The task statuses are loaded with a single query and, in live mode, the
+    related Prefect flow runs are resolved with a single ``/flow_runs/filter``
+    request, so the cost does not grow with the number of resources.
+
+    :param package_id: ID or name of the dataset.
+    :type package_id: str
+    :param resource_ids: Optional subset of the dataset resource IDs.
+    :type resource_ids: list
+    :param live: Resolve the flow runs from Prefect, see ``preflow_status``
+        (optional, default: False).
+    :type live: bool
+
+    :returns: The status of each resource that has been submitted to Preflow,
+        keyed by resource ID.
+    :rtype: dict
+    """
+    package_id = tk.get_or_bust(data_dict, "package_id")
+
+    tk.check_access("preflow_status_bulk", context, data_dict)
+
+    package = model.Package.get(package_id)
+    if not package:
+        raise tk.ObjectNotFound(tk._("Dataset not found"))
+
+    resource_ids = [res.id for res in package.resources]
+    if data_dict.get("resource_ids"):
+        wanted = set(tk.aslist(data_dict["resource_ids"]))
+        resource_ids = [res_id for res_id in resource_ids if res_id in wanted]
+    if not resource_ids:
+        return {}
+
+    with metrics.db_seconds.time(operation="task_status_read_bulk"):
+        rows = (
+            model.Session.query(model.TaskStatus)
+            .filter(model.TaskStatus.entity_id.in_(resource_ids))
+            .filter(model.TaskStatus.task_type == "preflow")
+            .filter(model.TaskStatus.key == "pipeline")
+            .all()
         )
-        response.raise_for_status()
-        flow_run_status = response.json()
+    statuses = {
+        row.entity_id: model_dictize.task_status_dictize(row, context)
+        for row in rows
+    }
+
+    flow_run_ids = {}
+    for res_id, task_status in statuses.items():
+        task_status["state"] = (task_status.get("state") or "").lower()
+        task_status["flow_run_id"] = flow_run_ids[res_id] = _flow_run_id(task_status)
 
-        state = flow_run_status.get("state", {}).get("type") or task_status.get("state")
+    if not tk.asbool(data_dict.get("live", False)):
+        return statuses
 
-        task_status["state"] = state.lower()
+    flow_run_ids = {res_id: run_id for res_id, run_id in flow_run_ids.items() if run_id}
+    unique_ids = sorted(set(flow_run_ids.values()))
 
-        task_status["flow_run_id"] = flow_run_id
-        task_status["flow_run_details"] = flow_run_status
+    flow_runs = cache.get_flow_runs(unique_ids)
+    missing = [flow_run_id for flow_run_id in unique_ids if flow_run_id not in flow_runs]
+    try:
+        for run in get_client().filter_flow_runs(missing) if missing else []:
+            flow_runs[run["id"]] = run
+            cache.set_flow_run(run["id"], run)
     except requests.RequestException as e:
-        log.error(f"Failed to fetch Prefect flow run status: {e}")
+        log.error(f"Failed to fetch Prefect flow run statuses: {e}")
 
-    return task_status
+    for res_id, flow_run_id in flow_run_ids.items():
+        if flow_run_id in flow_runs:
+            _apply_flow_run(statuses[res_id], flow_run_id, flow_runs[flow_run_id])
 
+    return statuses
 
-def preflow_status_update(
-    context: Context, data_dict: dict[str, str]
-) -> dict[str, str]:
+
+def _stored_status(
+    context: Context, resource_id: str, key: str
+) -> tuple[str, dict[str, Any]]:
     """
-    Update the preflow status for a resource, appending log entries.
+    Return the stored state, in lowercase, and the parsed value of the task
+    status of a resource.
     """
-    now = str(datetime.datetime.utcnow())
-    message = data_dict.get("message", "")
-    resource_id = data_dict.get("resource_id")
-    flow_run_id = data_dict.get("flow_run_id", "")
-    state = data_dict.get("state", "")
-    clear_log = data_dict.get("clear", False)
-    key = data_dict.get("key", "pipeline")
-    _type = data_dict.get("type", "info")
-    validation_report = data_dict.get("validation_report")
-
-    logs, previous_report = [], None
-    if not clear_log:
-        try:
-            value = p.toolkit.get_action("task_status_show")(
+    try:
+        with metrics.db_seconds.time(operation="task_status_read"):
+            task_status = p.toolkit.get_action("task_status_show")(
                 context,
                 {
                     "entity_id": resource_id,
                     "task_type": "preflow",
                     "key": key,
                 },
-            ).get("value")
-            if value:
-                parsed = json.loads(value)
-                logs = parsed.get("logs", [])
-                previous_report = parsed.get("validation_report")
-        except Exception:
-            pass
+            )
+    except tk.ObjectNotFound:
+        return "", {}
+    try:
+        value = json.loads(task_status.get("value") or "{}")
+    except ValueError:
+        value = {}
+    return (task_status.get("state") or "").lower(), value
+
+
+def _event_datetime(event: dict[str, Any], key: str) -> Optional[datetime.datetime]:
+    """
+    Parse an ISO 8601 date of a status event into a naive UTC datetime.
+
+    :raises ValidationError: If the date is not valid.
+    """
+    value = event.get(key)
+    if not value:
+        return None
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    parsed = webhooks.parse_datetime(str(value))
+    if parsed is None:
+        raise tk.ValidationError({key: [f"Invalid ISO 8601 date: {value}"]})
+    return parsed
+
+
+def _status_event(
+    resource_id: str,
+    previous_state: str,
+    previous: dict[str, Any],
+    event: dict[str, Any],
+) -> tuple[PreflowLog, dict[str, Any]]:
+    """
+    Apply a status event on top of the previous task status. The log entry
+    is added to the session and returned with the new task status dict.
+    Events without a state keep the previous one.
+    """
+    now = _event_datetime(event, "datetime") or datetime.datetime.utcnow()
+    last_updated = _event_datetime(event, "last_updated") or now
+    message = event.get("message", "")
+    flow_run_id = event.get("flow_run_id", "")
+    state = event.get("state", "")
+    clear_log = event.get("clear", False)
+    key = event.get("key", "pipeline")
+    _type = event.get("type", "info")
+    validation_report = event.get("validation_report")
+
+    processed_fingerprint = previous.get("processed_fingerprint")
+    if clear_log:
+        previous = {}
 
-    validation_report = validation_report or previous_report
-    logs.append({"datetime": now, "message": message})
+    flow_run_id = flow_run_id or previous.get("flow_run_id", "")
+    validation = previous.get("validation")
+    if validation_report:
+        validation = reports.store(resource_id, flow_run_id, validation_report)
+        # Reports stored inline before the preflow_report table existed
+        legacy_report = None
+    else:
+        legacy_report = previous.get("validation_report")
+    fingerprint = event.get("fingerprint") or previous.get("fingerprint")
+    state_timestamp = event.get("state_timestamp") or previous.get("state_timestamp")
+    resubmit = event.get("resubmit") or previous.get("resubmit")
+    new_state = "failed" if _type == "error" else (state or previous_state)
+    if fingerprint and new_state.lower() == "completed":
+        processed_fingerprint = fingerprint
 
     value = {
         "flow_run_id": flow_run_id,
-        "logs": logs,
+        "log_since": previous.get("log_since") or now.isoformat(),
+        **({"fingerprint": fingerprint} if fingerprint else {}),
+        **({"state_timestamp": state_timestamp} if state_timestamp else {}),
+        **({"resubmit": True} if resubmit else {}),
         **(
-            {"validation_report": validation_report}
-            if validation_report and _type != "error"
+            {"processed_fingerprint": processed_fingerprint}
+            if processed_fingerprint
+            else {}
+        ),
+        # Rows written before the preflow_log table existed
+        **({"logs": previous["logs"]} if previous.get("logs") else {}),
+        **({"validation": validation} if validation else {}),
+        **(
+            {"validation_report": legacy_report}
+            if legacy_report and _type != "error"
             else {}
         ),
     }
@@ -245,59 +859,802 @@ def preflow_status_update(
     error = None
     if _type == "error":
         error = {"message": message}
-        if validation_report:
-            error["validation_report"] = validation_report
+        if legacy_report:
+            error["validation_report"] = legacy_report
+
+    if state or _type == "error":
+        runs.update(flow_run_id, new_state, now)
 
-    task_dict = {
+    entry = PreflowLog(
+        resource_id=resource_id,
+        flow_run_id=flow_run_id,
+        datetime=now,
+        type=_type,
+        message=message,
+    )
+    model.Session.add(entry)
+
+    return entry, {
         "entity_id": resource_id,
         "entity_type": "resource",
         "task_type": "preflow",
-        "state": "failed" if _type == "error" else state,
-        "last_updated": data_dict.get("last_updated", now),
+        "state": new_state,
+        "last_updated": str(last_updated),
         "key": key,
         "value": json.dumps(value),
         "error": "" if clear_log else (json.dumps(error) if error else None),
     }
 
-    result = tk.get_action("task_status_update")(context, task_dict)
-    tk.get_action("preflow_hook")(
-        context,
-        {
-            "resource_id": resource_id,
-            "flow_run_id": flow_run_id,
-        },
+
+def _superseded(previous: dict[str, Any], event: dict[str, Any]) -> bool:
+    """
+    Whether a status event belongs to an older run than the current run of
+    the resource, like the callbacks of a superseded run that is still
+    cancelling. New runs are recorded with ``clear``.
+    """
+    flow_run_id = event.get("flow_run_id")
+    return bool(
+        flow_run_id
+        and previous.get("flow_run_id")
+        and flow_run_id != previous["flow_run_id"]
+        and not event.get("clear")
+    )
+
+
+def _superseded_event(resource_id: str, event: dict[str, Any]) -> PreflowLog:
+    """
+    Record a status event of an older run in its ``preflow_run`` row and in
+    the log, leaving the task status of the current run alone.
+    """
+    now = _event_datetime(event, "datetime") or datetime.datetime.utcnow()
+    _type = event.get("type", "info")
+    runs.update(
+        event["flow_run_id"],
+        "failed" if _type == "error" else event.get("state", ""),
+        now,
+    )
+    entry = PreflowLog(
+        resource_id=resource_id,
+        flow_run_id=event["flow_run_id"],
+        datetime=now,
+        type=_type,
+        message=event.get("message", ""),
+    )
+    model.Session.add(entry)
+    return entry
+
+
+def _write_task_status(task_dict: dict[str, Any]) -> model.TaskStatus:
+    """
+    Add or update the task status row of ``task_dict`` in the session
+    without committing it, unlike ``task_status_update`` which always
+    commits.
+    """
+    task_status = (
+        model.Session.query(model.TaskStatus)
+        .filter(model.TaskStatus.entity_id == task_dict["entity_id"])
+        .filter(model.TaskStatus.task_type == task_dict["task_type"])
+        .filter(model.TaskStatus.key == task_dict["key"])
+        .first()
+    )
+    if task_status is None:
+        task_status = model.TaskStatus(
+            entity_id=task_dict["entity_id"],
+            entity_type=task_dict["entity_type"],
+            task_type=task_dict["task_type"],
+            key=task_dict["key"],
+        )
+        model.Session.add(task_status)
+    task_status.state = task_dict["state"]
+    task_status.value = task_dict["value"]
+    task_status.error = task_dict["error"]
+    task_status.last_updated = datetime.datetime.fromisoformat(
+        task_dict["last_updated"]
+    )
+    return task_status
+
+
+def preflow_status_update(
+    context: Context, data_dict: dict[str, str]
+) -> dict[str, str]:
+    """
+    Update the preflow status for a resource, appending log entries.
+
+    Log entries are inserted in the ``preflow_log`` table, the task status
+    only keeps the current flow run ID and the start of its log. Updates of
+    an older flow run than the current one are only logged.
+    """
+    resource_id = data_dict.get("resource_id")
+    key = data_dict.get("key", "pipeline")
+
+    tk.check_access("preflow_status_update", context, data_dict)
+
+    previous_state, previous = _stored_status(context, resource_id, key)
+
+    if _superseded(previous, data_dict):
+        _superseded_event(resource_id, data_dict)
+        if not context.get("defer_commit"):
+            model.Session.commit()
+        return tk.get_action("task_status_show")(
+            context, {"entity_id": resource_id, "task_type": "preflow", "key": key}
+        )
+
+    entry, task_dict = _status_event(
+        resource_id, previous_state, previous, data_dict
     )
+    flow_run_id = json.loads(task_dict["value"])["flow_run_id"]
+
+    with metrics.db_seconds.time(operation="task_status_write"):
+        result = tk.get_action("task_status_update")(context, task_dict)
+    if data_dict.get("state"):
+        cache.invalidate_flow_run(flow_run_id)
+    _publish_events(task_dict, [entry], previous_state)
+    _state_changed(context, task_dict, previous_state)
+    _release_slot(context, task_dict, previous_state)
+    if not context.get("preflow_defer_index") and _index_changed(
+        task_dict, previous_state, data_dict
+    ):
+        indexing.reindex([resource_id])
+    _resubmit_superseded(context, task_dict, previous_state)
 
     return result
 
 
-def preflow_hook(context: Context, data_dict: dict[str, str]) -> dict[str, str]:
+def preflow_status_update_batch(
+    context: Context, data_dict: dict[str, Any]
+) -> list[dict[str, Any]]:
     """
-    Preflow hook to handle resource post submission actions after prflow status update.
-    Generally used to create the views for the resource.
+    Apply several status updates, for one or more resources, at once.
+
+    The events are applied in order, in a single transaction. The task status
+    of each resource is written once and the hook runs once per resource,
+    after all its events have been applied. Events of an older flow run than
+    the current one of their resource are only logged.
+
+    :param events: List of status updates, each one accepting the same keys
+        as ``preflow_status_update``, plus an optional ISO ``datetime`` of
+        the event.
+    :type events: list of dicts
+
+    :returns: The updated task status of each resource.
+    :rtype: list of dicts
     """
+    events = data_dict.get("events")
+    if not isinstance(events, list) or not all(
+        isinstance(event, dict) and event.get("resource_id") for event in events
+    ):
+        raise tk.ValidationError(
+            {"events": ["A list of events with a resource_id is required"]}
+        )
 
+    by_resource = {}
+    for event in events:
+        by_resource.setdefault(event["resource_id"], []).append(event)
+
+    for resource_id in by_resource:
+        tk.check_access(
+            "preflow_status_update", context, {"resource_id": resource_id}
+        )
+
+    updates = []
+    released = False
+    reindex = []
+    for resource_id, resource_events in by_resource.items():
+        key = resource_events[0].get("key", "pipeline")
+        initial_state, previous = _stored_status(context, resource_id, key)
+        state, entries, task_dict = initial_state, [], None
+        for event in resource_events:
+            if _superseded(previous, event):
+                _superseded_event(resource_id, event)
+                continue
+            entry, task_dict = _status_event(resource_id, state, previous, event)
+            state, previous = task_dict["state"], json.loads(task_dict["value"])
+            entries.append(entry)
+        if task_dict is None:
+            continue
+        updates.append((task_dict, entries, initial_state))
+        with metrics.db_seconds.time(operation="task_status_write"):
+            _write_task_status(task_dict)
+
+    with metrics.db_seconds.time(operation="commit"):
+        try:
+            model.Session.commit()
+        except sa.exc.SQLAlchemyError:
+            model.Session.rollback()
+            raise
+
+    results = []
+    for task_dict, entries, initial_state in updates:
+        flow_run_id = json.loads(task_dict["value"])["flow_run_id"]
+        if task_dict["state"]:
+            cache.invalidate_flow_run(flow_run_id)
+        _publish_events(task_dict, entries, initial_state)
+        _state_changed(context, task_dict, initial_state)
+        resource_id = task_dict["entity_id"]
+        if _index_changed(task_dict, initial_state, *by_resource[resource_id]):
+            reindex.append(resource_id)
+        released = released or _finished(task_dict, initial_state)
+        _resubmit_superseded(context, task_dict, initial_state)
+        results.append(
+            tk.get_action("task_status_show")(
+                context,
+                {
+                    "entity_id": task_dict["entity_id"],
+                    "task_type": "preflow",
+                    "key": task_dict["key"],
+                },
+            )
+        )
+
+    indexing.reindex(reindex)
+    if released and scheduler.is_enabled():
+        _dispatch(context)
+
+    return results
+
+
+@tk.side_effect_free
+def preflow_log_list(context: Context, data_dict: dict[str, Any]) -> dict[str, Any]:
+    """
+    List the log entries of the pipeline run of a resource, oldest first.
+
+    :param resource_id: ID of the resource.
+    :type resource_id: str
+    :param flow_run_id: Prefect flow run ID, defaults to the current run.
+    :type flow_run_id: str
+    :param offset: Number of entries to skip (optional, default: 0).
+    :type offset: int
+    :param limit: Maximum number of entries to return (optional, default: 100).
+    :type limit: int
+
+    :returns: The total number of entries and the requested page of entries.
+    :rtype: dict
+    """
     res_id = tk.get_or_bust(data_dict, "resource_id")
 
-    tk.check_access("preflow_submit", context, data_dict)
+    tk.check_access("preflow_status", context, data_dict)
 
-    status = tk.get_action("preflow_status")(
-        context,
-        {"id": res_id, "flow_run_id": data_dict.get("flow_run_id", "")},
+    offset = _int_param(data_dict, "offset", 0, minimum=0)
+    limit = _int_param(data_dict, "limit", 100, minimum=1, maximum=1000)
+
+    try:
+        task_status = p.toolkit.get_action("task_status_show")(
+            context, {"entity_id": res_id, "task_type": "preflow", "key": "pipeline"}
+        )
+        value = json.loads(task_status.get("value") or "{}")
+    except (tk.ObjectNotFound, ValueError):
+        value = {}
+
+    flow_run_id = data_dict.get("flow_run_id", value.get("flow_run_id", ""))
+
+    query = (
+        model.Session.query(PreflowLog)
+        .filter(PreflowLog.resource_id == res_id)
+        .filter(PreflowLog.flow_run_id == flow_run_id)
+    )
+    if not data_dict.get("flow_run_id") and value.get("log_since"):
+        query = query.filter(
+            PreflowLog.datetime
+            >= datetime.datetime.fromisoformat(value["log_since"])
+        )
+
+    count = query.count()
+    if not count and value.get("logs"):
+        # Rows written before the preflow_log table existed
+        logs = value["logs"]
+        return {"count": len(logs), "logs": logs[offset : offset + limit]}
+
+    logs = (
+        query.order_by(PreflowLog.datetime, PreflowLog.id)
+        .offset(offset)
+        .limit(limit)
+        .all()
     )
+    return {"count": count, "logs": [entry.as_dict() for entry in logs]}
 
-    if status.get("state", "").lower() not in ["completed"]:
-        resource_dict = p.toolkit.get_action("resource_show")(context, {"id": res_id})
 
-        dataset_dict = p.toolkit.get_action("package_show")(
-            context, {"id": resource_dict["package_id"]}
+@tk.side_effect_free
+def preflow_run_list(context: Context, data_dict: dict[str, Any]) -> dict[str, Any]:
+    """
+    List the flow runs submitted for a resource or to a deployment, most
+    recent first.
+
+    :param resource_id: ID of the resource.
+    :type resource_id: str
+    :param deployment_id: Prefect deployment ID, sysadmins only.
+    :type deployment_id: str
+    :param state: Only list the runs in this state (optional).
+    :type state: str
+    :param offset: Number of runs to skip (optional, default: 0).
+    :type offset: int
+    :param limit: Maximum number of runs to return (optional, default: 20,
+        max: 1000).
+    :type limit: int
+
+    :returns: The total number of runs and the requested page of runs.
+    :rtype: dict
+    """
+    if not data_dict.get("resource_id") and not data_dict.get("deployment_id"):
+        raise tk.ValidationError(
+            {"resource_id": ["One of resource_id or deployment_id is required"]}
         )
 
-        p.toolkit.get_action("resource_create_default_resource_views")(
-            context,
+    tk.check_access("preflow_run_list", context, data_dict)
+
+    offset = _int_param(data_dict, "offset", 0, minimum=0)
+    limit = _int_param(data_dict, "limit", 20, minimum=1, maximum=1000)
+
+    query = model.Session.query(PreflowRun)
+    if data_dict.get("resource_id"):
+        query = query.filter(PreflowRun.resource_id == data_dict["resource_id"])
+    if data_dict.get("deployment_id"):
+        query = query.filter(PreflowRun.deployment_id == data_dict["deployment_id"])
+    if data_dict.get("state"):
+        query = query.filter(PreflowRun.state == data_dict["state"].lower())
+
+    return {
+        "count": query.count(),
+        "runs": [
+            run.as_dict()
+            for run in query.order_by(PreflowRun.submitted_at.desc())
+            .offset(offset)
+            .limit(limit)
+        ],
+    }
+
+
+def _publish_events(
+    task_dict: dict[str, Any], entries: list[PreflowLog], previous_state: str
+) -> None:
+    """
+    Push the new log entries, and the new state if it changed, to the live
+    viewers of the resource pipeline.
+    """
+    resource_id = task_dict["entity_id"]
+    for entry in entries:
+        events.publish(resource_id, {"event": "log", **entry.as_dict()})
+
+    state = (task_dict["state"] or "").lower()
+    if state != previous_state:
+        events.publish(
+            resource_id,
             {
-                "resource": resource_dict,
-                "package": dataset_dict,
-                "create_datastore_views": True,
+                "event": "state",
+                "state": state,
+                "last_updated": task_dict["last_updated"],
+                "terminal": state not in cache.IN_FLIGHT_STATES,
             },
         )
+
+
+@tk.side_effect_free
+def preflow_validation_report_show(
+    context: Context, data_dict: dict[str, Any]
+) -> dict[str, Any]:
+    """
+    Return a stored validation report, one part at a time.
+
+    Without ``task``, the report is returned without its errors, with the
+    number of error pages of each task in ``pages``. With ``task``, a page of
+    errors of that task is returned.
+
+    :param resource_id: ID of the resource.
+    :type resource_id: str
+    :param flow_run_id: Prefect flow run ID, defaults to the latest report.
+    :type flow_run_id: str
+    :param task: Index of the report task (optional).
+    :type task: int
+    :param page: Index of the page of errors of the task (optional, default: 0).
+    :type page: int
+
+    :raises NotFound: If no report is stored for the resource.
+    """
+    res_id = tk.get_or_bust(data_dict, "resource_id")
+
+    tk.check_access("preflow_status", context, data_dict)
+
+    report = reports.get(res_id, data_dict.get("flow_run_id"))
+    if not report:
+        raise tk.ObjectNotFound(tk._("Validation report not found"))
+
+    if data_dict.get("task") in (None, ""):
+        return reports.header(report)
+
+    task = tk.asint(data_dict["task"])
+    page = tk.asint(data_dict.get("page") or 0)
+    return {
+        "task": task,
+        "page": page,
+        "errors": reports.errors(report, task, page),
+    }
+
+
+@tk.side_effect_free
+def preflow_validation_error_list(
+    context: Context, data_dict: dict[str, Any]
+) -> dict[str, Any]:
+    """
+    List the errors of a stored validation report, a page at a time.
+
+    :param resource_id: ID of the resource.
+    :type resource_id: str
+    :param flow_run_id: Prefect flow run ID, defaults to the latest report.
+    :type flow_run_id: str
+    :param task: Only list the errors of this report task index (optional).
+    :type task: int
+    :param type: Only list the errors of these types (optional).
+    :type type: list of strings
+    :param row_from: Only list the errors of this row number and after
+        (optional).
+    :type row_from: int
+    :param row_to: Only list the errors of this row number and before
+        (optional).
+    :type row_to: int
+    :param cursor: The ``next`` cursor of the previous page (optional).
+    :type cursor: str
+    :param limit: Maximum number of errors to return (optional, default: 100,
+        max: 1000).
+    :type limit: int
+
+    :returns: The ``errors``, each one with the index of its ``task``, and
+        the ``next`` cursor, None after the last page.
+    :rtype: dict
+    """
+    res_id = tk.get_or_bust(data_dict, "resource_id")
+
+    tk.check_access("preflow_status", context, data_dict)
+
+    report = reports.get(res_id, data_dict.get("flow_run_id"))
+    if not report:
+        raise tk.ObjectNotFound(tk._("Validation report not found"))
+
+    found, cursor = reports.filter_errors(
+        report,
+        task_index=_int_param(data_dict, "task"),
+        types=tk.aslist(data_dict.get("type") or []),
+        row_from=_int_param(data_dict, "row_from"),
+        row_to=_int_param(data_dict, "row_to"),
+        cursor=data_dict.get("cursor") or None,
+        limit=_int_param(data_dict, "limit", 100, minimum=1, maximum=1000),
+    )
+    return {"errors": found, "next": cursor}
+
+
+def preflow_reconcile(context: Context, data_dict: dict[str, Any]) -> dict[str, Any]:
+    """
+    Synchronise the pipelines in progress with the state of their Prefect
+    flow runs.
+
+    All the task statuses that are not in a terminal state are checked with
+    batched ``/flow_runs/filter`` requests and updated in one transaction.
+    Runs that Prefect does not know about, and runs still waiting to start
+    after ``ckanext.preflow.stale_seconds``, are marked as failed.
+
+    :returns: The number of ``checked``, ``updated``, ``missing`` and
+        ``stale`` pipelines.
+    :rtype: dict
+
+    :raises ValidationError: If Prefect could not be reached. Nothing is
+        updated then.
+    """
+    tk.check_access("preflow_reconcile", context, data_dict)
+
+    stale_seconds = tk.asint(tk.config.get("ckanext.preflow.stale_seconds", 86400))
+    now = datetime.datetime.utcnow()
+
+    rows = (
+        model.Session.query(model.TaskStatus)
+        .filter(model.TaskStatus.task_type == "preflow")
+        .filter(model.TaskStatus.key == "pipeline")
+        .filter(
+            sa.func.lower(model.TaskStatus.state).notin_(
+                cache.TERMINAL_STATES + ["complete"]
+            )
+        )
+        .all()
+    )
+    pipelines = []
+    for row in rows:
+        flow_run_id = _flow_run_id({"entity_id": row.entity_id, "value": row.value})
+        pipelines.append(
+            (row.entity_id, (row.state or "").lower(), row.last_updated, flow_run_id)
+        )
+
+    flow_run_ids = sorted({pipeline[3] for pipeline in pipelines if pipeline[3]})
+    flow_runs = {}
+    if flow_run_ids:
+        try:
+            for run in get_client().filter_flow_runs(flow_run_ids):
+                flow_runs[run["id"]] = run
+        except requests.RequestException as e:
+            # Without the runs, every pipeline would look missing
+            log.error("Failed to fetch Prefect flow runs: %s", e)
+            raise tk.ValidationError(
+                {"prefect": [f"Failed to fetch Prefect flow runs: {e}"]}
+            )
+
+    result = {"checked": len(pipelines), "updated": 0, "missing": 0, "stale": 0}
+    updates = []
+    for resource_id, stored_state, last_updated, flow_run_id in pipelines:
+        age = (now - last_updated).total_seconds() if last_updated else 0
+        run = flow_runs.get(flow_run_id)
+        if run is None:
+            if flow_run_id or age > stale_seconds:
+                result["missing"] += 1
+                updates.append(
+                    {
+                        "resource_id": resource_id,
+                        "type": "error",
+                        "message": f"Prefect flow run {flow_run_id} was not found",
+                    }
+                )
+            continue
+
+        cache.set_flow_run(flow_run_id, run)
+        state = (run.get("state") or {}).get("type", "").lower()
+        if state in ["scheduled", "pending"] and age > stale_seconds:
+            result["stale"] += 1
+            updates.append(
+                {
+                    "resource_id": resource_id,
+                    "type": "error",
+                    "message": f"Prefect flow run {flow_run_id} did not start "
+                    f"after {int(age)} seconds",
+                }
+            )
+        elif state in ["failed", "crashed"]:
+            updates.append(
+                {
+                    "resource_id": resource_id,
+                    "type": "error",
+                    "message": f"Prefect flow run {flow_run_id} is {state}",
+                }
+            )
+        elif state and state != stored_state:
+            updates.append(
+                {
+                    "resource_id": resource_id,
+                    "state": state,
+                    "message": f"Prefect flow run {flow_run_id} is {state}",
+                }
+            )
+
+    if updates:
+        tk.get_action("preflow_status_update_batch")(context, {"events": updates})
+    result["updated"] = len(updates)
+
+    log.info(
+        "Reconciled %s pipelines: %s updated, %s missing, %s stale",
+        result["checked"],
+        result["updated"],
+        result["missing"],
+        result["stale"],
+    )
+    return result
+
+
+def _pipelines_for_flow_runs(
+    flow_run_ids: list[str],
+) -> dict[str, tuple[str, dict[str, Any]]]:
+    """
+    Return the resource ID and the parsed value of the pipelines whose
+    current flow run is one of ``flow_run_ids``, keyed by flow run ID.
+    """
+    resource_ids = runs.resources(flow_run_ids)
+    if not resource_ids:
+        return {}
+    rows = (
+        model.Session.query(model.TaskStatus.entity_id, model.TaskStatus.value)
+        .filter(model.TaskStatus.entity_id.in_(set(resource_ids.values())))
+        .filter(model.TaskStatus.task_type == "preflow")
+        .filter(model.TaskStatus.key == "pipeline")
+    )
+    pipelines = {}
+    for resource_id, value in rows:
+        try:
+            value = json.loads(value or "{}")
+        except ValueError:
+            continue
+        if resource_ids.get(value.get("flow_run_id")) == resource_id:
+            pipelines[value["flow_run_id"]] = (resource_id, value)
+    return pipelines
+
+
+def preflow_webhook(context: Context, data_dict: dict[str, Any]) -> dict[str, Any]:
+    """
+    Apply the flow run state changes pushed by Prefect.
+
+    Events are matched to the resource whose current run they belong to and
+    applied through ``preflow_status_update_batch``. Events of older runs,
+    and events older than the last state applied to the run, are ignored, so
+    redelivered and out of order events are harmless.
+
+    :param events: List of events, each one with the ``flow_run_id``, the
+        Prefect ``state`` type, the ISO ``occurred`` timestamp and optionally
+        a ``message`` and a ``state_name``, see ``webhooks.parse``.
+    :type events: list of dicts
+
+    :returns: The number of ``received``, ``applied`` and ``ignored`` events.
+    :rtype: dict
+    """
+    tk.check_access("preflow_webhook", context, data_dict)
+
+    received = data_dict.get("events")
+    if not isinstance(received, list) or not all(
+        isinstance(event, dict)
+        and event.get("flow_run_id")
+        and event.get("state")
+        and webhooks.parse_datetime(event.get("occurred"))
+        for event in received
+    ):
+        raise tk.ValidationError(
+            {
+                "events": [
+                    "A list of events with a flow_run_id, state and occurred "
+                    "timestamp is required"
+                ]
+            }
+        )
+
+    pipelines = _pipelines_for_flow_runs(
+        sorted({event["flow_run_id"] for event in received})
+    )
+
+    applied = {}
+    updates = []
+    for event in sorted(received, key=lambda e: webhooks.parse_datetime(e["occurred"])):
+        flow_run_id = event["flow_run_id"]
+        if flow_run_id not in pipelines:
+            continue
+        resource_id, value = pipelines[flow_run_id]
+        occurred = webhooks.parse_datetime(event["occurred"])
+        last = applied.get(flow_run_id) or webhooks.parse_datetime(
+            value.get("state_timestamp")
+        )
+        if last and occurred <= last:
+            continue
+        applied[flow_run_id] = occurred
+
+        state = event["state"].lower()
+        update = {
+            "resource_id": resource_id,
+            "flow_run_id": flow_run_id,
+            "datetime": occurred.isoformat(),
+            "state_timestamp": occurred.isoformat(),
+            "message": event.get("message")
+            or f"Prefect flow run {flow_run_id} is {event.get('state_name') or state}",
+        }
+        if state in ["failed", "crashed"]:
+            update["type"] = "error"
+        else:
+            update["state"] = state
+        updates.append(update)
+
+    if updates:
+        tk.get_action("preflow_status_update_batch")(context, {"events": updates})
+
+    log.info("Applied %s of %s Prefect webhook events", len(updates), len(received))
+    return {
+        "received": len(received),
+        "applied": len(updates),
+        "ignored": len(received) - len(updates),
+    }
+
+
+def _finished(task_dict: dict[str, Any], previous_state: str) -> bool:
+    state = (task_dict["state"] or "").lower()
+    return state != previous_state and state in cache.TERMINAL_STATES
+
+
+def _index_changed(
+    task_dict: dict[str, Any], previous_state: str, *events: dict[str, Any]
+) -> bool:
+    """
+    Whether the indexed pipeline fields of the dataset changed: the state
+    or the validity of the resource.
+    """
+    state = (task_dict["state"] or "").lower()
+    return state != previous_state or any(
+        event.get("validation_report") for event in events
+    )
+
+
+def _release_slot(
+    context: Context, task_dict: dict[str, Any], previous_state: str
+) -> None:
+    """
+    Let the scheduler submit the next queued resource when a run finishes.
+    """
+    if scheduler.is_enabled() and _finished(task_dict, previous_state):
+        _dispatch(context)
+
+
+def _resubmit_superseded(
+    context: Context, task_dict: dict[str, Any], previous_state: str
+) -> None:
+    """
+    Submit the latest version of a resource that was queued behind the run
+    that just finished.
+    """
+    if not _finished(task_dict, previous_state):
+        return
+    if not json.loads(task_dict["value"]).get("resubmit"):
+        return
+
+    resource_id = task_dict["entity_id"]
+    if scheduler.is_enabled():
+        tk.get_action("preflow_enqueue")(
+            dict(context, ignore_auth=True), {"resource_id": resource_id}
+        )
+    elif jobs.is_async():
+        jobs.enqueue_submit(resource_id)
+    else:
+        submit_context = dict(context, ignore_auth=True)
+        resource_dict = tk.get_action("resource_show")(
+            submit_context, {"id": resource_id}
+        )
+        tk.get_action("preflow_submit")(submit_context, resource_dict)
+
+
+def _hook_states() -> set[str]:
+    states = set()
+    for plugin in p.PluginImplementations(IPreflowHook):
+        states.update(state.lower() for state in plugin.preflow_hook_states())
+    return states
+
+
+def _state_changed(
+    context: Context, task_dict: dict[str, Any], previous_state: str
+) -> None:
+    """
+    Run the hook if the state just written differs from the previous one and
+    some plugin subscribed to it.
+    """
+    state = (task_dict["state"] or "").lower()
+    if state == previous_state or state not in _hook_states():
+        return
+
+    tk.get_action("preflow_hook")(
+        context,
+        {
+            "resource_id": task_dict["entity_id"],
+            "flow_run_id": json.loads(task_dict["value"])["flow_run_id"],
+            "state": state,
+            "previous_state": previous_state,
+        },
+    )
+
+
+def preflow_hook(context: Context, data_dict: dict[str, str]) -> dict[str, str]:
+    """
+    Notify the ``IPreflowHook`` plugins subscribed to the new pipeline state
+    of a resource. Called by ``preflow_status_update`` on state transitions.
+
+    :param resource_id: ID of the resource.
+    :type resource_id: str
+    :param state: The new state, defaults to the stored one.
+    :type state: str
+    :param previous_state: The state before the transition (optional).
+    :type previous_state: str
+    :param flow_run_id: The Prefect flow run ID (optional).
+    :type flow_run_id: str
+    """
+
+    res_id = tk.get_or_bust(data_dict, "resource_id")
+
+    tk.check_access("preflow_submit", context, data_dict)
+
+    state = data_dict.get("state")
+    if not state:
+        state, _ = _stored_status(context, res_id, "pipeline")
+
+    hook_data = {
+        "resource_id": res_id,
+        "flow_run_id": data_dict.get("flow_run_id", ""),
+        "state": state.lower(),
+        "previous_state": (data_dict.get("previous_state") or "").lower(),
+    }
+    for plugin in p.PluginImplementations(IPreflowHook):
+        subscribed = [state.lower() for state in plugin.preflow_hook_states()]
+        if hook_data["state"] in subscribed:
+            plugin.after_preflow_state_change(context, hook_data)
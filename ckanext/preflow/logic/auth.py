@@ -2,6 +2,7 @@ from ckan.types import Any, AuthResult, Context
 
 import ckan.plugins as p
 import ckan.plugins.toolkit as tk
+from ckan import authz
 
 import ckanext.datastore.logic.auth as auth
 
@@ -13,6 +14,35 @@ def preflow_submit(context: Context, data_dict: dict[str, Any]) -> AuthResult:
     return auth.datastore_auth(context, data_dict)
 
 
+def preflow_submit_bulk(context: Context, data_dict: dict[str, Any]) -> AuthResult:
+    """
+    Only sysadmins can submit datasets, organizations or searches in bulk.
+    """
+    return {"success": False}
+
+
+def preflow_reconcile(context: Context, data_dict: dict[str, Any]) -> AuthResult:
+    """
+    Only sysadmins can reconcile the pipelines with Prefect.
+    """
+    return {"success": False}
+
+
+def preflow_dispatch(context: Context, data_dict: dict[str, Any]) -> AuthResult:
+    """
+    Only sysadmins can dispatch the submission queue.
+    """
+    return {"success": False}
+
+
+def preflow_webhook(context: Context, data_dict: dict[str, Any]) -> AuthResult:
+    """
+    Only sysadmins can apply Prefect events directly, the webhook endpoint
+    checks the request signature instead.
+    """
+    return {"success": False}
+
+
 @tk.side_effect_free
 def preflow_status(context: Context, data_dict: dict[str, Any]) -> AuthResult:
     """
@@ -21,6 +51,37 @@ def preflow_status(context: Context, data_dict: dict[str, Any]) -> AuthResult:
     return auth.datastore_auth(context, data_dict, "resource_show")
 
 
+@tk.side_effect_free
+def preflow_run_list(context: Context, data_dict: dict[str, Any]) -> AuthResult:
+    """
+    The runs of a resource can be listed by users who can see it, the runs
+    of a whole deployment only by sysadmins.
+    """
+    if data_dict.get("deployment_id"):
+        return {"success": False}
+    return auth.datastore_auth(context, data_dict, "resource_show")
+
+
+@tk.side_effect_free
+def preflow_resource_context(
+    context: Context, data_dict: dict[str, Any]
+) -> AuthResult:
+    """
+    Check auth for the resource context of the flows.
+    """
+    return auth.datastore_auth(context, data_dict, "resource_show")
+
+
+@tk.side_effect_free
+def preflow_status_bulk(context: Context, data_dict: dict[str, Any]) -> AuthResult:
+    """
+    Check auth for the bulk Prefect flow status action.
+    """
+    return authz.is_authorized(
+        "package_show", context, {"id": data_dict.get("package_id")}
+    )
+
+
 @tk.side_effect_free
 def preflow_status_update(context: Context, data_dict: dict[str, Any]) -> AuthResult:
     """
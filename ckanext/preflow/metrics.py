@@ -0,0 +1,347 @@
+from typing import Any, Callable, Iterator, Optional
+
+import contextlib
+import json
+import logging
+import re
+import threading
+import time
+
+import sqlalchemy as sa
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+from ckan.common import request
+from ckan.lib.redis import connect_to_redis
+
+from ckanext.preflow.model import PreflowQueue
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RUN_BUCKETS = (10, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400)
+
+_UUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+_registry: list["_Metric"] = []
+_collectors: list[Callable[[], list[str]]] = []
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class MemoryStore(object):
+    """
+    Metric values of the current process only.
+    """
+
+    def __init__(self):
+        self._data: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, key: str, amounts: dict[str, float]) -> None:
+        with self._lock:
+            values = self._data.setdefault(key, {})
+            for field, amount in amounts.items():
+                values[field] = values.get(field, 0) + amount
+
+    def get(self, key: str) -> dict[str, float]:
+        with self._lock:
+            return dict(self._data.get(key, {}))
+
+
+class RedisStore(object):
+    """
+    Metric values shared by all the CKAN and worker processes, stored in a
+    hash per metric in the CKAN Redis.
+    """
+
+    prefix = "ckanext-preflow:metrics:"
+
+    def __init__(self, connection):
+        self.redis = connection
+
+    def incr(self, key: str, amounts: dict[str, float]) -> None:
+        pipeline = self.redis.pipeline(transaction=False)
+        for field, amount in amounts.items():
+            pipeline.hincrbyfloat(self.prefix + key, field, amount)
+        pipeline.execute()
+
+    def get(self, key: str) -> dict[str, float]:
+        return {
+            field.decode() if isinstance(field, bytes) else field: float(value)
+            for field, value in self.redis.hgetall(self.prefix + key).items()
+        }
+
+
+def _create_store():
+    backend = tk.config.get("ckanext.preflow.metrics_backend", "auto").lower()
+
+    if backend in ("auto", "redis") and tk.config.get("ckan.redis.url"):
+        try:
+            connection = connect_to_redis()
+            connection.ping()
+            return RedisStore(connection)
+        except Exception as e:
+            log.warning("Redis is not available for the Preflow metrics: %s", e)
+
+    return MemoryStore()
+
+
+def get_store():
+    """
+    Return the metrics store, creating it on first use.
+
+    The backend is chosen with ``ckanext.preflow.metrics_backend``: ``auto``
+    (the default) uses the CKAN Redis when one is configured, so the metrics
+    of all the processes are aggregated, and the memory of each process
+    otherwise. ``redis`` and ``memory`` force a backend.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _create_store()
+    return _store
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _field(*parts: str) -> str:
+    return json.dumps(parts)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        _registry.append(self)
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _incr(self, amounts: dict[str, float]) -> None:
+        # Like the live events, metrics never fail the request
+        try:
+            get_store().incr(self.name, amounts)
+        except Exception as e:
+            log.warning("Failed to record the Preflow metric %s: %s", self.name, e)
+
+    def _stored(self) -> dict[tuple[str, ...], float]:
+        return {
+            tuple(json.loads(field)): value
+            for field, value in get_store().get(self.name).items()
+        }
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        self._incr({_field(*self._key(labels)): amount})
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, value in sorted(self._stored().items()):
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, *args: Any, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs: Any
+    ):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        # Cumulative bucket counts, sum and count of the label values
+        amounts = {
+            _field(*key, str(bound)): 1 for bound in self.buckets if value <= bound
+        }
+        amounts[_field(*key, "sum")] = value
+        amounts[_field(*key, "count")] = 1
+        self._incr(amounts)
+
+    @contextlib.contextmanager
+    def time(self, **labels: Any) -> Iterator[dict[str, Any]]:
+        """
+        Observe the duration of the block. Labels can be changed from the
+        block through the yielded dict.
+        """
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(elapsed, **labels)
+            record_timing(self.name, elapsed, labels)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        values: dict[tuple[str, ...], dict[str, float]] = {}
+        for field, value in self._stored().items():
+            values.setdefault(field[:-1], {})[field[-1]] = value
+        for key, parts in sorted(values.items()):
+            count = int(parts.get("count", 0))
+            for bound in self.buckets:
+                labels = _labels(self.label_names, key, f'le="{bound}"')
+                lines.append(
+                    f"{self.name}_bucket{labels} {int(parts.get(str(bound), 0))}"
+                )
+            labels = _labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {parts.get('sum', 0.0)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def collector(func: Callable[[], list[str]]) -> Callable[[], list[str]]:
+    """
+    Register a function returning metric lines computed at scrape time.
+    """
+    _collectors.append(func)
+    return func
+
+
+def render() -> str:
+    """
+    Prometheus text exposition of the metrics.
+    """
+    lines = []
+    for metric in _registry:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            log.warning("Failed to read the Preflow metric %s: %s", metric.name, e)
+    for func in _collectors:
+        try:
+            lines.extend(func())
+        except Exception as e:
+            log.warning("Failed to collect Preflow metrics: %s", e)
+    return "\n".join(lines) + "\n"
+
+
+def endpoint(path: str) -> str:
+    """
+    Prefect API path with the IDs replaced, to keep the label cardinality
+    bounded.
+    """
+    return _UUID.sub("{id}", path)
+
+
+def timing_log_enabled() -> bool:
+    return tk.asbool(tk.config.get("ckanext.preflow.timing_log", False))
+
+
+def record_timing(
+    name: str, elapsed: float, labels: Optional[dict[str, Any]] = None
+) -> None:
+    """
+    Add a timing to the summary logged at the end of the current request,
+    when ``ckanext.preflow.timing_log`` is enabled.
+    """
+    if not timing_log_enabled():
+        return
+    try:
+        timings = tk.g.preflow_timings
+    except AttributeError:
+        timings = tk.g.preflow_timings = {}
+    except RuntimeError:
+        # Outside of a request, e.g. in a background job
+        log.info("%s %s took %.3fs", name, labels or {}, elapsed)
+        return
+    count, total = timings.get(name, (0, 0.0))
+    timings[name] = (count + 1, total + elapsed)
+
+
+def log_request_timings(response: Any) -> Any:
+    """
+    ``after_app_request`` handler logging the timings of the request.
+    """
+    timings = getattr(tk.g, "preflow_timings", None)
+    if timings:
+        log.info(
+            "%s %s: %s",
+            request.method,
+            request.path,
+            ", ".join(
+                f"{name} {count}x {total:.3f}s"
+                for name, (count, total) in sorted(timings.items())
+            ),
+        )
+    return response
+
+
+prefect_request_seconds = Histogram(
+    "preflow_prefect_request_seconds",
+    "Duration of the Prefect API requests",
+    ("method", "endpoint", "status"),
+)
+db_seconds = Histogram(
+    "preflow_db_seconds",
+    "Duration of the task status reads and writes",
+    ("operation",),
+)
+submissions_total = Counter(
+    "preflow_submissions_total",
+    "Resource submissions by result",
+    ("result",),
+)
+badge_calls_total = Counter(
+    "preflow_badge_calls_total",
+    "Pipeline badges rendered, by source of the status",
+    ("source",),
+)
+run_duration_seconds = Histogram(
+    "preflow_run_duration_seconds",
+    "Time from the submission of a flow run to its end",
+    ("state",),
+    buckets=RUN_BUCKETS,
+)
+
+
+@collector
+def _pipelines() -> list[str]:
+    """
+    Number of pipelines by state and length of the scheduler queue.
+    """
+    rows = (
+        model.Session.query(
+            sa.func.lower(model.TaskStatus.state), sa.func.count(model.TaskStatus.id)
+        )
+        .filter(model.TaskStatus.task_type == "preflow")
+        .filter(model.TaskStatus.key == "pipeline")
+        .group_by(sa.func.lower(model.TaskStatus.state))
+    )
+    lines = [
+        "# HELP preflow_pipelines Resource pipelines by current state",
+        "# TYPE preflow_pipelines gauge",
+    ]
+    for state, count in rows:
+        lines.append(f'preflow_pipelines{{state="{_escape(state or "")}"}} {count}')
+    lines += [
+        "# HELP preflow_queue_length Resources waiting for the scheduler",
+        "# TYPE preflow_queue_length gauge",
+        f"preflow_queue_length {model.Session.query(PreflowQueue).count()}",
+    ]
+    return lines
@@ -0,0 +1,37 @@
+"""Create preflow_queue table
+
+Revision ID: 2d9f6b8e1a47
+Revises: e71c04b9a5d3
+Create Date: 2026-10-16 23:41:08.527614
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "2d9f6b8e1a47"
+down_revision = "e71c04b9a5d3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "preflow_queue",
+        sa.Column("resource_id", sa.UnicodeText, primary_key=True),
+        sa.Column("organization_id", sa.UnicodeText, nullable=False, server_default=""),
+        sa.Column("priority", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("force", sa.Boolean, nullable=False, server_default=sa.false()),
+        sa.Column("enqueued_at", sa.DateTime, nullable=False),
+    )
+    op.create_index(
+        "idx_preflow_queue_org_priority",
+        "preflow_queue",
+        ["organization_id", "priority"],
+    )
+
+
+def downgrade():
+    op.drop_index("idx_preflow_queue_org_priority", "preflow_queue")
+    op.drop_table("preflow_queue")
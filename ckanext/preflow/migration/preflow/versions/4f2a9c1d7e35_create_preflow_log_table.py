@@ -0,0 +1,38 @@
+"""Create preflow_log table
+
+Revision ID: 4f2a9c1d7e35
+Revises:
+Create Date: 2026-10-16 09:12:41.318274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "4f2a9c1d7e35"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "preflow_log",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("resource_id", sa.UnicodeText, nullable=False),
+        sa.Column("flow_run_id", sa.UnicodeText, nullable=False, server_default=""),
+        sa.Column("datetime", sa.DateTime, nullable=False),
+        sa.Column("type", sa.UnicodeText, nullable=False, server_default="info"),
+        sa.Column("message", sa.UnicodeText),
+    )
+    op.create_index(
+        "idx_preflow_log_resource_run_datetime",
+        "preflow_log",
+        ["resource_id", "flow_run_id", "datetime"],
+    )
+
+
+def downgrade():
+    op.drop_index("idx_preflow_log_resource_run_datetime", "preflow_log")
+    op.drop_table("preflow_log")
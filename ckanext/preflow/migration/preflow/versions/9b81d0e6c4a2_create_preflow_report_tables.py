@@ -0,0 +1,52 @@
+"""Create preflow_report tables
+
+Revision ID: 9b81d0e6c4a2
+Revises: 4f2a9c1d7e35
+Create Date: 2026-10-16 14:37:05.902611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9b81d0e6c4a2"
+down_revision = "4f2a9c1d7e35"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "preflow_report",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("resource_id", sa.UnicodeText, nullable=False),
+        sa.Column("flow_run_id", sa.UnicodeText, nullable=False, server_default=""),
+        sa.Column("created", sa.DateTime, nullable=False),
+        sa.Column("summary", sa.UnicodeText, nullable=False),
+        sa.Column("header", sa.LargeBinary, nullable=False),
+    )
+    op.create_index(
+        "idx_preflow_report_resource_run",
+        "preflow_report",
+        ["resource_id", "flow_run_id"],
+    )
+    op.create_table(
+        "preflow_report_chunk",
+        sa.Column(
+            "report_id",
+            sa.Integer,
+            sa.ForeignKey("preflow_report.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("task_index", sa.Integer, primary_key=True),
+        sa.Column("chunk_index", sa.Integer, primary_key=True),
+        sa.Column("error_count", sa.Integer, nullable=False),
+        sa.Column("data", sa.LargeBinary, nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table("preflow_report_chunk")
+    op.drop_index("idx_preflow_report_resource_run", "preflow_report")
+    op.drop_table("preflow_report")
@@ -0,0 +1,28 @@
+"""Add row bounds and error types to preflow_report_chunk
+
+Revision ID: c3e57a2f8d14
+Revises: 9b81d0e6c4a2
+Create Date: 2026-10-16 16:05:52.447130
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c3e57a2f8d14"
+down_revision = "9b81d0e6c4a2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("preflow_report_chunk", sa.Column("row_start", sa.Integer))
+    op.add_column("preflow_report_chunk", sa.Column("row_end", sa.Integer))
+    op.add_column("preflow_report_chunk", sa.Column("types", sa.UnicodeText))
+
+
+def downgrade():
+    op.drop_column("preflow_report_chunk", "types")
+    op.drop_column("preflow_report_chunk", "row_end")
+    op.drop_column("preflow_report_chunk", "row_start")
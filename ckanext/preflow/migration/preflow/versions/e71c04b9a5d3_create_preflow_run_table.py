@@ -0,0 +1,97 @@
+"""Create preflow_run table
+
+Revision ID: e71c04b9a5d3
+Revises: c3e57a2f8d14
+Create Date: 2026-10-16 23:12:40.318265
+
+"""
+import datetime
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e71c04b9a5d3"
+down_revision = "c3e57a2f8d14"
+branch_labels = None
+depends_on = None
+
+# The terminal states of ckanext.preflow.cache, and the "complete" state of
+# datastore-only resources
+FINISHED_STATES = ("completed", "failed", "cancelled", "crashed", "complete")
+
+
+def upgrade():
+    preflow_run = op.create_table(
+        "preflow_run",
+        sa.Column("flow_run_id", sa.UnicodeText, primary_key=True),
+        sa.Column("resource_id", sa.UnicodeText, nullable=False),
+        sa.Column("deployment_id", sa.UnicodeText),
+        sa.Column("submitted_at", sa.DateTime, nullable=False),
+        sa.Column("started_at", sa.DateTime),
+        sa.Column("finished_at", sa.DateTime),
+        sa.Column("state", sa.UnicodeText, nullable=False, server_default="pending"),
+        sa.Column("fingerprint", sa.UnicodeText),
+    )
+    op.create_index(
+        "idx_preflow_run_resource_submitted",
+        "preflow_run",
+        ["resource_id", "submitted_at"],
+    )
+    op.create_index("idx_preflow_run_deployment", "preflow_run", ["deployment_id"])
+
+    # Index the current run of the existing pipelines
+    task_status = sa.table(
+        "task_status",
+        sa.column("entity_id"),
+        sa.column("task_type"),
+        sa.column("key"),
+        sa.column("state"),
+        sa.column("last_updated"),
+        sa.column("value"),
+    )
+    rows = op.get_bind().execute(
+        sa.select(
+            task_status.c.entity_id,
+            task_status.c.state,
+            task_status.c.last_updated,
+            task_status.c.value,
+        )
+        .where(task_status.c.task_type == "preflow")
+        .where(task_status.c.key == "pipeline")
+    )
+    runs = {}
+    for row in rows:
+        run = _run(*row)
+        if run:
+            runs[run["flow_run_id"]] = run
+    if runs:
+        op.bulk_insert(preflow_run, list(runs.values()))
+
+
+def _run(resource_id, state, last_updated, value):
+    try:
+        value = json.loads(value or "{}")
+    except ValueError:
+        return None
+    if not value.get("flow_run_id"):
+        return None
+    state = (state or "pending").lower()
+    last_updated = last_updated or datetime.datetime.utcnow()
+    return {
+        "flow_run_id": value["flow_run_id"],
+        "resource_id": resource_id,
+        "submitted_at": last_updated,
+        # Finished runs must not hold a scheduler slot
+        "finished_at": last_updated if state in FINISHED_STATES else None,
+        "state": state,
+        "fingerprint": value.get("fingerprint"),
+    }
+
+
+def downgrade():
+    op.drop_index("idx_preflow_run_deployment", "preflow_run")
+    op.drop_index("idx_preflow_run_resource_submitted", "preflow_run")
+    op.drop_table("preflow_run")
@@ -0,0 +1,141 @@
+import datetime
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    UnicodeText,
+)
+
+import ckan.plugins.toolkit as tk
+
+
+class PreflowLog(tk.BaseModel):
+    """
+    A log line reported for a resource pipeline run. Lines are only ever
+    inserted, never rewritten.
+    """
+
+    __tablename__ = "preflow_log"
+    __table_args__ = (
+        Index(
+            "idx_preflow_log_resource_run_datetime",
+            "resource_id",
+            "flow_run_id",
+            "datetime",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    resource_id = Column(UnicodeText, nullable=False)
+    flow_run_id = Column(UnicodeText, nullable=False, default="")
+    datetime = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+    type = Column(UnicodeText, nullable=False, default="info")
+    message = Column(UnicodeText)
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "datetime": self.datetime.isoformat(),
+            "type": self.type,
+            "message": self.message,
+        }
+
+
+class PreflowReport(tk.BaseModel):
+    """
+    Validation report of a pipeline run. The report is stored compressed,
+    without its errors, which are split in ``PreflowReportChunk`` rows.
+    """
+
+    __tablename__ = "preflow_report"
+    __table_args__ = (
+        Index("idx_preflow_report_resource_run", "resource_id", "flow_run_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    resource_id = Column(UnicodeText, nullable=False)
+    flow_run_id = Column(UnicodeText, nullable=False, default="")
+    created = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+    summary = Column(UnicodeText, nullable=False)
+    header = Column(LargeBinary, nullable=False)
+
+
+class PreflowReportChunk(tk.BaseModel):
+    """
+    A page of consecutive errors of a validation report task, compressed.
+    """
+
+    __tablename__ = "preflow_report_chunk"
+
+    report_id = Column(
+        Integer,
+        ForeignKey("preflow_report.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    task_index = Column(Integer, primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
+    error_count = Column(Integer, nullable=False)
+    # Lowest and highest row numbers, and JSON list of the error types, of
+    # the chunk errors. Used to skip chunks when filtering.
+    row_start = Column(Integer)
+    row_end = Column(Integer)
+    types = Column(UnicodeText)
+    data = Column(LargeBinary, nullable=False)
+
+
+class PreflowRun(tk.BaseModel):
+    """
+    A Prefect flow run submitted for a resource. Runs are kept after the
+    resource is resubmitted, so they form the pipeline history of the
+    resource.
+    """
+
+    __tablename__ = "preflow_run"
+    __table_args__ = (
+        Index("idx_preflow_run_resource_submitted", "resource_id", "submitted_at"),
+        Index("idx_preflow_run_deployment", "deployment_id"),
+    )
+
+    flow_run_id = Column(UnicodeText, primary_key=True)
+    resource_id = Column(UnicodeText, nullable=False)
+    deployment_id = Column(UnicodeText)
+    submitted_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    state = Column(UnicodeText, nullable=False, default="pending")
+    fingerprint = Column(UnicodeText)
+
+    def as_dict(self) -> dict:
+        return {
+            "flow_run_id": self.flow_run_id,
+            "resource_id": self.resource_id,
+            "deployment_id": self.deployment_id,
+            "submitted_at": self.submitted_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "state": self.state,
+            "fingerprint": self.fingerprint,
+        }
+
+
+class PreflowQueue(tk.BaseModel):
+    """
+    A resource waiting for the scheduler to submit it to Prefect. A resource
+    is queued at most once, with the highest priority it was queued with.
+    """
+
+    __tablename__ = "preflow_queue"
+    __table_args__ = (
+        Index("idx_preflow_queue_org_priority", "organization_id", "priority"),
+    )
+
+    resource_id = Column(UnicodeText, primary_key=True)
+    organization_id = Column(UnicodeText, nullable=False, default="")
+    priority = Column(Integer, nullable=False, default=0)
+    force = Column(Boolean, nullable=False, default=False)
+    enqueued_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
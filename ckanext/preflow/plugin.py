@@ -8,10 +8,12 @@ import ckan.model as model
 
 from ckanext.preflow.logic import action, auth
 from ckanext.preflow.views import preflow
-from ckanext.preflow import helpers
+from ckanext.preflow import cli, helpers, indexing, jobs, scheduler, utils
+from ckanext.preflow.interfaces import IPreflowHook
 
 
-DEFAULT_FORMATS = ["csv", "tsv", "xls", "xlsx"]
+# Datastore-only resources end in the "complete" state
+DEFAULT_HOOK_STATES = ["completed", "complete"]
 
 log = logging.getLogger(__name__)
 
@@ -22,8 +24,12 @@ class PreflowPlugin(p.SingletonPlugin):
     p.implements(p.IAuthFunctions)
     p.implements(p.IResourceUrlChange)
     p.implements(p.IResourceController, inherit=True)
+    p.implements(p.IPackageController, inherit=True)
+    p.implements(p.IFacets, inherit=True)
     p.implements(p.IBlueprint)
     p.implements(p.ITemplateHelpers)
+    p.implements(p.IClick)
+    p.implements(IPreflowHook)
 
     # IConfigurer
     def update_config(self, config_):
@@ -49,46 +55,130 @@ class PreflowPlugin(p.SingletonPlugin):
     def after_resource_create(self, context, resource_dict: dict[str, Any]):
         self._submit_to_preflow(resource_dict)
 
+    # IPackageController
+    def before_dataset_index(self, pkg_dict: dict[str, Any]) -> dict[str, Any]:
+        if indexing.is_enabled():
+            pkg_dict.update(indexing.index_fields(pkg_dict))
+        return pkg_dict
+
+    # IFacets
+    def dataset_facets(
+        self, facets_dict: dict[str, Any], package_type: str
+    ) -> dict[str, Any]:
+        if indexing.is_enabled() and tk.asbool(
+            tk.config.get("ckanext.preflow.state_facet", True)
+        ):
+            facets_dict["vocab_preflow_state"] = tk._("Pipeline state")
+        return facets_dict
+
     # IAuthFunctions
     def get_auth_functions(self) -> dict[str, AuthFunction]:
         return {
             "preflow_submit": auth.preflow_submit,
             "preflow_status": auth.preflow_status,
+            "preflow_status_bulk": auth.preflow_status_bulk,
+            "preflow_run_list": auth.preflow_run_list,
+            "preflow_resource_context": auth.preflow_resource_context,
+            "preflow_status_update": auth.preflow_status_update,
+            "preflow_submit_bulk": auth.preflow_submit_bulk,
+            "preflow_reconcile": auth.preflow_reconcile,
+            "preflow_webhook": auth.preflow_webhook,
+            "preflow_dispatch": auth.preflow_dispatch,
         }
 
     # IActions
     def get_actions(self) -> dict[str, Action]:
         return {
             "preflow_submit": action.preflow_submit,
+            "preflow_submit_bulk": action.preflow_submit_bulk,
+            "preflow_enqueue": action.preflow_enqueue,
+            "preflow_dispatch": action.preflow_dispatch,
+            "preflow_reconcile": action.preflow_reconcile,
+            "preflow_webhook": action.preflow_webhook,
             "preflow_status": action.preflow_status,
+            "preflow_status_bulk": action.preflow_status_bulk,
+            "preflow_resource_context": action.preflow_resource_context,
             "preflow_hook": action.preflow_hook,
             "preflow_status_update": action.preflow_status_update,
+            "preflow_status_update_batch": action.preflow_status_update_batch,
+            "preflow_log_list": action.preflow_log_list,
+            "preflow_run_list": action.preflow_run_list,
+            "preflow_validation_report_show": action.preflow_validation_report_show,
+            "preflow_validation_error_list": action.preflow_validation_error_list,
         }
 
     # ITemplateHelpers
     def get_helpers(self) -> dict[str, Any]:
         return {
             "get_preflow_badge": helpers.get_preflow_badge,
+            "get_preflow_asset_urls": helpers.get_preflow_asset_urls,
         }
 
+    # IPreflowHook
+    def preflow_hook_states(self) -> list[str]:
+        return tk.aslist(
+            tk.config.get("ckanext.preflow.hook_states", DEFAULT_HOOK_STATES)
+        )
+
+    def after_preflow_state_change(self, context, data_dict: dict[str, Any]):
+        resource_dict = tk.get_action("resource_show")(
+            context, {"id": data_dict["resource_id"]}
+        )
+        dataset_dict = tk.get_action("package_show")(
+            context, {"id": resource_dict["package_id"]}
+        )
+        tk.get_action("resource_create_default_resource_views")(
+            context,
+            {
+                "resource": resource_dict,
+                "package": dataset_dict,
+                "create_datastore_views": True,
+            },
+        )
+
     # IBlueprint
     def get_blueprint(self):
         return preflow
 
+    # IClick
+    def get_commands(self):
+        return [cli.preflow]
+
     def _submit_to_preflow(self, resource_dict: dict[str, Any]) -> None:
         context = {"model": model, "ignore_auth": True, "defer_commit": True}
-        resource_format = resource_dict.get("format")
-
-        config_formats = tk.config.get("ckanext.preflow.supported_formats", "").strip()
-
-        # Use DEFAULT_FORMATS if config_formats is empty or invalid
-        if config_formats:
-            supported_formats = [
-                fmt.lower() for fmt in config_formats.split(" ") if fmt.strip()
-            ]
-        else:
-            supported_formats = DEFAULT_FORMATS
-        if not resource_format or resource_format.lower() not in supported_formats:
+        if not utils.is_supported(resource_dict):
+            return
+
+        if scheduler.is_enabled():
+            log.info(
+                "Queueing resource %s for the Preflow scheduler",
+                resource_dict.get("id"),
+            )
+            try:
+                tk.get_action("preflow_enqueue")(
+                    context, {"resource_id": resource_dict["id"]}
+                )
+            except Exception as e:
+                log.error(
+                    "Failed to queue resource %s for the Preflow scheduler: %s",
+                    resource_dict.get("id"),
+                    str(e),
+                )
+            return
+
+        if jobs.is_async():
+            log.info(
+                "Queueing resource %s for submission to Prefect",
+                resource_dict.get("id"),
+            )
+            try:
+                jobs.enqueue_submit(resource_dict["id"])
+            except Exception as e:
+                log.error(
+                    "Failed to queue resource %s for submission to Prefect: %s",
+                    resource_dict.get("id"),
+                    str(e),
+                )
             return
 
         log.info(
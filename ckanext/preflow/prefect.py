@@ -0,0 +1,250 @@
+from typing import Any, Optional
+
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import ckan.plugins.toolkit as tk
+
+from ckanext.preflow import metrics
+
+log = logging.getLogger(__name__)
+
+# Prefect caps the number of objects returned by a single filter request
+FILTER_LIMIT = 200
+
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class PrefectUnavailable(requests.RequestException):
+    """
+    Raised without contacting Prefect while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker(object):
+    """
+    Stop calling Prefect for ``reset_timeout`` seconds after ``threshold``
+    consecutive failures, then let a single trial request through.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._trial = True
+            return True
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.threshold and self.failures >= self.threshold:
+                if self.opened_at is None:
+                    log.warning(
+                        "Prefect failed %s times in a row, pausing calls for %s seconds",
+                        self.failures,
+                        self.reset_timeout,
+                    )
+                self.opened_at = time.monotonic()
+
+
+class PrefectClient(object):
+    """
+    Client for the Prefect REST API, sharing a pool of keep-alive connections
+    between all the requests of the process.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        api_key: Optional[str] = None,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10,
+        retries: int = 2,
+        backoff: float = 0.5,
+        max_backoff: float = 10,
+        pool_size: int = 10,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.api_url = api_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker(5, 30)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Content-Type"] = "application/json"
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def request(
+        self, method: str, path: str, idempotent: bool = True, **kwargs: Any
+    ) -> requests.Response:
+        """
+        Send a request to Prefect and return the successful response.
+
+        Rate limited requests, server errors and connection failures are
+        retried with a jittered exponential backoff, of at most
+        ``max_backoff`` seconds. Requests that Prefect asks to retry later
+        than that fail instead. Non idempotent requests are only retried when
+        they could not have reached Prefect.
+
+        :raises PrefectUnavailable: If the circuit breaker is open.
+        :raises requests.RequestException: If the request failed.
+        """
+        if not self.breaker.allow():
+            raise PrefectUnavailable(f"Prefect API calls are paused: {method} {path}")
+
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{self.api_url}{path}"
+
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                response = self._send(method, path, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # A read timeout means Prefect may have processed the request
+                retryable = idempotent or isinstance(e, requests.ConnectionError)
+                if not retryable or attempt >= self.retries:
+                    self.breaker.failure()
+                    raise
+            except requests.RequestException:
+                self.breaker.failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.success()
+                    response.raise_for_status()
+                    return response
+
+                retryable = idempotent or response.status_code in [429, 503]
+                if not retryable or attempt >= self.retries:
+                    self.breaker.failure()
+                    response.raise_for_status()
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.isdigit() and int(retry_after) > self.max_backoff:
+                    # Do not hold the worker for that long
+                    self.breaker.failure()
+                    response.raise_for_status()
+
+            attempt += 1
+            delay = min(
+                self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5),
+                self.max_backoff,
+            )
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            log.debug("Retrying %s %s in %.2f seconds", method, path, delay)
+            time.sleep(delay)
+
+    def _send(
+        self, method: str, path: str, url: str, **kwargs: Any
+    ) -> requests.Response:
+        with metrics.prefect_request_seconds.time(
+            method=method, endpoint=metrics.endpoint(path), status="error"
+        ) as labels:
+            response = self.session.request(method, url, **kwargs)
+            labels["status"] = response.status_code
+        return response
+
+    def get_flow_run(self, flow_run_id: str) -> dict[str, Any]:
+        return self.request("GET", f"/flow_runs/{flow_run_id}").json()
+
+    def filter_flow_runs(self, flow_run_ids: list[str]) -> list[dict[str, Any]]:
+        flow_runs = []
+        for i in range(0, len(flow_run_ids), FILTER_LIMIT):
+            chunk = flow_run_ids[i : i + FILTER_LIMIT]
+            response = self.request(
+                "POST",
+                "/flow_runs/filter",
+                json={"flow_runs": {"id": {"any_": chunk}}, "limit": len(chunk)},
+            )
+            flow_runs.extend(response.json())
+        return flow_runs
+
+    def create_flow_run(
+        self, deployment_id: str, payload: dict[str, Any]
+    ) -> dict[str, Any]:
+        return self.request(
+            "POST",
+            f"/deployments/{deployment_id}/create_flow_run",
+            idempotent=False,
+            json=payload,
+        ).json()
+
+    def set_flow_run_state(
+        self, flow_run_id: str, state_type: str, message: str = ""
+    ) -> dict[str, Any]:
+        return self.request(
+            "POST",
+            f"/flow_runs/{flow_run_id}/set_state",
+            json={"state": {"type": state_type, "message": message}, "force": True},
+        ).json()
+
+
+def get_client() -> PrefectClient:
+    """
+    Return the process-wide Prefect client, configured from the
+    ``ckanext.preflow.prefect_*`` settings.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                config = tk.config
+                _client = PrefectClient(
+                    config.get(
+                        "ckanext.preflow.prefect_api_url", "http://127.0.0.1:4200/api"
+                    ),
+                    config.get("ckanext.preflow.prefect_api_key"),
+                    connect_timeout=float(
+                        config.get("ckanext.preflow.prefect_connect_timeout", 3.05)
+                    ),
+                    read_timeout=float(
+                        config.get("ckanext.preflow.prefect_read_timeout", 10)
+                    ),
+                    retries=tk.asint(config.get("ckanext.preflow.prefect_retries", 2)),
+                    backoff=float(config.get("ckanext.preflow.prefect_backoff", 0.5)),
+                    max_backoff=float(
+                        config.get("ckanext.preflow.prefect_max_backoff", 10)
+                    ),
+                    pool_size=tk.asint(
+                        config.get("ckanext.preflow.prefect_pool_size", 10)
+                    ),
+                    breaker=CircuitBreaker(
+                        tk.asint(
+                            config.get("ckanext.preflow.prefect_breaker_threshold", 5)
+                        ),
+                        float(config.get("ckanext.preflow.prefect_breaker_reset", 30)),
+                    ),
+                )
+    return _client
@@ -0,0 +1,253 @@
+from typing import Any, Optional
+
+import base64
+import json
+import zlib
+
+import sqlalchemy as sa
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+
+from ckanext.preflow.model import PreflowReport, PreflowReportChunk
+
+# Number of errors per stored chunk
+CHUNK_SIZE = 1000
+
+
+def _compress(data: Any) -> bytes:
+    return zlib.compress(json.dumps(data).encode("utf-8"))
+
+
+def _decompress(data: bytes) -> Any:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def error_type(error: dict[str, Any]) -> str:
+    """
+    Type of a Frictionless error, for both the v4 (``code``) and v5
+    (``type``) report formats.
+    """
+    return error.get("type") or error.get("code") or "unknown"
+
+
+def error_row(error: dict[str, Any]) -> Optional[int]:
+    """
+    Row number of a Frictionless error, None for errors not tied to a row.
+    """
+    for key in ("rowNumber", "rowPosition", "row-number"):
+        if error.get(key) is not None:
+            return error[key]
+    return None
+
+
+def summarize(report: dict[str, Any]) -> dict[str, Any]:
+    """
+    Small summary of a validation report: validity, error counts by type
+    and per task.
+    """
+    errors_by_type = {}
+    tasks = []
+    for task in report.get("tasks", []):
+        for error in task.get("errors", []):
+            _type = error_type(error)
+            errors_by_type[_type] = errors_by_type.get(_type, 0) + 1
+        tasks.append(
+            {
+                "name": task.get("name") or task.get("place") or "",
+                "valid": task.get("valid", not task.get("errors")),
+                "error_count": len(task.get("errors", [])),
+            }
+        )
+    for error in report.get("errors", []):
+        _type = error_type(error)
+        errors_by_type[_type] = errors_by_type.get(_type, 0) + 1
+
+    return {
+        "valid": report.get("valid", not errors_by_type),
+        "error_count": sum(errors_by_type.values()),
+        "errors_by_type": errors_by_type,
+        "tasks": tasks,
+    }
+
+
+def store(resource_id: str, flow_run_id: str, report: dict[str, Any]) -> dict[str, Any]:
+    """
+    Store a validation report out of the task status, replacing any report
+    of the same run, and return its summary. Only the last
+    ``ckanext.preflow.report_history`` reports of a resource are kept.
+
+    The rows are added to the current session, the caller commits them.
+    """
+    summary = summarize(report)
+    summary["flow_run_id"] = flow_run_id
+
+    model.Session.query(PreflowReport).filter(
+        PreflowReport.resource_id == resource_id,
+        PreflowReport.flow_run_id == flow_run_id,
+    ).delete(synchronize_session=False)
+
+    keep = max(tk.asint(tk.config.get("ckanext.preflow.report_history", 1)), 1)
+    old_ids = [
+        row.id
+        for row in model.Session.query(PreflowReport.id)
+        .filter(PreflowReport.resource_id == resource_id)
+        .order_by(PreflowReport.created.desc())
+        .offset(keep - 1)
+    ]
+    if old_ids:
+        model.Session.query(PreflowReport).filter(
+            PreflowReport.id.in_(old_ids)
+        ).delete(synchronize_session=False)
+
+    header = dict(report)
+    header["tasks"] = [
+        {key: value for key, value in task.items() if key != "errors"}
+        for task in report.get("tasks", [])
+    ]
+    stored = PreflowReport(
+        resource_id=resource_id,
+        flow_run_id=flow_run_id,
+        summary=json.dumps(summary),
+        header=_compress(header),
+    )
+    model.Session.add(stored)
+    model.Session.flush()
+
+    for task_index, task in enumerate(report.get("tasks", [])):
+        errors = task.get("errors", [])
+        for chunk_index, start in enumerate(range(0, len(errors), CHUNK_SIZE)):
+            chunk = errors[start : start + CHUNK_SIZE]
+            rows = [row for row in map(error_row, chunk) if row is not None]
+            model.Session.add(
+                PreflowReportChunk(
+                    report_id=stored.id,
+                    task_index=task_index,
+                    chunk_index=chunk_index,
+                    error_count=len(chunk),
+                    row_start=min(rows) if rows else None,
+                    row_end=max(rows) if rows else None,
+                    types=json.dumps(sorted(set(map(error_type, chunk)))),
+                    data=_compress(chunk),
+                )
+            )
+
+    return summary
+
+
+def get(resource_id: str, flow_run_id: Optional[str] = None) -> Optional[PreflowReport]:
+    """
+    Return the stored report of a run, or the latest report of the resource.
+    """
+    query = model.Session.query(PreflowReport).filter(
+        PreflowReport.resource_id == resource_id
+    )
+    if flow_run_id is not None:
+        query = query.filter(PreflowReport.flow_run_id == flow_run_id)
+    return query.order_by(PreflowReport.created.desc()).first()
+
+
+def header(report: PreflowReport) -> dict[str, Any]:
+    """
+    Return the report without its errors, with the number of error pages of
+    each task in ``pages``.
+    """
+    data = _decompress(report.header)
+    counts = {
+        task_index: pages
+        for task_index, pages in model.Session.query(
+            PreflowReportChunk.task_index,
+            sa.func.count(PreflowReportChunk.chunk_index),
+        )
+        .filter(PreflowReportChunk.report_id == report.id)
+        .group_by(PreflowReportChunk.task_index)
+    }
+    data["pages"] = [counts.get(i, 0) for i in range(len(data.get("tasks", [])))]
+    return data
+
+
+def errors(report: PreflowReport, task_index: int, page: int) -> list[dict[str, Any]]:
+    """
+    Return a page of errors of a report task, empty past the last page.
+    """
+    chunk = model.Session.query(PreflowReportChunk).get(
+        (report.id, task_index, page)
+    )
+    return _decompress(chunk.data) if chunk else []
+
+
+def encode_cursor(task_index: int, chunk_index: int, offset: int) -> str:
+    return base64.urlsafe_b64encode(
+        f"{task_index}:{chunk_index}:{offset}".encode()
+    ).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[int, int, int]:
+    try:
+        task_index, chunk_index, offset = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        )
+        return int(task_index), int(chunk_index), int(offset)
+    except (ValueError, TypeError):
+        raise tk.ValidationError({"cursor": [tk._("Invalid cursor")]})
+
+
+def filter_errors(
+    report: PreflowReport,
+    task_index: Optional[int] = None,
+    types: Optional[list[str]] = None,
+    row_from: Optional[int] = None,
+    row_to: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+) -> tuple[list[dict[str, Any]], Optional[str]]:
+    """
+    Return up to ``limit`` errors of a report matching the filters, in report
+    order, starting at ``cursor``, and the cursor of the next errors (None
+    after the last one).
+
+    Only the chunks that can hold matching errors are decompressed.
+    """
+    position = decode_cursor(cursor) if cursor else (0, 0, 0)
+
+    query = model.Session.query(
+        PreflowReportChunk.task_index,
+        PreflowReportChunk.chunk_index,
+        PreflowReportChunk.row_start,
+        PreflowReportChunk.row_end,
+        PreflowReportChunk.types,
+    ).filter(PreflowReportChunk.report_id == report.id)
+    if task_index is not None:
+        query = query.filter(PreflowReportChunk.task_index == task_index)
+    query = query.filter(
+        sa.tuple_(PreflowReportChunk.task_index, PreflowReportChunk.chunk_index)
+        >= sa.tuple_(position[0], position[1])
+    )
+
+    found = []
+    for chunk_task, chunk_index, row_start, row_end, chunk_types in query.order_by(
+        PreflowReportChunk.task_index, PreflowReportChunk.chunk_index
+    ):
+        if types and chunk_types and not set(types) & set(json.loads(chunk_types)):
+            continue
+        if row_from is not None and row_end is not None and row_end < row_from:
+            continue
+        if row_to is not None and row_start is not None and row_start > row_to:
+            continue
+
+        offset = position[2] if (chunk_task, chunk_index) == position[:2] else 0
+        chunk = errors(report, chunk_task, chunk_index)
+        for i in range(offset, len(chunk)):
+            error = chunk[i]
+            row = error_row(error)
+            if types and error_type(error) not in types:
+                continue
+            if row_from is not None and (row is None or row < row_from):
+                continue
+            if row_to is not None and (row is None or row > row_to):
+                continue
+            if len(found) == limit:
+                return found, encode_cursor(chunk_task, chunk_index, i)
+            found.append(dict(error, task=chunk_task))
+
+    return found, None
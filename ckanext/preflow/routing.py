@@ -0,0 +1,165 @@
+from typing import Any, Optional
+
+import json
+import logging
+import random
+import threading
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_parsed: tuple[str, list[dict[str, Any]]] = ("", [])
+# Current weights of the smooth weighted round-robin, by route and target
+_current: dict[tuple[int, int], float] = {}
+
+
+def _weight(target: dict[str, Any]) -> float:
+    return float(target.get("weight", 1))
+
+
+def _valid(route: Any) -> bool:
+    """
+    Whether a route has targets, all with a deployment and a weight of 0 or
+    more, and at least one with a positive weight.
+    """
+    if not isinstance(route, dict) or not isinstance(route.get("targets"), list):
+        return False
+    targets = route["targets"]
+    try:
+        weights = [_weight(target) for target in targets]
+    except (AttributeError, TypeError, ValueError):
+        return False
+    return (
+        bool(targets)
+        and all(target.get("deployment_id") for target in targets)
+        and all(weight >= 0 for weight in weights)
+        and sum(weights) > 0
+    )
+
+
+def routes() -> list[dict[str, Any]]:
+    """
+    Return the routes of ``ckanext.preflow.routes``, a JSON list of routes
+    or the path of a JSON file holding it. Each route has:
+
+    - ``name`` (optional): added to the flow run tags
+    - ``formats``, ``organizations`` (optional): lists of formats and of
+      organization names or IDs the route applies to, any when missing
+    - ``min_size``, ``max_size`` (optional): size band in bytes of the
+      resources the route applies to
+    - ``targets``: list of ``{"deployment_id", "work_queue_name", "weight"}``
+      with optional work queue and weight (default: 1). Weights cannot be
+      negative and at least one must be positive.
+    - ``strategy`` (optional): ``round_robin`` (default), smooth and weighted,
+      or ``random``, weighted
+
+    Invalid routes are logged and ignored.
+    """
+    global _parsed
+    raw = tk.config.get("ckanext.preflow.routes", "").strip()
+    if raw == _parsed[0]:
+        return _parsed[1]
+
+    parsed = []
+    if raw:
+        try:
+            if raw.startswith("["):
+                parsed = json.loads(raw)
+            else:
+                with open(raw) as f:
+                    parsed = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error("Invalid ckanext.preflow.routes: %s", e)
+            parsed = []
+    if not isinstance(parsed, list):
+        log.error("Invalid ckanext.preflow.routes: a list of routes is required")
+        parsed = []
+    for route in parsed:
+        if not _valid(route):
+            log.error("Invalid route in ckanext.preflow.routes: %s", route)
+    parsed = [route for route in parsed if _valid(route)]
+    with _lock:
+        _parsed = (raw, parsed)
+        _current.clear()
+    return parsed
+
+
+def _organization(resource_dict: dict[str, Any]) -> set[str]:
+    package = model.Package.get(resource_dict.get("package_id") or "")
+    if not package or not package.owner_org:
+        return set()
+    group = model.Group.get(package.owner_org)
+    return {package.owner_org, group.name} if group else {package.owner_org}
+
+
+def _size(resource_dict: dict[str, Any]) -> Optional[int]:
+    try:
+        return int(resource_dict.get("size"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _matches(route: dict[str, Any], resource_dict: dict[str, Any]) -> bool:
+    formats = [fmt.lower() for fmt in route.get("formats") or []]
+    if formats and (resource_dict.get("format") or "").lower() not in formats:
+        return False
+
+    size = _size(resource_dict)
+    if route.get("min_size") is not None and (size is None or size < route["min_size"]):
+        return False
+    if route.get("max_size") is not None and size is not None and size > route["max_size"]:
+        return False
+
+    organizations = route.get("organizations")
+    if organizations and not set(organizations) & _organization(resource_dict):
+        return False
+    return True
+
+
+def _pick(index: int, route: dict[str, Any]) -> dict[str, Any]:
+    targets = route["targets"]
+    weights = [_weight(target) for target in targets]
+    if route.get("strategy") == "random":
+        return random.choices(targets, weights=weights)[0]
+
+    # Smooth weighted round-robin: spreads the targets evenly over time
+    with _lock:
+        total = sum(weights)
+        best = 0
+        for i, weight in enumerate(weights):
+            _current[(index, i)] = _current.get((index, i), 0) + weight
+            if _current[(index, i)] > _current[(index, best)]:
+                best = i
+        _current[(index, best)] -= total
+    return targets[best]
+
+
+def route(resource_dict: dict[str, Any]) -> dict[str, Any]:
+    """
+    Return the Prefect target of a resource: the ``deployment_id``, with the
+    ``work_queue_name`` and route ``name`` when set.
+
+    Resources larger than ``ckanext.preflow.heavy_size`` bytes go to
+    ``ckanext.preflow.heavy_deployment_id``, the others to the first
+    matching route, and to ``ckanext.preflow.prefect_deployment_id`` when
+    none matches.
+    """
+    heavy_deployment = tk.config.get("ckanext.preflow.heavy_deployment_id")
+    heavy_size = tk.asint(tk.config.get("ckanext.preflow.heavy_size", 0))
+    size = _size(resource_dict)
+    if heavy_deployment and heavy_size and size is not None and size > heavy_size:
+        return {"deployment_id": heavy_deployment, "name": "heavy"}
+
+    for index, candidate in enumerate(routes()):
+        if _matches(candidate, resource_dict):
+            target = _pick(index, candidate)
+            return {
+                "deployment_id": target["deployment_id"],
+                "work_queue_name": target.get("work_queue_name"),
+                "name": candidate.get("name"),
+            }
+
+    return {"deployment_id": tk.config.get("ckanext.preflow.prefect_deployment_id")}
@@ -0,0 +1,65 @@
+from typing import Optional
+
+import datetime
+
+import ckan.model as model
+
+from ckanext.preflow import metrics
+from ckanext.preflow.cache import TERMINAL_STATES
+from ckanext.preflow.model import PreflowRun
+
+
+def record(
+    resource_id: str,
+    flow_run_id: str,
+    deployment_id: Optional[str] = None,
+    fingerprint: str = "",
+) -> PreflowRun:
+    """
+    Add a newly submitted flow run of a resource to the session, the caller
+    commits it.
+    """
+    run = PreflowRun(
+        flow_run_id=flow_run_id,
+        resource_id=resource_id,
+        deployment_id=deployment_id,
+        state="pending",
+        fingerprint=fingerprint or None,
+    )
+    return model.Session.merge(run)
+
+
+def update(flow_run_id: str, state: str, when: datetime.datetime) -> None:
+    """
+    Record a state change of a flow run: the first running state sets
+    ``started_at`` and the first terminal state ``finished_at``. Runs
+    submitted before the preflow_run table existed are ignored.
+    """
+    if not flow_run_id or not state:
+        return
+    run = model.Session.query(PreflowRun).get(flow_run_id)
+    if run is None:
+        return
+
+    state = state.lower()
+    run.state = state
+    if state == "running" and run.started_at is None:
+        run.started_at = when
+    if state in TERMINAL_STATES and run.finished_at is None:
+        run.finished_at = when
+        metrics.run_duration_seconds.observe(
+            (when - run.submitted_at).total_seconds(), state=state
+        )
+
+
+def resources(flow_run_ids: list[str]) -> dict[str, str]:
+    """
+    Return the resource ID of each known flow run, keyed by flow run ID.
+    """
+    if not flow_run_ids:
+        return {}
+    return dict(
+        model.Session.query(PreflowRun.flow_run_id, PreflowRun.resource_id).filter(
+            PreflowRun.flow_run_id.in_(flow_run_ids)
+        )
+    )
@@ -0,0 +1,217 @@
+from typing import Any, Iterator
+
+import collections
+import contextlib
+import datetime
+import logging
+
+import requests
+import sqlalchemy as sa
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+
+from ckanext.preflow.model import PreflowQueue, PreflowRun
+
+log = logging.getLogger(__name__)
+
+PRIORITY_AUTO = 0
+PRIORITY_MANUAL = 10
+
+# Key of the PostgreSQL advisory lock held while dispatching
+DISPATCH_LOCK = 0x70726566
+
+
+def is_enabled() -> bool:
+    return tk.asbool(tk.config.get("ckanext.preflow.scheduler", False))
+
+
+def _organization_id(resource_id: str) -> str:
+    resource = model.Resource.get(resource_id)
+    package = resource.package if resource else None
+    return (package.owner_org or "") if package else ""
+
+
+def enqueue(resource_id: str, priority: int = PRIORITY_AUTO, force: bool = False) -> None:
+    """
+    Queue a resource for submission, or raise the priority of an already
+    queued resource. The caller commits the session.
+    """
+    entry = model.Session.query(PreflowQueue).get(resource_id)
+    if entry is None:
+        model.Session.add(
+            PreflowQueue(
+                resource_id=resource_id,
+                organization_id=_organization_id(resource_id),
+                priority=priority,
+                force=force,
+            )
+        )
+        return
+    entry.priority = max(entry.priority, priority)
+    entry.force = entry.force or force
+
+
+def _weights() -> dict[str, float]:
+    """
+    Organization weights of ``ckanext.preflow.org_weights``, keyed by
+    organization ID.
+    """
+    weights = {}
+    for item in tk.aslist(tk.config.get("ckanext.preflow.org_weights", "")):
+        name, _, weight = item.rpartition(":")
+        group = model.Group.get(name)
+        try:
+            weights[group.id if group else name] = max(float(weight), 0.01)
+        except ValueError:
+            log.warning("Invalid ckanext.preflow.org_weights entry: %s", item)
+    return weights
+
+
+def in_flight() -> collections.Counter:
+    """
+    Number of unfinished flow runs of each organization. Runs older than
+    ``ckanext.preflow.stale_seconds`` are left to the reconciliation and do
+    not hold a slot.
+    """
+    stale_seconds = tk.asint(tk.config.get("ckanext.preflow.stale_seconds", 86400))
+    since = datetime.datetime.utcnow() - datetime.timedelta(seconds=stale_seconds)
+    rows = (
+        model.Session.query(
+            model.Package.owner_org, sa.func.count(PreflowRun.flow_run_id)
+        )
+        .join(model.Resource, model.Resource.id == PreflowRun.resource_id)
+        .join(model.Package, model.Package.id == model.Resource.package_id)
+        .filter(PreflowRun.finished_at.is_(None))
+        .filter(PreflowRun.submitted_at > since)
+        .group_by(model.Package.owner_org)
+    )
+    return collections.Counter({org or "": count for org, count in rows})
+
+
+@contextlib.contextmanager
+def _dispatch_lock() -> Iterator[bool]:
+    """
+    Hold a database wide lock, on a dedicated connection, so that only one
+    dispatcher computes the free slots at a time. Yields False when another
+    dispatcher holds it.
+    """
+    connection = model.meta.engine.connect()
+    try:
+        acquired = connection.execute(
+            sa.select(sa.func.pg_try_advisory_lock(DISPATCH_LOCK))
+        ).scalar()
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                connection.execute(
+                    sa.select(sa.func.pg_advisory_unlock(DISPATCH_LOCK))
+                )
+    finally:
+        connection.close()
+
+
+def dispatch(context: dict[str, Any]) -> dict[str, int]:
+    """
+    Submit queued resources while there are free slots.
+
+    At most ``ckanext.preflow.max_in_flight`` runs are unfinished at any
+    time, and at most ``ckanext.preflow.max_in_flight_per_org`` per
+    organization. The highest priority entries go first. Between entries of
+    the same priority, the organization with the fewest runs in flight
+    relative to its weight in ``ckanext.preflow.org_weights`` goes first, so
+    a large upload of one organization does not hold back the others.
+
+    Entries are removed once submitted, or when their resource cannot be
+    submitted at all. When Prefect cannot be reached, the dispatch stops and
+    the remaining entries stay queued.
+    """
+    result = {"submitted": 0, "dropped": 0, "queued": 0}
+    with _dispatch_lock() as acquired:
+        if not acquired:
+            log.debug("Another dispatcher is running")
+            return result
+
+        max_in_flight = tk.asint(tk.config.get("ckanext.preflow.max_in_flight", 20))
+        max_per_org = tk.asint(tk.config.get("ckanext.preflow.max_in_flight_per_org", 0))
+        running = in_flight()
+        free = max_in_flight - sum(running.values())
+
+        queues = collections.defaultdict(collections.deque)
+        for entry in model.Session.query(PreflowQueue).order_by(
+            PreflowQueue.priority.desc(), PreflowQueue.enqueued_at
+        ):
+            queues[entry.organization_id].append(entry)
+        weights = _weights()
+
+        while free > 0:
+            candidates = [
+                org
+                for org, entries in queues.items()
+                if entries and (not max_per_org or running[org] < max_per_org)
+            ]
+            if not candidates:
+                break
+            org = min(
+                candidates,
+                key=lambda org: (
+                    -queues[org][0].priority,
+                    running[org] / weights.get(org, 1),
+                    queues[org][0].enqueued_at,
+                ),
+            )
+            entry = queues[org][0]
+            resource_id, force = entry.resource_id, entry.force
+            try:
+                submitted = _submit(context, resource_id, force)
+            except requests.RequestException as e:
+                # Keep the entry and the rest of the queue for a later dispatch
+                log.warning("Prefect is unavailable, dispatch stopped: %s", e)
+                model.Session.rollback()
+                break
+
+            queues[org].popleft()
+            model.Session.query(PreflowQueue).filter(
+                PreflowQueue.resource_id == resource_id
+            ).delete(synchronize_session=False)
+            model.Session.commit()
+            if submitted:
+                running[org] += 1
+                free -= 1
+                result["submitted"] += 1
+            else:
+                result["dropped"] += 1
+
+        result["queued"] = sum(len(entries) for entries in queues.values())
+
+    log.info(
+        "Dispatched %s queued resources, %s dropped, %s still queued",
+        result["submitted"],
+        result["dropped"],
+        result["queued"],
+    )
+    return result
+
+
+def _submit(context: dict[str, Any], resource_id: str, force: bool) -> bool:
+    """
+    Submit a queued resource, return whether a flow run was created.
+
+    :raises requests.RequestException: If Prefect could not be reached.
+    """
+    try:
+        resource_dict = tk.get_action("resource_show")(
+            dict(context), {"id": resource_id}
+        )
+        resource_dict["force"] = force
+        flow_run = tk.get_action("preflow_submit")(
+            dict(context, preflow_raise_errors=True), resource_dict
+        )
+    except tk.ObjectNotFound:
+        log.warning("Resource %s no longer exists, not submitting", resource_id)
+        return False
+    except tk.ValidationError as e:
+        log.info("Not submitting resource %s: %s", resource_id, e.error_dict)
+        return False
+    return bool(flow_run and flow_run.get("id"))
@@ -0,0 +1,33 @@
+import pytest
+
+import ckan.model as model
+import ckan.tests.factories as factories
+
+from ckanext.preflow import routing
+
+
+@pytest.fixture
+def clean_db(reset_db, migrate_db_for):
+    reset_db()
+    migrate_db_for("preflow")
+
+
+@pytest.fixture
+def reset_routes():
+    routing._parsed = ("", [])
+    routing._current.clear()
+    yield
+    routing._parsed = ("", [])
+    routing._current.clear()
+
+
+@pytest.fixture
+def resource(clean_db):
+    """
+    A resource without format, so that it is not submitted to Prefect when
+    created.
+    """
+    dataset = factories.Dataset()
+    resource = factories.Resource(package_id=dataset["id"], format="")
+    model.Session.commit()
+    return resource
@@ -0,0 +1,367 @@
+import json
+import uuid
+from unittest import mock
+
+import pytest
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+import ckan.tests.factories as factories
+import ckan.tests.helpers as helpers
+
+from ckanext.preflow import runs
+from ckanext.preflow.logic import action
+from ckanext.preflow.model import PreflowLog, PreflowRun
+
+
+def _task_status(resource_id: str) -> dict:
+    return helpers.call_action(
+        "task_status_show", entity_id=resource_id, task_type="preflow", key="pipeline"
+    )
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestStatusUpdateBatch(object):
+    def test_events_are_applied_in_order(self, resource):
+        other = factories.Resource(package_id=resource["package_id"], format="")
+
+        results = helpers.call_action(
+            "preflow_status_update_batch",
+            events=[
+                {"resource_id": resource["id"], "state": "running", "message": "1"},
+                {"resource_id": other["id"], "state": "running", "message": "a"},
+                {"resource_id": resource["id"], "message": "2"},
+                {"resource_id": resource["id"], "state": "completed", "message": "3"},
+            ],
+        )
+
+        assert {result["entity_id"]: result["state"] for result in results} == {
+            resource["id"]: "completed",
+            other["id"]: "running",
+        }
+        logs = helpers.call_action("preflow_log_list", resource_id=resource["id"])
+        assert [entry["message"] for entry in logs["logs"]] == ["1", "2", "3"]
+
+    def test_errors_mark_the_pipeline_as_failed(self, resource):
+        helpers.call_action(
+            "preflow_status_update_batch",
+            events=[
+                {"resource_id": resource["id"], "state": "running"},
+                {"resource_id": resource["id"], "type": "error", "message": "Boom"},
+            ],
+        )
+
+        assert _task_status(resource["id"])["state"] == "failed"
+
+    def test_invalid_event_applies_nothing(self, resource):
+        other = factories.Resource(package_id=resource["package_id"], format="")
+
+        with pytest.raises(tk.ValidationError) as e:
+            helpers.call_action(
+                "preflow_status_update_batch",
+                events=[
+                    {"resource_id": resource["id"], "state": "running"},
+                    {
+                        "resource_id": other["id"],
+                        "state": "running",
+                        "datetime": "yesterday",
+                    },
+                ],
+            )
+        # What the end of the request does
+        model.Session.rollback()
+
+        assert "datetime" in e.value.error_dict
+        with pytest.raises(tk.ObjectNotFound):
+            _task_status(resource["id"])
+        assert not model.Session.query(PreflowLog).count()
+
+    def test_dates_are_stored_in_utc(self, resource):
+        helpers.call_action(
+            "preflow_status_update_batch",
+            events=[
+                {
+                    "resource_id": resource["id"],
+                    "state": "running",
+                    "datetime": "2026-01-01T12:00:00+02:00",
+                }
+            ],
+        )
+
+        entry = model.Session.query(PreflowLog).one()
+        assert entry.datetime.isoformat() == "2026-01-01T10:00:00"
+
+    @pytest.mark.parametrize(
+        "action", ["preflow_status_update", "preflow_status_update_batch"]
+    )
+    def test_editors_only(self, resource, action):
+        user = factories.User()
+        data_dict = {"resource_id": resource["id"], "state": "completed"}
+        if action == "preflow_status_update_batch":
+            data_dict = {"events": [data_dict]}
+
+        with pytest.raises(tk.NotAuthorized):
+            helpers.call_action(
+                action,
+                context={"user": user["name"], "ignore_auth": False},
+                **data_dict,
+            )
+
+    def test_events_are_required(self):
+        with pytest.raises(tk.ValidationError):
+            helpers.call_action(
+                "preflow_status_update_batch", events=[{"state": "running"}]
+            )
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestSupersededRuns(object):
+    def _submit(self, resource: dict) -> str:
+        # What _record_submission does
+        flow_run_id = str(uuid.uuid4())
+        runs.record(resource["id"], flow_run_id, "deployment")
+        helpers.call_action(
+            "preflow_status_update",
+            resource_id=resource["id"],
+            flow_run_id=flow_run_id,
+            state="Pending",
+            clear=True,
+        )
+        return flow_run_id
+
+    def test_callbacks_of_older_runs_are_only_logged(self, resource):
+        old_flow_run_id = self._submit(resource)
+        flow_run_id = self._submit(resource)
+        helpers.call_action(
+            "preflow_status_update", resource_id=resource["id"], resubmit=True
+        )
+
+        with mock.patch.object(action, "_resubmit_superseded") as resubmit:
+            helpers.call_action(
+                "preflow_status_update",
+                resource_id=resource["id"],
+                flow_run_id=old_flow_run_id,
+                state="cancelled",
+                message="Cancelled",
+            )
+
+        task_status = _task_status(resource["id"])
+        assert task_status["state"] == "Pending"
+        assert json.loads(task_status["value"])["flow_run_id"] == flow_run_id
+        assert not resubmit.called
+        old_run = model.Session.query(PreflowRun).get(old_flow_run_id)
+        assert old_run.state == "cancelled"
+        assert old_run.finished_at is not None
+        assert model.Session.query(PreflowRun).get(flow_run_id).finished_at is None
+        entry = model.Session.query(PreflowLog).filter_by(message="Cancelled").one()
+        assert entry.flow_run_id == old_flow_run_id
+
+    def test_batches_skip_older_runs(self, resource):
+        old_flow_run_id = self._submit(resource)
+        flow_run_id = self._submit(resource)
+
+        helpers.call_action(
+            "preflow_status_update_batch",
+            events=[
+                {
+                    "resource_id": resource["id"],
+                    "flow_run_id": old_flow_run_id,
+                    "type": "error",
+                    "message": "Crashed",
+                },
+                {
+                    "resource_id": resource["id"],
+                    "flow_run_id": flow_run_id,
+                    "state": "running",
+                },
+            ],
+        )
+
+        task_status = _task_status(resource["id"])
+        assert task_status["state"] == "running"
+        assert not task_status["error"]
+        assert model.Session.query(PreflowRun).get(old_flow_run_id).state == "failed"
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+@pytest.mark.ckan_config("ckanext.preflow.prefect_deployment_id", "deployment")
+class TestSubmitProbe(object):
+    def _submit(self, resource: dict, context: dict) -> mock.Mock:
+        client = mock.Mock()
+        client.create_flow_run.return_value = {"id": str(uuid.uuid4())}
+        resource = dict(resource, url="https://example.com/data.csv", url_type="")
+        with mock.patch(
+            "ckanext.preflow.logic.action.get_client", return_value=client
+        ), mock.patch("ckanext.preflow.utils.requests.head") as head:
+            head.return_value.headers = {"ETag": '"v1"'}
+            helpers.call_action("preflow_submit", context=context, **resource)
+        return head
+
+    def test_requests_are_not_probed(self, resource):
+        assert not self._submit(resource, {}).called
+
+    def test_background_jobs_probe(self, resource):
+        assert self._submit(resource, {"preflow_probe": True}).called
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestResourceContext(object):
+    def test_stored_fingerprint(self, resource):
+        helpers.call_action(
+            "preflow_status_update",
+            resource_id=resource["id"],
+            flow_run_id="flow-run",
+            fingerprint="etag:abc",
+            state="Pending",
+        )
+
+        with mock.patch("ckanext.preflow.utils.requests") as requests:
+            result = helpers.call_action(
+                "preflow_resource_context", resource_id=resource["id"]
+            )
+
+        assert result["fingerprint"] == "etag:abc"
+        assert not requests.method_calls
+
+    def test_resource_never_submitted(self, resource):
+        result = helpers.call_action(
+            "preflow_resource_context", resource_id=resource["id"]
+        )
+
+        assert result["fingerprint"] == ""
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestLogList(object):
+    def _update(self, resource: dict, flow_run_id: str, message: str, **data):
+        helpers.call_action(
+            "preflow_status_update",
+            resource_id=resource["id"],
+            flow_run_id=flow_run_id,
+            message=message,
+            **data,
+        )
+
+    def test_paging(self, resource):
+        self._update(resource, "first", "0", clear=True)
+        for i in range(1, 5):
+            self._update(resource, "first", str(i))
+
+        result = helpers.call_action(
+            "preflow_log_list", resource_id=resource["id"], offset=1, limit=2
+        )
+
+        assert result["count"] == 5
+        assert [entry["message"] for entry in result["logs"]] == ["1", "2"]
+
+    def test_runs_have_their_own_log(self, resource):
+        self._update(resource, "first", "a", clear=True)
+        self._update(resource, "second", "b", clear=True)
+
+        current = helpers.call_action("preflow_log_list", resource_id=resource["id"])
+        previous = helpers.call_action(
+            "preflow_log_list", resource_id=resource["id"], flow_run_id="first"
+        )
+
+        assert [entry["message"] for entry in current["logs"]] == ["b"]
+        assert [entry["message"] for entry in previous["logs"]] == ["a"]
+
+    @pytest.mark.parametrize(
+        "params", [{"limit": 0}, {"limit": -5}, {"offset": -1}, {"limit": "many"}]
+    )
+    def test_invalid_paging(self, resource, params):
+        with pytest.raises(tk.ValidationError):
+            helpers.call_action(
+                "preflow_log_list", resource_id=resource["id"], **params
+            )
+
+
+def _report(errors: int) -> dict:
+    return {
+        "valid": False,
+        "tasks": [
+            {
+                "name": "data.csv",
+                "valid": False,
+                "errors": [
+                    {
+                        "type": "type-error" if i % 2 else "missing-cell",
+                        "rowNumber": i + 2,
+                        "message": f"Error {i}",
+                    }
+                    for i in range(errors)
+                ],
+            }
+        ],
+    }
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestValidationErrorList(object):
+    def _store(self, resource: dict, errors: int) -> None:
+        helpers.call_action(
+            "preflow_status_update",
+            resource_id=resource["id"],
+            flow_run_id="flow-run",
+            state="completed",
+            validation_report=_report(errors),
+        )
+
+    def _all_pages(self, resource: dict, **params) -> tuple[list[dict], int]:
+        found, pages, cursor = [], 0, None
+        while True:
+            page = helpers.call_action(
+                "preflow_validation_error_list",
+                resource_id=resource["id"],
+                cursor=cursor,
+                **params,
+            )
+            found.extend(page["errors"])
+            pages += 1
+            cursor = page["next"]
+            if not cursor:
+                return found, pages
+
+    def test_cursor_pagination(self, resource):
+        # Spread over several stored chunks
+        self._store(resource, 2500)
+
+        found, pages = self._all_pages(resource, limit=300)
+
+        assert pages == 9
+        assert [error["message"] for error in found] == [
+            f"Error {i}" for i in range(2500)
+        ]
+
+    def test_filtered_pagination(self, resource):
+        self._store(resource, 2500)
+
+        found, _ = self._all_pages(
+            resource, type=["type-error"], row_from=1000, row_to=2100, limit=100
+        )
+
+        expected = [
+            f"Error {i}"
+            for i in range(2500)
+            if i % 2 and 1000 <= i + 2 <= 2100
+        ]
+        assert [error["message"] for error in found] == expected
+
+    @pytest.mark.parametrize("limit", [0, -1])
+    def test_invalid_limit(self, resource, limit):
+        self._store(resource, 10)
+
+        with pytest.raises(tk.ValidationError):
+            helpers.call_action(
+                "preflow_validation_error_list", resource_id=resource["id"], limit=limit
+            )
+
+    def test_invalid_cursor(self, resource):
+        self._store(resource, 10)
+
+        with pytest.raises(tk.ValidationError):
+            helpers.call_action(
+                "preflow_validation_error_list",
+                resource_id=resource["id"],
+                cursor="not a cursor",
+            )
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+import ckan.tests.factories as factories
+import ckan.tests.helpers as helpers
+
+from ckanext.preflow import indexing
+
+
+def _update(resource_id: str, **data) -> None:
+    helpers.call_action(
+        "preflow_status_update",
+        resource_id=resource_id,
+        flow_run_id="flow-run",
+        **data,
+    )
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_index")
+class TestIndexing(object):
+    def test_fields_without_resources_in_the_dict(self):
+        dataset = factories.Dataset()
+        first = factories.Resource(package_id=dataset["id"], format="")
+        second = factories.Resource(package_id=dataset["id"], format="")
+        _update(first["id"], state="completed")
+        _update(second["id"], type="error", message="Boom")
+
+        # What index_package passes to before_dataset_index
+        validated = helpers.call_action("package_show", id=dataset["id"])
+        pkg_dict = {"id": dataset["id"], "validated_data_dict": json.dumps(validated)}
+        fields = indexing.index_fields(pkg_dict)
+
+        assert fields["vocab_preflow_state"] == ["completed", "failed"]
+        assert fields["vocab_preflow_failed"] == [second["id"]]
+        assert fields["res_extras_preflow_state"] == ["completed", "failed"]
+        assert fields["preflow_last_run_date"].endswith("Z")
+
+        # Without validated_data_dict, the resources come from the database
+        assert indexing.index_fields({"id": dataset["id"]}) == fields
+
+    def test_search_by_state(self):
+        failing = factories.Dataset()
+        resource = factories.Resource(package_id=failing["id"], format="")
+        passing = factories.Dataset()
+        other = factories.Resource(package_id=passing["id"], format="")
+
+        _update(resource["id"], type="error", message="Boom")
+        _update(other["id"], state="completed")
+
+        result = helpers.call_action(
+            "package_search", fq="vocab_preflow_state:failed"
+        )
+        assert [dataset["id"] for dataset in result["results"]] == [failing["id"]]
+
+        result = helpers.call_action(
+            "package_search",
+            fq="vocab_preflow_state:completed",
+            **{"facet.field": '["vocab_preflow_state"]'},
+        )
+        assert [dataset["id"] for dataset in result["results"]] == [passing["id"]]
+        assert result["facets"]["vocab_preflow_state"] == {"completed": 1}
+
+    @pytest.mark.ckan_config("ckanext.preflow.index_state", "false")
+    def test_disabled(self):
+        dataset = factories.Dataset()
+        resource = factories.Resource(package_id=dataset["id"], format="")
+        _update(resource["id"], type="error", message="Boom")
+
+        result = helpers.call_action(
+            "package_search", fq="vocab_preflow_state:failed"
+        )
+        assert result["count"] == 0
@@ -0,0 +1,69 @@
+import pytest
+
+from ckanext.preflow import metrics
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = metrics.MemoryStore()
+    monkeypatch.setattr(metrics, "_store", store)
+    return store
+
+
+class TestMetrics(object):
+    def test_counter(self, store):
+        counter = metrics.Counter("preflow_test_total", "Test", ("result",))
+        metrics._registry.remove(counter)
+
+        counter.inc(result="a")
+        counter.inc(2, result="a")
+        counter.inc(result='"b"')
+
+        assert counter.render()[2:] == [
+            'preflow_test_total{result="\\"b\\""} 1.0',
+            'preflow_test_total{result="a"} 3.0',
+        ]
+
+    def test_histogram(self, store):
+        histogram = metrics.Histogram(
+            "preflow_test_seconds", "Test", ("operation",), buckets=(1, 5)
+        )
+        metrics._registry.remove(histogram)
+
+        histogram.observe(0.5, operation="read")
+        histogram.observe(3, operation="read")
+
+        assert histogram.render()[2:] == [
+            'preflow_test_seconds_bucket{operation="read",le="1"} 1',
+            'preflow_test_seconds_bucket{operation="read",le="5"} 2',
+            'preflow_test_seconds_bucket{operation="read",le="+Inf"} 2',
+            'preflow_test_seconds_sum{operation="read"} 3.5',
+            'preflow_test_seconds_count{operation="read"} 2',
+        ]
+
+    def test_store_errors_are_ignored(self, monkeypatch):
+        store = metrics.MemoryStore()
+        monkeypatch.setattr(store, "incr", lambda *args: 1 / 0)
+        monkeypatch.setattr(metrics, "_store", store)
+
+        metrics.submissions_total.inc(result="submitted")
+
+
+@pytest.mark.ckan_config("ckanext.preflow.metrics_backend", "redis")
+def test_redis_store_is_shared(ckan_config, monkeypatch):
+    from ckan.lib.redis import connect_to_redis
+
+    monkeypatch.setattr(metrics, "_store", None)
+    connection = connect_to_redis()
+    connection.delete(metrics.RedisStore.prefix + "preflow_test_total")
+    counter = metrics.Counter("preflow_test_total", "Test", ("result",))
+    metrics._registry.remove(counter)
+
+    counter.inc(result="a")
+    # Another process
+    metrics.RedisStore(connect_to_redis()).incr(
+        "preflow_test_total", {metrics._field("a"): 2}
+    )
+
+    assert counter.render()[2:] == ['preflow_test_total{result="a"} 3.0']
+    connection.delete(metrics.RedisStore.prefix + "preflow_test_total")
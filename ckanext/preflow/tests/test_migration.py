@@ -0,0 +1,38 @@
+import datetime
+import importlib
+import json
+
+import pytest
+
+migration = importlib.import_module(
+    "ckanext.preflow.migration.preflow.versions."
+    "e71c04b9a5d3_create_preflow_run_table"
+)
+
+NOW = datetime.datetime(2026, 1, 1, 12)
+
+
+class TestPreflowRunBackfill(object):
+    @pytest.mark.parametrize(
+        "state", ["Completed", "failed", "cancelled", "crashed", "complete"]
+    )
+    def test_finished_runs(self, state):
+        run = migration._run(
+            "resource", state, NOW, json.dumps({"flow_run_id": "flow-run"})
+        )
+
+        assert run["state"] == state.lower()
+        assert run["submitted_at"] == NOW
+        assert run["finished_at"] == NOW
+
+    @pytest.mark.parametrize("state", ["pending", "running", None])
+    def test_runs_in_flight(self, state):
+        run = migration._run(
+            "resource", state, NOW, json.dumps({"flow_run_id": "flow-run"})
+        )
+
+        assert run["finished_at"] is None
+
+    @pytest.mark.parametrize("value", [None, "{}", "not json"])
+    def test_pipelines_without_run(self, value):
+        assert migration._run("resource", "completed", NOW, value) is None
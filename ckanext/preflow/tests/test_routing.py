@@ -0,0 +1,137 @@
+import json
+
+import pytest
+
+import ckan.tests.factories as factories
+
+from ckanext.preflow import routing
+
+WEIGHTED = json.dumps(
+    [
+        {
+            "name": "weighted",
+            "formats": ["csv"],
+            "targets": [
+                {"deployment_id": "a", "weight": 3},
+                {"deployment_id": "b", "work_queue_name": "spare"},
+            ],
+        }
+    ]
+)
+
+INVALID = json.dumps(
+    [
+        {"name": "zero", "targets": [{"deployment_id": "a", "weight": 0}]},
+        {"name": "negative", "targets": [{"deployment_id": "a", "weight": -1}]},
+        {"name": "nan", "targets": [{"deployment_id": "a", "weight": "heavy"}]},
+        {"name": "no-deployment", "targets": [{"weight": 1}]},
+        {"name": "no-targets", "targets": []},
+        {"name": "valid", "targets": [{"deployment_id": "c"}]},
+    ]
+)
+
+
+@pytest.mark.usefixtures("reset_routes")
+class TestRoute(object):
+    @pytest.mark.ckan_config("ckanext.preflow.routes", WEIGHTED)
+    @pytest.mark.ckan_config("ckanext.preflow.prefect_deployment_id", "default")
+    def test_smooth_weighted_round_robin(self, ckan_config):
+        picks = [
+            routing.route({"format": "CSV"})["deployment_id"] for _ in range(8)
+        ]
+
+        assert picks == ["a", "a", "b", "a"] * 2
+
+    @pytest.mark.ckan_config("ckanext.preflow.routes", WEIGHTED)
+    def test_target_details(self, ckan_config):
+        targets = [routing.route({"format": "csv"}) for _ in range(4)]
+
+        assert {
+            "deployment_id": "b",
+            "work_queue_name": "spare",
+            "name": "weighted",
+        } in targets
+
+    @pytest.mark.ckan_config(
+        "ckanext.preflow.routes",
+        json.dumps(
+            [
+                {
+                    "strategy": "random",
+                    "targets": [
+                        {"deployment_id": "a", "weight": 0},
+                        {"deployment_id": "b", "weight": 2},
+                    ],
+                }
+            ]
+        ),
+    )
+    def test_random_skips_zero_weights(self, ckan_config):
+        picks = {routing.route({"format": "csv"})["deployment_id"] for _ in range(20)}
+
+        assert picks == {"b"}
+
+    @pytest.mark.ckan_config("ckanext.preflow.routes", WEIGHTED)
+    @pytest.mark.ckan_config("ckanext.preflow.prefect_deployment_id", "default")
+    def test_default_deployment_when_no_route_matches(self, ckan_config):
+        assert routing.route({"format": "shp"}) == {"deployment_id": "default"}
+
+    @pytest.mark.ckan_config("ckanext.preflow.routes", INVALID)
+    def test_invalid_routes_are_ignored(self, ckan_config):
+        assert [route["name"] for route in routing.routes()] == ["valid"]
+
+    @pytest.mark.ckan_config(
+        "ckanext.preflow.routes",
+        json.dumps(
+            [
+                {"name": "small", "max_size": 100, "targets": [{"deployment_id": "s"}]},
+                {"name": "large", "min_size": 101, "targets": [{"deployment_id": "l"}]},
+            ]
+        ),
+    )
+    @pytest.mark.ckan_config("ckanext.preflow.prefect_deployment_id", "default")
+    def test_size_bands(self, ckan_config):
+        assert routing.route({"size": 10})["deployment_id"] == "s"
+        assert routing.route({"size": 1000})["deployment_id"] == "l"
+        # Resources without a size match no min_size
+        assert routing.route({})["deployment_id"] == "s"
+
+    @pytest.mark.ckan_config("ckanext.preflow.routes", WEIGHTED)
+    @pytest.mark.ckan_config("ckanext.preflow.heavy_deployment_id", "heavy")
+    @pytest.mark.ckan_config("ckanext.preflow.heavy_size", "1000")
+    def test_heavy_resources_go_first(self, ckan_config):
+        assert routing.route({"format": "csv", "size": 5000}) == {
+            "deployment_id": "heavy",
+            "name": "heavy",
+        }
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db", "reset_routes")
+class TestOrganizationRoutes(object):
+    def test_by_name_or_id(self, ckan_config, monkeypatch):
+        first = factories.Organization()
+        second = factories.Organization()
+        other = factories.Organization()
+        monkeypatch.setitem(
+            ckan_config,
+            "ckanext.preflow.routes",
+            json.dumps(
+                [
+                    {
+                        "organizations": [first["name"], second["id"]],
+                        "targets": [{"deployment_id": "org"}],
+                    }
+                ]
+            ),
+        )
+        monkeypatch.setitem(
+            ckan_config, "ckanext.preflow.prefect_deployment_id", "default"
+        )
+
+        def deployment(organization: dict) -> str:
+            dataset = factories.Dataset(owner_org=organization["id"])
+            return routing.route({"package_id": dataset["id"]})["deployment_id"]
+
+        assert deployment(first) == "org"
+        assert deployment(second) == "org"
+        assert deployment(other) == "default"
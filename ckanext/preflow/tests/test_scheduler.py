@@ -0,0 +1,162 @@
+import datetime
+from unittest import mock
+
+import pytest
+import requests
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+import ckan.tests.factories as factories
+
+from ckanext.preflow import runs, scheduler
+from ckanext.preflow.model import PreflowQueue, PreflowRun
+
+
+def _resources(count: int) -> list[str]:
+    organization = factories.Organization()
+    dataset = factories.Dataset(owner_org=organization["id"])
+    return [
+        factories.Resource(package_id=dataset["id"], format="")["id"]
+        for _ in range(count)
+    ]
+
+
+def _enqueue(*resource_ids: str, priority: int = scheduler.PRIORITY_AUTO) -> None:
+    for resource_id in resource_ids:
+        scheduler.enqueue(resource_id, priority)
+        model.Session.commit()
+
+
+def _queued() -> set[str]:
+    return {entry.resource_id for entry in model.Session.query(PreflowQueue)}
+
+
+def _submitted(submit: mock.Mock) -> list[str]:
+    return [call.args[1] for call in submit.call_args_list]
+
+
+@pytest.fixture
+def context():
+    site_user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
+    return {"model": model, "ignore_auth": True, "user": site_user["name"]}
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestDispatch(object):
+    @pytest.mark.ckan_config("ckanext.preflow.max_in_flight", "2")
+    def test_organizations_share_the_slots(self, context):
+        busy = _resources(3)
+        quiet = _resources(1)
+        _enqueue(*busy)
+        _enqueue(*quiet)
+
+        with mock.patch.object(scheduler, "_submit", return_value=True) as submit:
+            result = scheduler.dispatch(context)
+
+        assert _submitted(submit) == [busy[0], quiet[0]]
+        assert result == {"submitted": 2, "dropped": 0, "queued": 2}
+        assert _queued() == set(busy[1:])
+
+    @pytest.mark.ckan_config("ckanext.preflow.max_in_flight", "1")
+    def test_manual_runs_go_first(self, context):
+        automatic = _resources(2)
+        manual = _resources(1)
+        _enqueue(*automatic)
+        _enqueue(*manual, priority=scheduler.PRIORITY_MANUAL)
+
+        with mock.patch.object(scheduler, "_submit", return_value=True) as submit:
+            scheduler.dispatch(context)
+
+        assert _submitted(submit) == manual
+
+    @pytest.mark.ckan_config("ckanext.preflow.max_in_flight", "10")
+    @pytest.mark.ckan_config("ckanext.preflow.max_in_flight_per_org", "1")
+    def test_limit_per_organization(self, context):
+        first = _resources(2)
+        second = _resources(2)
+        _enqueue(*first, *second)
+
+        with mock.patch.object(scheduler, "_submit", return_value=True) as submit:
+            result = scheduler.dispatch(context)
+
+        assert sorted(_submitted(submit)) == sorted([first[0], second[0]])
+        assert result["queued"] == 2
+
+    def test_resources_that_cannot_be_submitted_are_dropped(self, context):
+        resource_ids = _resources(2)
+        _enqueue(*resource_ids)
+
+        with mock.patch.object(scheduler, "_submit", return_value=False):
+            result = scheduler.dispatch(context)
+
+        assert result == {"submitted": 0, "dropped": 2, "queued": 0}
+        assert _queued() == set()
+
+    def test_prefect_errors_keep_the_queue(self, context):
+        resource_ids = _resources(3)
+        _enqueue(*resource_ids)
+
+        with mock.patch.object(
+            scheduler,
+            "_submit",
+            side_effect=[True, requests.ConnectionError("Prefect is down")],
+        ) as submit:
+            result = scheduler.dispatch(context)
+
+        assert submit.call_count == 2
+        assert result == {"submitted": 1, "dropped": 0, "queued": 2}
+        assert _queued() == set(resource_ids[1:])
+
+    @pytest.mark.ckan_config("ckanext.preflow.fingerprint_probe", "false")
+    @pytest.mark.ckan_config("ckanext.preflow.prefect_deployment_id", "deployment")
+    def test_failed_submissions_are_not_marked_as_failed(self, context):
+        resource_ids = _resources(2)
+        _enqueue(*resource_ids)
+
+        client = mock.Mock()
+        client.create_flow_run.side_effect = requests.ConnectionError("down")
+        with mock.patch("ckanext.preflow.logic.action.get_client", return_value=client):
+            result = scheduler.dispatch(context)
+
+        assert client.create_flow_run.call_count == 1
+        assert result["queued"] == 2
+        assert _queued() == set(resource_ids)
+        with pytest.raises(tk.ObjectNotFound):
+            tk.get_action("task_status_show")(
+                dict(context),
+                {
+                    "entity_id": resource_ids[0],
+                    "task_type": "preflow",
+                    "key": "pipeline",
+                },
+            )
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestQueue(object):
+    def test_enqueue_keeps_the_highest_priority(self):
+        (resource_id,) = _resources(1)
+        _enqueue(resource_id, priority=scheduler.PRIORITY_MANUAL)
+        _enqueue(resource_id)
+        scheduler.enqueue(resource_id, force=True)
+        model.Session.commit()
+
+        entry = model.Session.query(PreflowQueue).one()
+        assert entry.priority == scheduler.PRIORITY_MANUAL
+        assert entry.force
+
+    @pytest.mark.ckan_config("ckanext.preflow.stale_seconds", "3600")
+    def test_in_flight(self):
+        resource_ids = _resources(4)
+        organization_id = model.Resource.get(resource_ids[0]).package.owner_org
+        for i, resource_id in enumerate(resource_ids):
+            runs.record(resource_id, f"run-{i}")
+        model.Session.flush()
+        now = datetime.datetime.utcnow()
+        runs.update("run-1", "completed", now)
+        model.Session.query(PreflowRun).get("run-2").submitted_at = (
+            now - datetime.timedelta(hours=2)
+        )
+        model.Session.commit()
+
+        assert scheduler.in_flight() == {organization_id: 2}
@@ -0,0 +1,207 @@
+from unittest import mock
+
+import pytest
+
+import ckan.tests.factories as factories
+import ckan.tests.helpers as helpers
+
+
+def _update(resource: dict, **data) -> None:
+    helpers.call_action(
+        "preflow_status_update",
+        resource_id=resource["id"],
+        flow_run_id="flow-run",
+        **data,
+    )
+
+
+def _pipeline_url(resource: dict) -> str:
+    return f"/dataset/{resource['package_id']}/resource_pipeline/{resource['id']}"
+
+
+def _status_url(resource: dict) -> str:
+    return _pipeline_url(resource) + "/status"
+
+
+def _report_url(resource: dict) -> str:
+    return f"/dataset/{resource['package_id']}/{resource['id']}/validation_report"
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestConditionalRequests(object):
+    @pytest.mark.parametrize("url", [_pipeline_url, _report_url, _status_url])
+    def test_validators(self, app, resource, url):
+        _update(resource, state="completed")
+
+        response = app.get(url(resource))
+
+        assert response.headers["ETag"].startswith('W/"')
+        assert response.headers["Last-Modified"]
+        assert response.headers["Cache-Control"] == "private, no-cache"
+
+    @pytest.mark.parametrize("url", [_pipeline_url, _report_url, _status_url])
+    def test_not_modified(self, app, resource, url):
+        _update(resource, state="completed")
+        etag = app.get(url(resource)).headers["ETag"]
+
+        response = app.get(url(resource), headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+        assert not response.data
+        assert response.headers["ETag"] == etag
+
+    def test_if_modified_since(self, app, resource):
+        _update(resource, state="completed")
+        last_modified = app.get(_status_url(resource)).headers["Last-Modified"]
+
+        response = app.get(
+            _status_url(resource), headers={"If-Modified-Since": last_modified}
+        )
+
+        assert response.status_code == 304
+
+    @pytest.mark.parametrize("url", [_pipeline_url, _status_url])
+    def test_changes_invalidate_the_etag(self, app, resource, url):
+        _update(resource, state="running")
+        etag = app.get(url(resource)).headers["ETag"]
+        _update(resource, state="completed")
+
+        response = app.get(url(resource), headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    def test_pages_differ_by_query_string(self, app, resource):
+        _update(resource, state="completed")
+        etag = app.get(_pipeline_url(resource)).headers["ETag"]
+
+        response = app.get(
+            _pipeline_url(resource) + "?page=2", headers={"If-None-Match": etag}
+        )
+
+        assert response.status_code == 200
+
+    def test_pending_pipelines_are_always_rendered(self, app, resource):
+        _update(resource, state="pending")
+        response = app.get(_pipeline_url(resource))
+
+        assert "ETag" not in response.headers
+
+    def test_live_pages_are_always_rendered(self, app, resource):
+        _update(resource, state="completed")
+        etag = app.get(_pipeline_url(resource)).headers["ETag"]
+
+        client = mock.Mock()
+        client.get_flow_run.return_value = {
+            "id": "flow-run",
+            "state": {"type": "COMPLETED"},
+        }
+        with mock.patch("ckanext.preflow.logic.action.get_client", return_value=client):
+            response = app.get(
+                _pipeline_url(resource) + "?live=1", headers={"If-None-Match": etag}
+            )
+
+        assert response.status_code == 200
+
+    def test_status(self, app, resource):
+        _update(resource, state="running")
+
+        data = app.get(_status_url(resource)).json
+
+        assert data["resource_id"] == resource["id"]
+        assert data["state"] == "running"
+        assert data["flow_run_id"] == "flow-run"
+        assert data["last_updated"]
+
+    def test_status_of_unknown_resource(self, app):
+        app.get("/dataset/x/resource_pipeline/unknown/status", status=404)
+
+    def test_status_of_resource_never_submitted(self, app, resource):
+        data = app.get(_status_url(resource)).json
+
+        assert data["state"] is None
+        assert data["flow_run_id"] is None
+
+    def test_validators_of_other_resources_do_not_match(self, app, resource):
+        other = factories.Resource(package_id=resource["package_id"], format="")
+        _update(resource, state="completed")
+        _update(other, state="completed")
+        etag = app.get(_status_url(resource)).headers["ETag"]
+
+        response = app.get(_status_url(other), headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+
+    def test_private_datasets_are_not_disclosed(self, app):
+        organization = factories.Organization()
+        dataset = factories.Dataset(owner_org=organization["id"], private=True)
+        resource = factories.Resource(package_id=dataset["id"], format="")
+        _update(resource, state="completed")
+
+        app.get(_status_url(resource), status=404)
+        app.get(_pipeline_url(resource), status=404)
+
+
+def _report(errors: int) -> dict:
+    return {
+        "valid": False,
+        "tasks": [
+            {
+                "name": "data.csv",
+                "valid": False,
+                "errors": [
+                    {
+                        "type": "type-error" if i % 2 else "missing-cell",
+                        "rowNumber": i + 2,
+                        "message": f"Error {i}",
+                    }
+                    for i in range(errors)
+                ],
+            }
+        ],
+    }
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestValidationErrors(object):
+    def test_pages(self, app, resource):
+        _update(resource, state="completed", validation_report=_report(30))
+
+        data = app.get(
+            _report_url(resource) + "/errors?type=type-error&limit=10"
+        ).json
+        following = app.get(
+            _report_url(resource) + "/errors",
+            query_string={"type": "type-error", "limit": 10, "cursor": data["next"]},
+        ).json
+
+        assert [error["message"] for error in data["errors"]] == [
+            f"Error {i}" for i in range(1, 20, 2)
+        ]
+        assert [error["message"] for error in following["errors"]] == [
+            f"Error {i}" for i in range(21, 30, 2)
+        ]
+        assert not following["next"]
+
+    def test_invalid_limit(self, app, resource):
+        _update(resource, state="completed", validation_report=_report(3))
+
+        response = app.get(_report_url(resource) + "/errors?limit=0", status=400)
+
+        assert "limit" in response.json["error"]
+
+    def test_resource_without_report(self, app, resource):
+        _update(resource, state="running")
+
+        app.get(_report_url(resource) + "/errors", status=404)
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestEvents(object):
+    def test_finished_pipelines_are_not_streamed(self, app, resource):
+        _update(resource, state="completed")
+
+        app.get(_pipeline_url(resource) + "/events", status=204)
+
+    def test_unknown_resource(self, app):
+        app.get("/dataset/x/resource_pipeline/unknown/events", status=404)
@@ -0,0 +1,293 @@
+import datetime
+import hashlib
+import hmac
+import json
+import uuid
+
+import pytest
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+import ckan.tests.helpers as helpers
+
+from ckanext.preflow import runs, webhooks
+from ckanext.preflow.model import PreflowRun
+
+SECRET = "s3cret"
+
+
+def _signature(body: bytes, key: str = SECRET) -> str:
+    return "sha256=" + hmac.new(key.encode(), body, hashlib.sha256).hexdigest()
+
+
+class TestVerify(object):
+    @pytest.mark.ckan_config("ckanext.preflow.webhook_secret", SECRET)
+    def test_bearer_token(self, ckan_config):
+        assert webhooks.verify(b"{}", {"Authorization": f"Bearer {SECRET}"})
+        assert not webhooks.verify(b"{}", {"Authorization": "Bearer wrong"})
+        assert not webhooks.verify(b"{}", {"Authorization": SECRET})
+
+    @pytest.mark.ckan_config("ckanext.preflow.webhook_secret", SECRET)
+    def test_signature(self, ckan_config):
+        body = b'{"flow_run_id": "x"}'
+
+        assert webhooks.verify(body, {"X-Preflow-Signature": _signature(body)})
+        assert not webhooks.verify(
+            body + b" ", {"X-Preflow-Signature": _signature(body)}
+        )
+        assert not webhooks.verify(
+            body, {"X-Preflow-Signature": _signature(body, "other")}
+        )
+
+    @pytest.mark.ckan_config("ckanext.preflow.webhook_secret", SECRET)
+    def test_invalid_signature_is_not_saved_by_a_valid_token(self, ckan_config):
+        assert not webhooks.verify(
+            b"{}",
+            {
+                "X-Preflow-Signature": "sha256=00",
+                "Authorization": f"Bearer {SECRET}",
+            },
+        )
+
+    @pytest.mark.ckan_config("ckanext.preflow.webhook_secret", "")
+    def test_rejected_without_secret(self, ckan_config):
+        assert not webhooks.verify(b"{}", {"Authorization": "Bearer "})
+        assert not webhooks.verify(
+            b"{}", {"X-Preflow-Signature": _signature(b"{}", "")}
+        )
+
+
+class TestParse(object):
+    def test_prefect_event(self):
+        flow_run_id = str(uuid.uuid4())
+        events = webhooks.parse(
+            {
+                "event": "prefect.flow-run.Running",
+                "occurred": "2026-01-01T12:00:00+02:00",
+                "resource": {
+                    "prefect.resource.id": f"prefect.flow-run.{flow_run_id}",
+                    "prefect.state-type": "RUNNING",
+                    "prefect.state-name": "Running",
+                },
+            }
+        )
+
+        assert events == [
+            {
+                "flow_run_id": flow_run_id,
+                "state": "running",
+                "state_name": "Running",
+                "message": "",
+                "occurred": "2026-01-01T10:00:00",
+            }
+        ]
+
+    def test_plain_body(self):
+        flow_run_id = str(uuid.uuid4())
+        events = webhooks.parse(
+            [
+                {
+                    "flow_run_id": flow_run_id,
+                    "state": "Completed",
+                    "timestamp": "2026-01-01T12:00:00Z",
+                }
+            ]
+        )
+
+        assert events[0]["state"] == "completed"
+        assert events[0]["occurred"] == "2026-01-01T12:00:00"
+
+    def test_other_events_are_dropped(self):
+        assert webhooks.parse(
+            [
+                {"resource": {"prefect.resource.id": "prefect.deployment.x"}},
+                {
+                    "flow_run_id": "not-a-uuid",
+                    "state": "running",
+                    "timestamp": "2026-01-01",
+                },
+                {"flow_run_id": str(uuid.uuid4()), "state": "running"},
+                "not an event",
+            ]
+        ) == []
+
+
+def _event(flow_run_id: str, state: str, occurred: datetime.datetime) -> dict:
+    return {
+        "flow_run_id": flow_run_id,
+        "state": state,
+        "occurred": occurred.isoformat(),
+    }
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestWebhookAction(object):
+    def _pipeline(self, resource: dict) -> str:
+        flow_run_id = str(uuid.uuid4())
+        runs.record(resource["id"], flow_run_id, "deployment")
+        model.Session.commit()
+        helpers.call_action(
+            "preflow_status_update",
+            resource_id=resource["id"],
+            flow_run_id=flow_run_id,
+            state="pending",
+            clear=True,
+        )
+        return flow_run_id
+
+    def _state(self, resource: dict) -> str:
+        return helpers.call_action("preflow_status", resource_id=resource["id"])[
+            "state"
+        ]
+
+    def test_events_are_applied_in_order(self, resource):
+        flow_run_id = self._pipeline(resource)
+        now = datetime.datetime.utcnow()
+
+        result = helpers.call_action(
+            "preflow_webhook",
+            events=[
+                _event(flow_run_id, "completed", now + datetime.timedelta(seconds=2)),
+                _event(flow_run_id, "running", now + datetime.timedelta(seconds=1)),
+            ],
+        )
+
+        assert result == {"received": 2, "applied": 2, "ignored": 0}
+        assert self._state(resource) == "completed"
+        run = model.Session.query(PreflowRun).get(flow_run_id)
+        assert run.started_at is not None
+        assert run.finished_at is not None
+
+    def test_late_and_redelivered_events_are_ignored(self, resource):
+        flow_run_id = self._pipeline(resource)
+        now = datetime.datetime.utcnow()
+        running = _event(flow_run_id, "running", now + datetime.timedelta(seconds=2))
+        helpers.call_action("preflow_webhook", events=[running])
+
+        result = helpers.call_action(
+            "preflow_webhook",
+            events=[
+                running,
+                _event(flow_run_id, "scheduled", now + datetime.timedelta(seconds=1)),
+            ],
+        )
+
+        assert result == {"received": 2, "applied": 0, "ignored": 2}
+        assert self._state(resource) == "running"
+
+    def test_events_of_older_runs_are_ignored(self, resource):
+        old_flow_run_id = self._pipeline(resource)
+        self._pipeline(resource)
+
+        result = helpers.call_action(
+            "preflow_webhook",
+            events=[
+                _event(
+                    old_flow_run_id,
+                    "completed",
+                    datetime.datetime.utcnow() + datetime.timedelta(seconds=1),
+                )
+            ],
+        )
+
+        assert result["ignored"] == 1
+        assert self._state(resource) == "pending"
+
+    def test_invalid_events(self):
+        with pytest.raises(tk.ValidationError):
+            helpers.call_action(
+                "preflow_webhook", events=[{"flow_run_id": "x", "state": "running"}]
+            )
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+@pytest.mark.ckan_config("ckanext.preflow.webhook_secret", SECRET)
+class TestWebhookView(object):
+    def test_signed_request(self, app, resource):
+        flow_run_id = str(uuid.uuid4())
+        runs.record(resource["id"], flow_run_id, "deployment")
+        model.Session.commit()
+        helpers.call_action(
+            "preflow_status_update",
+            resource_id=resource["id"],
+            flow_run_id=flow_run_id,
+            state="pending",
+            clear=True,
+        )
+        body = json.dumps(
+            {
+                "flow_run_id": flow_run_id,
+                "state": "RUNNING",
+                "timestamp": (
+                    datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
+                ).isoformat(),
+            }
+        ).encode()
+
+        response = app.post(
+            "/preflow/webhook",
+            data=body,
+            headers={
+                "Content-Type": "application/json",
+                "X-Preflow-Signature": _signature(body),
+            },
+        )
+
+        assert response.json == {"received": 1, "applied": 1, "ignored": 0}
+
+    def test_bearer_token(self, app, resource):
+        flow_run_id = str(uuid.uuid4())
+        runs.record(resource["id"], flow_run_id, "deployment")
+        model.Session.commit()
+        helpers.call_action(
+            "preflow_status_update",
+            resource_id=resource["id"],
+            flow_run_id=flow_run_id,
+            state="pending",
+            clear=True,
+        )
+
+        response = app.post(
+            "/preflow/webhook",
+            json={
+                "event": "prefect.flow-run.Completed",
+                "occurred": (
+                    datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
+                ).isoformat()
+                + "Z",
+                "resource": {
+                    "prefect.resource.id": f"prefect.flow-run.{flow_run_id}",
+                    "prefect.state-type": "COMPLETED",
+                    "prefect.state-name": "Completed",
+                },
+            },
+            headers={"Authorization": f"Bearer {SECRET}"},
+        )
+
+        assert response.json == {"received": 1, "applied": 1, "ignored": 0}
+        status = helpers.call_action("preflow_status", resource_id=resource["id"])
+        assert status["state"] == "completed"
+
+    def test_invalid_body(self, app):
+        app.post(
+            "/preflow/webhook",
+            data=b"not json",
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {SECRET}",
+            },
+            status=400,
+        )
+
+    def test_invalid_signature(self, app):
+        response = app.post(
+            "/preflow/webhook",
+            data=b"[]",
+            headers={
+                "Content-Type": "application/json",
+                "X-Preflow-Signature": "sha256=00",
+            },
+            status=403,
+        )
+
+        assert "error" in response.json
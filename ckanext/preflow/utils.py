@@ -0,0 +1,84 @@
+import hashlib
+import json
+import logging
+
+import requests
+
+import ckan.plugins.toolkit as tk
+
+log = logging.getLogger(__name__)
+
+DEFAULT_FORMATS = ["csv", "tsv", "xls", "xlsx"]
+
+
+def get_supported_formats() -> list[str]:
+    """
+    Return the lowercase resource formats processed by the pipeline, from
+    ``ckanext.preflow.supported_formats`` (space or comma separated).
+    """
+    config_formats = tk.config.get("ckanext.preflow.supported_formats", "").strip()
+
+    # Use DEFAULT_FORMATS if config_formats is empty or invalid
+    if config_formats:
+        return [
+            fmt.strip().lower()
+            for fmt in config_formats.replace(",", " ").split(" ")
+            if fmt.strip()
+        ]
+    return DEFAULT_FORMATS
+
+
+def is_supported(resource_dict: dict) -> bool:
+    resource_format = resource_dict.get("format")
+    return bool(resource_format) and resource_format.lower() in get_supported_formats()
+
+
+def _probe(url: str) -> dict[str, str]:
+    """
+    Return the validators of a remote file from a HEAD request.
+    """
+    timeout = float(tk.config.get("ckanext.preflow.fingerprint_probe_timeout", 5))
+    try:
+        response = requests.head(url, timeout=timeout, allow_redirects=True)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        log.debug("Failed to probe %s: %s", url, e)
+        return {}
+    return {
+        header: response.headers[header]
+        for header in ("ETag", "Last-Modified", "Content-Length")
+        if response.headers.get(header)
+    }
+
+
+def resource_fingerprint(resource_dict: dict, probe: bool = True) -> str:
+    """
+    Fingerprint of the data of a resource: its ``hash`` when set, otherwise
+    the ``size`` and ``last_modified`` of uploads, or the validators returned
+    by a HEAD request on remote URLs (unless ``probe`` is False or
+    ``ckanext.preflow.fingerprint_probe`` is disabled).
+
+    An empty string is returned when the data cannot be identified.
+    """
+    url = resource_dict.get("url") or ""
+    parts = {"url": url}
+    if resource_dict.get("hash"):
+        parts["hash"] = resource_dict["hash"]
+    elif resource_dict.get("url_type") == "upload":
+        if not resource_dict.get("last_modified"):
+            return ""
+        parts["size"] = resource_dict.get("size")
+        parts["last_modified"] = resource_dict["last_modified"]
+    elif (
+        probe
+        and url.startswith(("http://", "https://"))
+        and tk.asbool(tk.config.get("ckanext.preflow.fingerprint_probe", True))
+    ):
+        validators = _probe(url)
+        if not validators.get("ETag") and not validators.get("Last-Modified"):
+            return ""
+        parts.update(validators)
+    else:
+        return ""
+
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
@@ -1,13 +1,34 @@
 import json
 import datetime
-from flask import Blueprint
+import hmac
+from typing import Any, Optional
+from flask import Blueprint, Response, jsonify, session, stream_with_context
 import ckan.plugins.toolkit as tk
+import ckan.lib.helpers as h
 from flask.views import MethodView
 import ckan.model as model
 import ckan.logic as logic
 from ckan.common import request
 
+from ckanext.preflow import events, metrics, scheduler, webhooks
+from ckanext.preflow.cache import IN_FLIGHT_STATES
+from ckanext.preflow.conditional import Validators
+from ckanext.preflow.model import PreflowLog
+
 preflow = Blueprint("preflow", __name__)
+preflow.after_app_request(metrics.log_request_timings)
+
+
+def _validators(context: dict[str, Any], resource_id: str) -> Validators:
+    """
+    Validators of a page of a resource pipeline, once the user is known to
+    be allowed to see it. Pages differ by user, language and query string.
+    """
+    try:
+        tk.check_access("preflow_status", context, {"resource_id": resource_id})
+    except (logic.NotFound, logic.NotAuthorized):
+        tk.abort(404, tk._("Resource not found"))
+    return Validators(resource_id, tk.c.user, h.lang(), request.full_path)
 
 
 class ResourcePipelineController(MethodView):
@@ -25,6 +46,23 @@ class ResourcePipelineController(MethodView):
         context = self._prepare(id, resource_id)
 
         try:
+            if scheduler.is_enabled():
+                # Manual runs go ahead of the automatic submissions
+                tk.get_action("preflow_enqueue")(
+                    context,
+                    {
+                        "resource_id": resource_id,
+                        "priority": scheduler.PRIORITY_MANUAL,
+                        "force": True,
+                    },
+                )
+                return tk.h.redirect_to(
+                    controller="preflow",
+                    action="resource_pipeline",
+                    id=id,
+                    resource_id=resource_id,
+                )
+
             resource_dict = tk.get_action("resource_show")(
                 context,
                 {
@@ -32,6 +70,8 @@ class ResourcePipelineController(MethodView):
                 },
             )
 
+            # Manual runs are wanted even if the data did not change
+            resource_dict["force"] = True
             tk.get_action("preflow_submit")(
                 context,
                 resource_dict,
@@ -52,6 +92,19 @@ class ResourcePipelineController(MethodView):
 
     def get(self, id: str, resource_id: str):
         context = self._prepare(id, resource_id)
+
+        # Pages refreshed from Prefect, counting down a pending submission
+        # or about to show a flash message are always rendered
+        live_requested = tk.asbool(request.args.get("live", False))
+        validators = _validators(context, resource_id)
+        conditional = not (
+            live_requested
+            or (validators.state or "").lower() == "pending"
+            or session.get("_flashes")
+        )
+        if conditional and validators.matches():
+            return validators.not_modified()
+
         try:
             pkg_dict = tk.get_action("package_show")(context, {"id": id})
             resource = tk.get_action("resource_show")(context, {"id": resource_id})
@@ -60,22 +113,47 @@ class ResourcePipelineController(MethodView):
 
         try:
             preflow_status = tk.get_action("preflow_status")(
-                context, {"resource_id": resource_id}
+                context,
+                {
+                    "resource_id": resource_id,
+                    "live": live_requested,
+                },
             )
         except logic.NotFound:
             preflow_status = {}
         except logic.NotAuthorized:
             tk.abort(403, tk._("Not authorized to see this page"))
 
+        logs_page = None
         if preflow_status:
-            value = preflow_status.get("value", "")
-            logs = None
-            try:
-                value_json = json.loads(value) if value else {}
-                logs = value_json.get("logs") or value_json.get("pipeline") or None
-            except Exception:
-                logs = None
-            preflow_status["logs"] = logs
+            page = h.get_page_number(request.args)
+            limit = tk.asint(tk.config.get("ckanext.preflow.logs_per_page", 100))
+            log_list = tk.get_action("preflow_log_list")(
+                context,
+                {
+                    "resource_id": resource_id,
+                    "offset": (page - 1) * limit,
+                    "limit": limit,
+                },
+            )
+            preflow_status["logs"] = log_list["logs"] or None
+
+            def pager_url(q: Any = None, page: Optional[int] = None) -> str:
+                return h.url_for(
+                    "preflow.resource_pipeline",
+                    id=id,
+                    resource_id=resource_id,
+                    page=page,
+                )
+
+            logs_page = h.Page(
+                collection=log_list["logs"],
+                page=page,
+                url=pager_url,
+                item_count=log_list["count"],
+                items_per_page=limit,
+                presliced_list=True,
+            )
 
             error_val = preflow_status.get("error")
             try:
@@ -97,15 +175,27 @@ class ResourcePipelineController(MethodView):
                 except (ValueError, TypeError):
                     pass
 
-        return tk.render(
+        # Follow the run live while it is in progress, unless an older page
+        # is shown
+        state = (preflow_status or {}).get("state", "").lower()
+        live = state in IN_FLIGHT_STATES
+        if logs_page and logs_page.page < (logs_page.last_page or 1):
+            live = False
+
+        page = tk.render(
             "resource_pipeline.html",
             extra_vars={
                 "status": preflow_status,
                 "pkg_dict": pkg_dict,
                 "resource": resource,
                 "waiting_remaining": waiting_remaining,
+                "logs_page": logs_page,
+                "live": live,
             },
         )
+        if not conditional:
+            return page
+        return validators.apply(page)
 
 
 class ValidationReportController(MethodView):
@@ -121,6 +211,10 @@ class ValidationReportController(MethodView):
 
     def get(self, id: str, resource_id: str):
         context = self._prepare(id, resource_id)
+        validators = _validators(context, resource_id)
+        if validators.matches():
+            return validators.not_modified()
+
         try:
             pkg_dict = tk.get_action("package_show")(context, {"id": id})
             resource = tk.get_action("resource_show")(context, {"id": resource_id})
@@ -143,21 +237,253 @@ class ValidationReportController(MethodView):
             error_dict = {}
             value_dict = {}
 
+        # Reports stored inline before the preflow_report table existed
         validation_report = {
             **error_dict.get("validation_report", {}),
             **value_dict.get("validation_report", {}),
         }
 
+        # First errors of each table, shown without loading the report
+        # component
+        validation_summary = value_dict.get("validation")
+        preview_errors = {}
+        preview_size = tk.asint(
+            tk.config.get("ckanext.preflow.report_preview_errors", 10)
+        )
+        if validation_summary and preview_size:
+            for index, task in enumerate(validation_summary.get("tasks", [])):
+                if not task.get("error_count"):
+                    continue
+                try:
+                    preview_errors[index] = tk.get_action(
+                        "preflow_validation_error_list"
+                    )(
+                        context,
+                        {
+                            "resource_id": resource_id,
+                            "flow_run_id": validation_summary.get("flow_run_id"),
+                            "task": index,
+                            "limit": preview_size,
+                        },
+                    )["errors"]
+                except logic.NotFound:
+                    break
 
-        return tk.render(
+        page = tk.render(
             "validation_report.html",
             extra_vars= {
+                "validation_summary": validation_summary,
+                "preview_errors": preview_errors,
+                "inline_errors": tk.asint(
+                    tk.config.get("ckanext.preflow.report_inline_errors", 1000)
+                ),
                 "validation_report": validation_report,
                 "resource_id": resource_id,
                 "pkg_dict": pkg_dict,
                 "resource": resource,
             },
         )
+        return validators.apply(page)
+
+
+def resource_pipeline_status(id: str, resource_id: str):
+    """
+    Stored state of a resource pipeline, for clients polling many
+    resources. Answers ``304 Not Modified`` to requests with a matching
+    ``If-None-Match`` or ``If-Modified-Since`` header, and never contacts
+    Prefect.
+    """
+    context = {
+        "model": model,
+        "session": model.Session,
+        "user": tk.c.user,
+        "auth_user_obj": tk.c.userobj,
+    }
+    try:
+        tk.check_access("preflow_status", context, {"resource_id": resource_id})
+    except (logic.NotFound, logic.NotAuthorized):
+        return jsonify({"error": tk._("Resource not found")}), 404
+
+    validators = Validators(resource_id)
+    if validators.matches():
+        return validators.not_modified()
+    if validators.etag is None:
+        return jsonify({"error": tk._("Resource not found")}), 404
+
+    try:
+        validation = json.loads(validators.value or "{}").get("validation")
+    except ValueError:
+        validation = None
+
+    return validators.apply(
+        jsonify(
+            {
+                "resource_id": resource_id,
+                "state": (validators.state or "").lower() or None,
+                "flow_run_id": validators.flow_run_id or None,
+                "last_updated": (
+                    validators.last_updated.isoformat()
+                    if validators.last_updated
+                    else None
+                ),
+                "validation": validation,
+            }
+        )
+    )
+
+
+def validation_report_data(id: str, resource_id: str):
+    """
+    JSON parts of a stored validation report, see
+    ``preflow_validation_report_show``.
+    """
+    context = {
+        "model": model,
+        "session": model.Session,
+        "user": tk.c.user,
+        "auth_user_obj": tk.c.userobj,
+    }
+    try:
+        data = tk.get_action("preflow_validation_report_show")(
+            context,
+            {
+                "resource_id": resource_id,
+                "flow_run_id": request.args.get("flow_run_id"),
+                "task": request.args.get("task"),
+                "page": request.args.get("page"),
+            },
+        )
+    except logic.NotFound:
+        return jsonify({"error": tk._("Validation report not found")}), 404
+    except logic.NotAuthorized:
+        return jsonify({"error": tk._("Not authorized to see this page")}), 403
+
+    return jsonify(data)
+
+
+def validation_report_errors(id: str, resource_id: str):
+    """
+    JSON pages of the errors of a stored validation report, see
+    ``preflow_validation_error_list``.
+    """
+    context = {
+        "model": model,
+        "session": model.Session,
+        "user": tk.c.user,
+        "auth_user_obj": tk.c.userobj,
+    }
+    data_dict = {
+        key: request.args.get(key)
+        for key in ("flow_run_id", "task", "row_from", "row_to", "cursor", "limit")
+    }
+    data_dict["resource_id"] = resource_id
+    data_dict["type"] = request.args.getlist("type")
+    try:
+        data = tk.get_action("preflow_validation_error_list")(context, data_dict)
+    except logic.NotFound:
+        return jsonify({"error": tk._("Validation report not found")}), 404
+    except logic.NotAuthorized:
+        return jsonify({"error": tk._("Not authorized to see this page")}), 403
+    except logic.ValidationError as e:
+        return jsonify({"error": e.error_dict}), 400
+
+    return jsonify(data)
+
+
+def resource_pipeline_events(id: str, resource_id: str):
+    """
+    Server-sent events stream of the new log entries and state changes of a
+    resource pipeline.
+    """
+    context = {
+        "model": model,
+        "session": model.Session,
+        "user": tk.c.user,
+        "auth_user_obj": tk.c.userobj,
+    }
+    try:
+        tk.check_access("preflow_status", context, {"resource_id": resource_id})
+    except logic.NotFound:
+        tk.abort(404, tk._("Resource not found"))
+    except logic.NotAuthorized:
+        tk.abort(403, tk._("Not authorized to see this page"))
+
+    # Browsers stop reconnecting on 204, once the run is no longer in progress
+    state = (
+        model.Session.query(model.TaskStatus.state)
+        .filter(model.TaskStatus.entity_id == resource_id)
+        .filter(model.TaskStatus.task_type == "preflow")
+        .filter(model.TaskStatus.key == "pipeline")
+        .scalar()
+    )
+    if (state or "").lower() not in IN_FLIGHT_STATES:
+        return Response(status=204)
+
+    # Send the entries missed by a reconnecting browser
+    backlog = []
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    if last_event_id.isdigit():
+        backlog = [
+            {"event": "log", **entry.as_dict()}
+            for entry in model.Session.query(PreflowLog)
+            .filter(PreflowLog.resource_id == resource_id)
+            .filter(PreflowLog.id > int(last_event_id))
+            .order_by(PreflowLog.id)
+        ]
+
+    # Do not hold a database connection for the lifetime of the stream
+    model.Session.remove()
+
+    return Response(
+        stream_with_context(events.stream(resource_id, backlog)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def preflow_metrics():
+    """
+    Prometheus metrics of this CKAN process, for sysadmins or requests with
+    the ``ckanext.preflow.metrics_token`` bearer token.
+    """
+    token = tk.config.get("ckanext.preflow.metrics_token", "")
+    authorization = request.headers.get("Authorization", "")
+    authorized = bool(token) and hmac.compare_digest(
+        authorization, f"Bearer {token}"
+    )
+    if not authorized and not (tk.c.userobj and tk.c.userobj.sysadmin):
+        return Response(tk._("Not authorized to see this page"), status=403)
+
+    return Response(
+        metrics.render(),
+        mimetype="text/plain; version=0.0.4",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+def prefect_webhook():
+    """
+    Receive the flow run state events of a Prefect automation, see
+    ``preflow_webhook``.
+    """
+    if not webhooks.verify(request.get_data(), request.headers):
+        return jsonify({"error": tk._("Invalid webhook signature")}), 403
+
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return jsonify({"error": tk._("Invalid JSON body")}), 400
+
+    site_user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
+    context = {
+        "model": model,
+        "session": model.Session,
+        "ignore_auth": True,
+        "user": site_user["name"],
+    }
+    result = tk.get_action("preflow_webhook")(
+        context, {"events": webhooks.parse(payload)}
+    )
+    return jsonify(result)
 
 
 preflow.add_url_rule(
@@ -165,8 +491,39 @@ preflow.add_url_rule(
     view_func=ResourcePipelineController.as_view(str("resource_pipeline")),
 )
 
+preflow.add_url_rule(
+    "/dataset/<id>/resource_pipeline/<resource_id>/events",
+    view_func=resource_pipeline_events,
+)
+
+preflow.add_url_rule(
+    "/dataset/<id>/resource_pipeline/<resource_id>/status",
+    view_func=resource_pipeline_status,
+)
+
 
 preflow.add_url_rule(
     "/dataset/<id>/<resource_id>/validation_report",
     view_func=ValidationReportController.as_view(str("validation_report")),
 )
+
+preflow.add_url_rule(
+    "/dataset/<id>/<resource_id>/validation_report/data",
+    view_func=validation_report_data,
+)
+
+preflow.add_url_rule(
+    "/dataset/<id>/<resource_id>/validation_report/errors",
+    view_func=validation_report_errors,
+)
+
+preflow.add_url_rule(
+    "/preflow/webhook",
+    view_func=prefect_webhook,
+    methods=["POST"],
+)
+
+preflow.add_url_rule(
+    "/preflow/metrics",
+    view_func=preflow_metrics,
+)
@@ -0,0 +1,106 @@
+from typing import Any, Optional
+
+import datetime
+import hashlib
+import hmac
+import uuid
+
+import ckan.plugins.toolkit as tk
+
+FLOW_RUN_RESOURCE_PREFIX = "prefect.flow-run."
+
+
+def secret() -> str:
+    return tk.config.get("ckanext.preflow.webhook_secret", "")
+
+
+def verify(body: bytes, headers: Any) -> bool:
+    """
+    Check that a webhook request was sent by Prefect, either with the
+    ``ckanext.preflow.webhook_secret`` as a bearer token or with an
+    ``X-Preflow-Signature: sha256=<hex>`` HMAC of the body made with it.
+
+    Requests are always rejected when no secret is configured.
+    """
+    key = secret()
+    if not key:
+        return False
+
+    signature = headers.get("X-Preflow-Signature", "")
+    if signature:
+        expected = hmac.new(key.encode(), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(signature.split("=", 1)[-1], expected)
+
+    authorization = headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        return hmac.compare_digest(authorization[len("Bearer "):], key)
+    return False
+
+
+def parse_datetime(value: Optional[str]) -> Optional[datetime.datetime]:
+    """
+    Parse an ISO 8601 timestamp into a naive UTC datetime, the form stored by
+    CKAN, or return None.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _flow_run_event(payload: dict[str, Any]) -> Optional[dict[str, Any]]:
+    """
+    Normalise a Prefect ``prefect.flow-run.*`` event, as sent by an
+    automation, or a plain ``{"flow_run_id", "state", "timestamp"}`` body.
+    """
+    resource = payload.get("resource")
+    if isinstance(resource, dict):
+        resource_id = resource.get("prefect.resource.id", "")
+        if not resource_id.startswith(FLOW_RUN_RESOURCE_PREFIX):
+            return None
+        event = {
+            "flow_run_id": resource_id[len(FLOW_RUN_RESOURCE_PREFIX):],
+            "state": resource.get("prefect.state-type", ""),
+            "state_name": resource.get("prefect.state-name", ""),
+            "message": resource.get("prefect.state-message", ""),
+            "occurred": payload.get("occurred"),
+        }
+    else:
+        event = {
+            "flow_run_id": payload.get("flow_run_id", ""),
+            "state": payload.get("state", ""),
+            "state_name": payload.get("state_name", ""),
+            "message": payload.get("message", ""),
+            "occurred": payload.get("timestamp") or payload.get("occurred"),
+        }
+
+    try:
+        event["flow_run_id"] = str(uuid.UUID(str(event["flow_run_id"])))
+    except ValueError:
+        return None
+    occurred = parse_datetime(event["occurred"])
+    if not event["state"] or occurred is None:
+        return None
+    event["state"] = event["state"].lower()
+    event["occurred"] = occurred.isoformat()
+    return event
+
+
+def parse(payload: Any) -> list[dict[str, Any]]:
+    """
+    Return the flow run state events of a webhook body, a single event or a
+    list of events. Events that are not about flow run states are dropped.
+    """
+    payloads = payload if isinstance(payload, list) else [payload]
+    return [
+        event
+        for event in (
+            _flow_run_event(item) for item in payloads if isinstance(item, dict)
+        )
+        if event
+    ]